@@ -202,7 +202,8 @@ def manage_qa_pair(pair_id):
             if not data:
                 return jsonify({'error': 'No data provided'}), 400
             
-            # Update fields
+            # Update fields; the bot needs the old question to drop a renamed pair
+            previous_question = qa_pair.question
             if 'question' in data:
                 qa_pair.question = data['question'].strip()
             if 'answer' in data:
@@ -220,7 +221,8 @@ def manage_qa_pair(pair_id):
                 try:
                     redis_client.publish('bot_commands', json.dumps({
                         'type': 'qa_pair_updated',
-                        'qa_pair': qa_pair.to_dict()
+                        'qa_pair': qa_pair.to_dict(),
+                        'previous_question': previous_question
                     }))
                 except Exception as e:
                     print(f"Failed to notify bot of Q&A pair update: {e}")
@@ -0,0 +1,103 @@
+"""
+Benchmark for MinHash/LSH near-duplicate removal from the Q&A store.
+
+Fills fresh stores with Zipf-distributed synthetic questions (as in
+bench_qa_store.py) where a fraction are noisy copies of earlier ones:
+different case and punctuation, chat shorthand, or one word dropped. Runs
+the dedup pass at several corpus sizes to show the time grows near-linearly,
+and reports how many injected copies were removed and how many distinct
+questions were lost.
+
+Usage:
+    python benchmarks/bench_dedup.py [--pairs 1000000] [--dup-rate 0.2]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bench_qa_store import make_sentence, make_vocabulary, rss_mib
+from bot_core.dedup import dedupe_store, jaccard, shingles
+from bot_core.qa_store import QAStore
+
+SHORTHAND = {'you': 'u', 'are': 'r', 'your': 'ur', 'please': 'pls', 'thanks': 'thx'}
+
+
+def make_variant(question, rng):
+    """A noisy copy: case, punctuation, shorthand or a dropped word."""
+    words = question.rstrip('?').split()
+    kind = rng.randrange(4)
+    if kind == 0:
+        return question.capitalize().replace('?', ' ?!')
+    if kind == 1:
+        return ' '.join(SHORTHAND.get(word, word) for word in words) + '?'
+    if kind == 2 and len(words) > 6:
+        del words[rng.randrange(len(words))]
+        return ' '.join(words) + '?'
+    return question.upper().rstrip('?') + '...'
+
+
+def build_store(path, pairs, dup_rate, vocab, cum_weights, rng):
+    """Returns the store, each injected copy's source question and how many copies pass the threshold."""
+    store = QAStore(path)
+    originals, copies, expected = [], {}, 0
+    rows = {}
+    while len(rows) < pairs:
+        if originals and rng.random() < dup_rate:
+            source = rng.choice(originals)
+            question = make_variant(source, rng)
+            if question in rows:
+                continue
+            copies[question] = source
+            expected += jaccard(shingles(source), shingles(question)) >= 0.8
+        else:
+            question = make_sentence(vocab, cum_weights, rng)
+            if question in rows:
+                continue
+            originals.append(question)
+        rows[question] = f"answer {len(rows)}"
+    store.update_many(rows.items())
+    return store, copies, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pairs', type=int, default=1_000_000, help='Q&A pairs in the largest corpus')
+    parser.add_argument('--dup-rate', type=float, default=0.2, help='fraction of pairs that are noisy copies')
+    parser.add_argument('--threshold', type=float, default=0.8, help='Jaccard similarity threshold')
+    parser.add_argument('--vocab', type=int, default=200_000, help='distinct words')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(args.vocab, rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    workdir = tempfile.mkdtemp(prefix='dedup_bench_')
+    for pairs in (args.pairs // 16, args.pairs // 4, args.pairs):
+        path = os.path.join(workdir, f'qa_{pairs}.db')
+        store, copies, expected = build_store(path, pairs, args.dup_rate, vocab, cum_weights, rng)
+        before = rss_mib()
+        stats = dedupe_store(store, args.threshold)
+        # A copy is collapsed when it and its source no longer both survive; a source is lost when
+        # neither it nor any copy of it survives, which dropping only duplicates never causes
+        collapsed = sum(1 for copy, source in copies.items() if copy not in store or source not in store)
+        survivors = {source for copy, source in copies.items() if copy in store}
+        lost = sum(1 for source in set(copies.values()) if source not in store and source not in survivors)
+        print(f"{pairs} pairs: {stats['seconds']:.1f}s ({stats['seconds'] / pairs * 1e6:.1f} us/pair), "
+              f"{stats['candidates']} candidates, {stats['verified']} verified, "
+              f"bands {stats['bands']}x{stats['rows_per_band']}")
+        print(f"  removed {stats['removed']} ({stats['removed'] / pairs:.1%}): collapsed {collapsed} of "
+              f"{len(copies)} injected copies ({expected} above the threshold), lost {lost} questions; "
+              f"peak RSS grew {rss_mib() - before:.0f} MiB")
+        store.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
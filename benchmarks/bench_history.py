@@ -0,0 +1,72 @@
+"""
+Benchmark for history.get_relevant_history.
+
+Measures per-call latency of relevant-history selection for a single
+context holding 1k, 10k and 100k messages. Feature flags are extracted up
+front, the same way history.append_message does when messages arrive.
+
+Usage:
+    python benchmarks/bench_history.py [--window 20] [--calls 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import history
+
+SAMPLE_MESSAGES = [
+    "hey yumi how are you?",
+    "i'm at work right now, super busy",
+    "lol that's funny",
+    "my favorite food is ramen",
+    "anyway what should we do later",
+    "ok",
+    "do you remember what we talked about yesterday",
+    "i love rainy days",
+    "sure thing~",
+    "nice!!",
+]
+
+
+def build_history(size):
+    queue = deque(maxlen=history.TOTAL_HISTORY_LENGTH)
+    for i in range(size):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        msg = history.Message(role, random.choice(SAMPLE_MESSAGES), 1735689600.0)
+        history.message_features(msg)
+        queue.append(msg)
+    return queue
+
+
+def bench(size, window, calls):
+    queue = build_history(size)
+    history.get_relevant_history(queue, window_size=window)  # warm up
+    start = time.perf_counter()
+    for _ in range(calls):
+        selected = history.get_relevant_history(queue, window_size=window)
+    elapsed = (time.perf_counter() - start) / calls
+    return elapsed, len(selected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--window', type=int, default=20, help='recent-context window size')
+    parser.add_argument('--calls', type=int, default=20, help='calls averaged per size')
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'messages':>10} {'ms/call':>10} {'selected':>10}")
+    for size in (1_000, 10_000, 100_000):
+        elapsed, selected = bench(size, args.window, args.calls)
+        print(f"{size:>10} {elapsed * 1000:>10.3f} {selected:>10}")
+
+
+if __name__ == '__main__':
+    main()
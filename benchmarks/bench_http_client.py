@@ -0,0 +1,80 @@
+"""
+Benchmark for the pooled HTTP client used to talk to Ollama.
+
+Starts a local stub of Ollama's /api/generate endpoint and times sequential
+requests made the old way (a new aiohttp.ClientSession, and so a new TCP
+connection, per request) against the shared keep-alive session from
+bot_core.http_client. The stub answers instantly, so the difference is the
+per-request client overhead.
+
+Usage:
+    python benchmarks/bench_http_client.py [--requests 500]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import http_client
+
+PAYLOAD = {"model": "stub", "prompt": "hello", "stream": False}
+
+
+async def generate(request):
+    await request.json()
+    return web.json_response({"response": "hi there, nice to meet you", "done": True})
+
+
+async def per_request_sessions(url, count):
+    for _ in range(count):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=PAYLOAD) as resp:
+                await resp.json()
+
+
+async def shared_session(url, count):
+    for _ in range(count):
+        async with http_client.get_session(http_client.BACKEND_OLLAMA).post(url, json=PAYLOAD) as resp:
+            await resp.json()
+
+
+async def run(count):
+    app = web.Application()
+    app.router.add_post('/api/generate', generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/api/generate"
+
+    print(f"{'client':>22} {'ms/request':>12}")
+    try:
+        for name, fn in (('session per request', per_request_sessions), ('pooled keep-alive', shared_session)):
+            await fn(url, 10)  # warm up
+            start = time.perf_counter()
+            await fn(url, count)
+            elapsed = (time.perf_counter() - start) / count
+            print(f"{name:>22} {elapsed * 1000:>12.3f}")
+    finally:
+        await http_client.HTTP_CLIENTS.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500, help='sequential requests per client')
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark for KV context reuse across turns of one conversation.
+
+Runs a multi-turn conversation through persona.generate_response against a
+local stub of Ollama's /api/generate. The stub charges a prefill delay for
+every prompt token it has to read (tokens passed back as ``context`` are
+treated as already cached, as on a warm Ollama server) and returns a growing
+context. Reports the prompt tokens prefilled per turn and the simulated
+time to first token with sessions off (full prompt every turn) and on.
+
+Usage:
+    python benchmarks/bench_kv_sessions.py [--turns 30] [--prefill-us 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import kv_sessions, llm, persona, response_cache
+from bot_core.backends import Backend, BackendPool
+from bot_core.history import ConversationHistory, Message, normalize_message
+from bot_core.http_client import HTTP_CLIENTS
+from bot_core.prompt import estimate_tokens
+
+FACTS = {'name': 'Sam', 'location': 'Lisbon', 'interests': 'anime, climbing, cooking'}
+QA_PAIRS = {f"example question {i}?": f"example answer number {i}, with some detail" for i in range(5)}
+
+
+class PrefillStub:
+    def __init__(self, prefill_seconds_per_token):
+        self.per_token = prefill_seconds_per_token
+        self.prefilled = []
+
+    async def generate(self, request):
+        body = await request.json()
+        tokens = estimate_tokens(body['prompt'])
+        self.prefilled.append(tokens)
+        await asyncio.sleep(tokens * self.per_token)
+        reply = f"That is so interesting, tell me more about part {len(self.prefilled)}!"
+        context = list(body.get('context') or []) + [0] * (tokens + estimate_tokens(reply))
+        return web.json_response({'response': reply, 'context': context, 'done': True})
+
+
+async def conversation(stub, turns):
+    convo = ConversationHistory()
+    ttft = []
+    for turn in range(turns):
+        text = f"here is message {turn} about my day, the weather and what I ate for lunch"
+        convo.append(normalize_message(Message('user', text)))
+        start = time.perf_counter()
+        reply = await persona.generate_response(text, qa_pairs=QA_PAIRS, user_facts=FACTS,
+                                                convo_history=convo, session_key='bench')
+        ttft.append(time.perf_counter() - start)
+        convo.append(normalize_message(Message('assistant', reply)))
+    return ttft
+
+
+async def run(args):
+    response_cache.RESPONSE_CACHE_ENABLED = False
+    print(f"{'sessions':>9} {'avg prefill tok':>16} {'last turn tok':>14} {'avg ttft ms':>12}")
+    for enabled in (False, True):
+        kv_sessions.KV_SESSIONS_ENABLED = enabled
+        stub = PrefillStub(args.prefill_us / 1e6)
+        app = web.Application()
+        app.router.add_post('/api/generate', stub.generate)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        llm.OLLAMA_POOL = BackendPool([Backend(f'http://127.0.0.1:{port}')])
+        try:
+            ttft = await conversation(stub, args.turns)
+        finally:
+            await HTTP_CLIENTS.close()
+            await runner.cleanup()
+        print(f"{'on' if enabled else 'off':>9} {sum(stub.prefilled) / len(stub.prefilled):>16.0f} "
+              f"{stub.prefilled[-1]:>14} {sum(ttft) / len(ttft) * 1000:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--turns', type=int, default=30, help='conversation turns')
+    parser.add_argument('--prefill-us', type=float, default=200, help='simulated prefill time per prompt token')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for the memory cost of in-memory conversation messages.
+
+Compares bytes per stored message for the old representation (a dict with
+role, content, ISO timestamp string and feature flags, as on_message used to
+build it) against history.Message records. Memory is measured with
+tracemalloc and includes the message text, so the difference is the
+per-message overhead saved.
+
+Usage:
+    python benchmarks/bench_message_memory.py [--messages 100000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import history
+
+
+def build_dicts(count):
+    queue = deque()
+    for i in range(count):
+        content = f"message number {i} about ramen and rainy days"
+        queue.append({
+            'role': 'user' if i % 2 == 0 else 'assistant',
+            'content': content,
+            'timestamp': datetime.now().isoformat(),
+            'features': history.extract_features(content),
+        })
+    return queue
+
+
+def build_records(count):
+    queue = deque()
+    for i in range(count):
+        content = f"message number {i} about ramen and rainy days"
+        queue.append(history.Message(
+            'user' if i % 2 == 0 else 'assistant',
+            content,
+            time.time(),
+            history.extract_features(content),
+        ))
+    return queue
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    queue = builder(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del queue
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=100_000, help='messages to build per representation')
+    args = parser.parse_args()
+
+    text_bytes = sys.getsizeof("message number 50000 about ramen and rainy days")
+    print(f"{'representation':>16} {'bytes/msg':>10} {'overhead':>10}")
+    results = {}
+    for name, builder in (('dict', build_dicts), ('Message', build_records)):
+        results[name] = measure(builder, args.messages)
+        print(f"{name:>16} {results[name]:>10.1f} {results[name] - text_bytes:>10.1f}")
+    print(f"saved {1 - results['Message'] / results['dict']:.0%} per stored message")
+
+
+if __name__ == '__main__':
+    main()
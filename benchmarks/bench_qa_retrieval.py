@@ -0,0 +1,99 @@
+"""
+Benchmark for per-message Q&A example retrieval.
+
+Fills a fresh store with Zipf-distributed synthetic questions (see
+bench_qa_store.py), then times relevant_pairs() the way replies use it: once
+through retrieve_pairs() on the event loop, as persona does, and once
+directly. Reports latency percentiles, Python heap and resident memory, and
+for comparison the Python heap a dict of the same pairs takes, which is what
+the bot used to hold to offer the model its first five pairs.
+
+Usage:
+    python benchmarks/bench_qa_retrieval.py [--pairs 1000000] [--queries 2000]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bench_qa_store import current_rss_mib, make_sentence, make_vocabulary, percentile
+from bot_core.qa_store import QAStore, relevant_pairs, retrieve_pairs
+
+
+def report(name, latencies):
+    print(f"{name}: p50 {percentile(latencies, 0.5):.2f} ms, p95 {percentile(latencies, 0.95):.2f} ms, "
+          f"max {max(latencies):.2f} ms")
+
+
+async def time_on_loop(store, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await retrieve_pairs(store, query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pairs', type=int, default=1_000_000, help='Q&A pairs to store')
+    parser.add_argument('--queries', type=int, default=2000, help='messages to time')
+    parser.add_argument('--k', type=int, default=5, help='examples per message')
+    parser.add_argument('--vocab', type=int, default=200_000, help='distinct words')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(args.vocab, rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    questions = set()
+    while len(questions) < args.pairs:
+        questions.add(make_sentence(vocab, cum_weights, rng))
+    pairs = [(question, f"answer {n}") for n, question in enumerate(sorted(questions))]
+    del questions
+    queries = [make_sentence(vocab, cum_weights, rng) for _ in range(args.queries)]
+
+    # What the old in-memory dataset held: the dict plus its key and value strings
+    dict_mib = (sys.getsizeof(dict(pairs)) + sum(sys.getsizeof(q) + sys.getsizeof(a) for q, a in pairs)) / 2**20
+
+    path = os.path.join(tempfile.mkdtemp(prefix='qa_retrieval_bench_'), 'qa.db')
+    store = QAStore(path)
+    start = time.perf_counter()
+    store.update_many(pairs)
+    print(f"stored {len(store)} pairs in {time.perf_counter() - start:.1f}s, "
+          f"db {os.path.getsize(path) / 2**20:.0f} MiB")
+    del pairs
+    store.close()
+
+    store = QAStore(path)  # A fresh connection, as at bot startup
+    rss = current_rss_mib()
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += bool(relevant_pairs(store, query, args.k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    report(f"relevant_pairs top-{args.k}", latencies)
+    print(f"  {hits / len(queries):.0%} of messages got examples")
+    report("retrieve_pairs on the event loop", asyncio.run(time_on_loop(store, queries, args.k)))
+
+    # Heap measured in a separate pass: tracing slows every allocation down
+    tracemalloc.start()
+    for query in queries[:200]:
+        relevant_pairs(store, query, args.k)
+    heap_peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    print(f"python heap peak while querying {heap_peak:.1f} MiB (a dict of the pairs held {dict_mib:.0f} MiB); "
+          f"resident memory grew {current_rss_mib() - rss:.0f} MiB (mapped pages included)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark for the on-disk SQLite/FTS5 Q&A store.
+
+Writes synthetic chat-style questions whose words follow a Zipf distribution
+(a few very common words, a long tail of rare ones) to a JSON file, imports it into a fresh store with the streaming parser, then
+reports import time, file size, resident memory and query latency for FTS5
+retrieval and exact lookups. For comparison it times json.load of the file,
+which is what startup used to do.
+
+Usage:
+    python benchmarks/bench_qa_store.py [--pairs 1000000] [--queries 2000]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core.qa_store import QAStore
+
+COMMON = ("you do what how are is the a to i my like me your can have it that for of in "
+          "about think would know really just favorite").split()
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    return COMMON + sorted(words)
+
+
+def make_sentence(vocab, cum_weights, rng):
+    return ' '.join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(4, 12))) + '?'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def rss_mib():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pairs', type=int, default=1_000_000, help='Q&A pairs to store')
+    parser.add_argument('--queries', type=int, default=2000, help='queries to time')
+    parser.add_argument('--vocab', type=int, default=200_000, help='distinct words')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(args.vocab, rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    workdir = tempfile.mkdtemp(prefix='qa_store_bench_')
+    json_path = os.path.join(workdir, 'chatbot_dataset.json')
+    print(f"Generating {args.pairs} pairs into {json_path}...")
+    pairs = {}
+    while len(pairs) < args.pairs:
+        pairs[make_sentence(vocab, cum_weights, rng)] = f"answer {len(pairs)}"
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(pairs, f, ensure_ascii=False, indent=2)
+    sample = rng.sample(list(pairs), min(args.queries, len(pairs)))
+    del pairs
+    queries = [make_sentence(vocab, cum_weights, rng) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        loaded = json.load(f)
+    print(f"old json.load at startup: {time.perf_counter() - start:.1f}s, {len(loaded)} pairs")
+    del loaded
+
+    store = QAStore(os.path.join(workdir, 'qa.db'))
+    before = rss_mib()
+    start = time.perf_counter()
+    written = store.import_json(json_path)
+    print(f"one-time import: {written} pairs in {time.perf_counter() - start:.1f}s, "
+          f"db {os.path.getsize(store.path) / 2**20:.0f} MiB (peak RSS grew {rss_mib() - before:.0f} MiB)")
+    store.close()
+
+    # A fresh connection, as at bot startup
+    store = QAStore(store.path)
+    rss = current_rss_mib()
+    start = time.perf_counter()
+    count = len(store)
+    print(f"open + count: {(time.perf_counter() - start) * 1000:.0f} ms for {count} pairs")
+
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        results = store.search(query, 5)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += bool(results)
+    print(f"fts5 top-5: p50 {percentile(latencies, 0.5):.2f} ms, p95 {percentile(latencies, 0.95):.2f} ms, "
+          f"max {max(latencies):.2f} ms, {hits / len(queries):.0%} of queries matched")
+
+    lookups = []
+    for question in sample:
+        start = time.perf_counter()
+        store[question]
+        lookups.append((time.perf_counter() - start) * 1000)
+    print(f"exact lookup: p50 {percentile(lookups, 0.5):.3f} ms, p95 {percentile(lookups, 0.95):.3f} ms")
+    print(f"resident memory grew {current_rss_mib() - rss:.0f} MiB while querying (mapped pages included)")
+
+
+if __name__ == '__main__':
+    main()
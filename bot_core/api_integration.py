@@ -13,6 +13,8 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+from .qa_store import QA_STORE
+
 logger = logging.getLogger(__name__)
 
 class BotAPIIntegration:
@@ -312,13 +314,26 @@ class BotAPIIntegration:
         """Handle new Q&A pair addition"""
         qa_pair = data.get('qa_pair', {})
         
-        # Reload Q&A data in bot if needed
+        # Make the pair retrievable for prompts right away
+        if qa_pair.get('question') and qa_pair.get('answer'):
+            await asyncio.get_running_loop().run_in_executor(
+                None, QA_STORE.add, qa_pair['question'], qa_pair['answer'], True)
         self.publish_bot_status('qa_pair_added', question=qa_pair.get('question'))
     
     async def _handle_qa_pair_updated(self, data: Dict[str, Any]):
         """Handle Q&A pair update"""
         qa_pair = data.get('qa_pair', {})
+        question, answer = qa_pair.get('question'), qa_pair.get('answer')
+        previous = data.get('previous_question')
+        
+        def apply():
+            # A renamed question must not leave its old row retrievable
+            if previous and previous != question:
+                QA_STORE.remove(previous)
+            if question and answer:
+                QA_STORE.add(question, answer, curated=True)
         
+        await asyncio.get_running_loop().run_in_executor(None, apply)
         self.publish_bot_status('qa_pair_updated', id=qa_pair.get('id'))
     
     async def _handle_qa_pair_deleted(self, data: Dict[str, Any]):
@@ -326,6 +341,8 @@ class BotAPIIntegration:
         pair_id = data.get('pair_id')
         question = data.get('question')
         
+        if question:
+            await asyncio.get_running_loop().run_in_executor(None, QA_STORE.remove, question)
         self.publish_bot_status('qa_pair_deleted', id=pair_id, question=question)
     
     async def _handle_persona_created(self, data: Dict[str, Any]):
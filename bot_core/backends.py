@@ -0,0 +1,300 @@
+"""
+Pool of Ollama servers with least-outstanding-requests routing.
+
+Backends leave rotation through a per-backend circuit breaker or a failed health probe.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, FrozenSet, List, Optional
+
+import aiohttp
+
+from .http_client import get_session, BACKEND_OLLAMA
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://10.0.0.28:11434/api/generate")
+OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+BACKEND_EJECT_AFTER = int(os.getenv('YUMI_BACKEND_EJECT_AFTER', '3'))  # Consecutive failures
+BACKEND_EJECT_SECONDS = float(os.getenv('YUMI_BACKEND_EJECT_SECONDS', '30'))  # First breaker cool-down
+BACKEND_EJECT_MAX_SECONDS = float(os.getenv('YUMI_BACKEND_EJECT_MAX_SECONDS', '240'))  # Doubling stops here
+BACKEND_SLOW_START = float(os.getenv('YUMI_BACKEND_SLOW_START', '30'))  # seconds to full share
+BACKEND_PROBE_INTERVAL = float(os.getenv('YUMI_BACKEND_PROBE_INTERVAL', '10'))  # seconds
+BACKEND_PROBE_TIMEOUT = float(os.getenv('YUMI_BACKEND_PROBE_TIMEOUT', '5'))  # seconds
+# Extra outstanding requests tolerated to keep a conversation on the backend holding its KV cache
+BACKEND_AFFINITY_SLACK = int(os.getenv('YUMI_BACKEND_AFFINITY_SLACK', '2'))
+
+# Errors that say something about the backend rather than the request (but see is_backend_failure)
+BACKEND_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+_MIN_SLOW_START_SHARE = 0.1
+_LATENCY_SAMPLES = 200
+_LATENCY_MIN_SAMPLES = 10  # Percentiles below this many samples are not trusted
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class BackendUnavailable(Exception):
+    """No backend can take a request right now (all breakers open or probes failing)."""
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """Whether an error counts against the backend: connection errors, timeouts and 5xx, not 4xx."""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500  # A 4xx rejects this request; the server itself is fine
+    return isinstance(exc, BACKEND_ERRORS)
+
+class LatencyTracker:
+    """Recent request latencies (seconds) with percentile lookups."""
+
+    def __init__(self, maxlen: int = _LATENCY_SAMPLES):
+        self.samples: Deque[float] = deque(maxlen=maxlen)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """The ``fraction`` percentile (0-1), or None until enough samples exist."""
+        if len(self.samples) < _LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def _base_url(url: str) -> str:
+    """Server root of an Ollama URL: "http://host:11434/api/generate" -> "http://host:11434"."""
+    url = url.strip().rstrip('/')
+    for suffix in ('/api/generate', '/api'):
+        if url.endswith(suffix):
+            url = url[:-len(suffix)]
+    return url
+
+class Backend:
+    """One Ollama server and its routing state.
+
+    Args:
+        url: Server root (or any Ollama API URL on it)
+        models: Models the server serves; empty means any model
+    """
+
+    def __init__(self, url: str, models=()):
+        self.url = _base_url(url)
+        self.generate_url = self.url + '/api/generate'
+        self.embed_url = self.url + '/api/embed'
+        self.models: FrozenSet[str] = frozenset(models)
+        self.outstanding = 0
+        self.healthy = True  # Last active probe result
+        self.failures = 0  # Consecutive request failures
+        self.state = CLOSED
+        self.ejected_until = 0.0  # While open, no requests before this time
+        self.cooldown = BACKEND_EJECT_SECONDS
+        self.trial_inflight = False  # Half-open: the single trial request is running
+        self.recovered_at = float('-inf')  # Start of the current slow-start window
+        self.latency = LatencyTracker()
+        self.stats = {'requests': 0, 'errors': 0, 'ejections': 0, 'probe_failures': 0}
+
+    def serves(self, model: Optional[str]) -> bool:
+        return not self.models or model is None or model in self.models
+
+    def available(self, now: float) -> bool:
+        """Whether the breaker and the last probe let a request through now."""
+        if not self.healthy:
+            return False
+        if self.state == CLOSED:
+            return True
+        # Open with its cool-down over, or half-open: one trial request at a time
+        return now >= self.ejected_until and not self.trial_inflight
+
+    def load(self, now: float) -> float:
+        """Outstanding requests, scaled up while the backend is slow-starting."""
+        share = 1.0
+        if BACKEND_SLOW_START > 0 and now - self.recovered_at < BACKEND_SLOW_START:
+            share = max(_MIN_SLOW_START_SHARE, (now - self.recovered_at) / BACKEND_SLOW_START)
+        return (self.outstanding + 1) / share
+
+    def begin(self) -> bool:
+        """Mark a request as started; returns True if it is the breaker's half-open trial."""
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.trial_inflight = True
+            return True
+        return False
+
+    def record_success(self, now: float, trial: bool = False) -> None:
+        self.failures = 0
+        if trial:
+            print(f"[Backends] {self.url} recovered; closing its circuit breaker")
+            self.state = CLOSED
+            self.trial_inflight = False
+            self.cooldown = BACKEND_EJECT_SECONDS
+            self.recovered_at = now
+
+    def record_failure(self, now: float, trial: bool = False) -> None:
+        """Count a failed request; open the breaker after too many in a row."""
+        self.stats['errors'] += 1
+        self.failures += 1
+        if trial:
+            # Failed trial: back off for twice as long
+            self.trial_inflight = False
+            self.cooldown = min(self.cooldown * 2, BACKEND_EJECT_MAX_SECONDS)
+            self._open(now)
+        elif self.state == CLOSED and self.failures >= BACKEND_EJECT_AFTER:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.ejected_until = now + self.cooldown
+        self.failures = 0
+        self.stats['ejections'] += 1
+        print(f"[Backends] Circuit open for {self.url} for {self.cooldown:.0f}s after repeated failures")
+
+    def release_trial(self) -> None:
+        """A trial ended without telling us anything (e.g. cancelled); let another one through."""
+        self.trial_inflight = False
+
+    def __repr__(self):
+        return f"Backend({self.url!r}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+def parse_backends(value: str) -> List[Backend]:
+    """Parse the OLLAMA_BACKENDS format into backends."""
+    backends = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        # Split on the last '=' so URLs with query strings still parse
+        url, _, models = entry.rpartition('=') if '=' in entry else (entry, '', '')
+        backends.append(Backend(url, [m.strip() for m in models.split('|') if m.strip()]))
+    return backends
+
+class BackendPool:
+    """Routes requests across Ollama backends by least outstanding requests."""
+
+    def __init__(self, backends: List[Backend]):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+        self.latency = LatencyTracker()
+        self.stats = {'requests': 0, 'no_available_backend': 0, 'affinity_hits': 0}
+
+    def pick(self, model: Optional[str] = None, prefer: Optional[str] = None,
+             avoid: Optional[str] = None) -> Backend:
+        """Choose the backend for a request.
+
+        Args:
+            model: Model the request needs
+            prefer: URL of a backend with useful cached state (a conversation's
+                KV context); used while it is no more than BACKEND_AFFINITY_SLACK
+                requests busier than the least loaded candidate
+            avoid: URL of a backend not to use (a hedged request's first target)
+
+        Raises:
+            BackendUnavailable: If no backend serving ``model`` can take a
+                request (breakers open, probes failing)
+        """
+        now = time.monotonic()
+        serving = [b for b in self.backends if b.serves(model)] or self.backends
+        candidates = [b for b in serving if b.available(now) and b.url != avoid]
+        if not candidates:
+            self.stats['no_available_backend'] += 1
+            raise BackendUnavailable(f"No Ollama backend available for {model or 'any model'}")
+        best = min(b.load(now) for b in candidates)
+        if prefer is not None:
+            for b in candidates:
+                if b.url == prefer and b.load(now) <= best + BACKEND_AFFINITY_SLACK:
+                    self.stats['affinity_hits'] += 1
+                    return b
+        return random.choice([b for b in candidates if b.load(now) == best])
+
+    def available(self, model: Optional[str] = None, avoid: Optional[str] = None) -> int:
+        """Number of backends serving ``model`` (other than ``avoid``) that could take a request now."""
+        now = time.monotonic()
+        return sum(1 for b in self.backends if b.serves(model) and b.available(now) and b.url != avoid)
+
+    @asynccontextmanager
+    async def request(self, model: Optional[str] = None, prefer: Optional[str] = None,
+                      avoid: Optional[str] = None):
+        """``async with pool.request(model) as backend:`` around one HTTP request.
+
+        Connection errors, timeouts and 5xx responses raised inside the block
+        count against the backend; anything else (4xx responses and bad output
+        included) leaves its breaker alone. Raises BackendUnavailable without
+        sending anything if no backend can take it.
+        """
+        backend = self.pick(model, prefer, avoid)
+        trial = backend.begin()
+        backend.outstanding += 1
+        backend.stats['requests'] += 1
+        self.stats['requests'] += 1
+        try:
+            yield backend
+        except BaseException as exc:
+            if is_backend_failure(exc):
+                backend.record_failure(time.monotonic(), trial)
+            elif trial:
+                backend.release_trial()
+            raise
+        else:
+            backend.record_success(time.monotonic(), trial)
+        finally:
+            backend.outstanding -= 1
+
+    def timeout_for(self, backend: Backend, fraction: float, factor: float,
+                    minimum: float, maximum: float) -> float:
+        """Adaptive timeout: ``factor`` times the backend's latency percentile, clamped.
+
+        Falls back to the pool-wide percentile while the backend has few
+        samples, and to ``maximum`` while nothing has been measured.
+        """
+        observed = backend.latency.percentile(fraction)
+        if observed is None:
+            observed = self.latency.percentile(fraction)
+        if observed is None:
+            return maximum
+        return max(minimum, min(maximum, observed * factor))
+
+    def observe(self, backend: Backend, seconds: float) -> None:
+        """Record a completed request's latency for the backend and the pool."""
+        backend.latency.add(seconds)
+        self.latency.add(seconds)
+
+    async def probe(self, backend: Backend) -> bool:
+        """Check one backend with GET /api/tags and update its health."""
+        try:
+            async with get_session(BACKEND_OLLAMA).get(
+                backend.url + '/api/tags', timeout=aiohttp.ClientTimeout(total=BACKEND_PROBE_TIMEOUT)
+            ) as resp:
+                resp.raise_for_status()
+                await resp.read()
+        except BACKEND_ERRORS:
+            backend.stats['probe_failures'] += 1
+            if backend.healthy:
+                print(f"[Backends] {backend.url} failed its health check")
+            backend.healthy = False
+            return False
+        if not backend.healthy:
+            print(f"[Backends] {backend.url} is healthy again")
+            backend.healthy = True
+            backend.failures = 0
+            if backend.state == CLOSED:
+                backend.recovered_at = time.monotonic()
+        return True
+
+    async def probe_all(self) -> int:
+        """Probe every backend concurrently; returns how many are healthy."""
+        results = await asyncio.gather(*(self.probe(b) for b in self.backends))
+        return sum(results)
+
+    def get_stats(self) -> Dict:
+        """Return pool counters and each backend's state."""
+        now = time.monotonic()
+        return dict(self.stats, backends={
+            b.url: dict(b.stats, outstanding=b.outstanding, healthy=b.healthy, state=b.state,
+                        ejected=b.state != CLOSED and now < b.ejected_until, models=sorted(b.models),
+                        p95_ms=(b.latency.percentile(0.95) or 0) * 1000)
+            for b in self.backends
+        })
+
+OLLAMA_POOL = BackendPool(parse_backends(OLLAMA_BACKENDS) or [Backend(OLLAMA_URL)])
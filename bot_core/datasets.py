@@ -1,146 +1,318 @@
-import os
+"""
+Conversion of public dialogue datasets into Yumi's Q&A pairs.
+
+Registered converters run in worker processes and stream JSONL that load_all_datasets() merges into the Q&A store.
+"""
+
 import json
-import datasets
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .dedup import DEDUP_KEEP, DEDUP_THRESHOLD, dedupe_store
+from .qa_store import QA_STORE
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'datasets')
+RAW_DIR = os.path.join(DATASET_DIR, 'raw')
+DATASET_WORKERS = int(os.getenv('YUMI_DATASET_WORKERS', str(min(4, os.cpu_count() or 1))))
+DATASET_PROGRESS_EVERY = 100000  # Records between progress lines per source
+RAW_FORMATS = ('.jsonl', '.parquet', '.arrow')
+_ARROW_BATCH_ROWS = 1024
 
-def ensure_dataset(dataset_name, filename):
-    if not os.path.exists(filename):
-        print(f"Downloading {dataset_name} dataset...")
-        # Pass trust_remote_code=True for datasets that require it
-        if dataset_name in ['daily_dialog', 'cornell_movie_dialog', 'conv_ai_2', 'multi_woz_v22', 'empathetic_dialogues']:
-            ds = datasets.load_dataset(dataset_name, trust_remote_code=True)
-        else:
-            ds = datasets.load_dataset(dataset_name)
-        qa = {}
-        if dataset_name == 'persona_chat':
-            for dialog in ds['train']:
-                for utterance in dialog['utterances']:
-                    history = utterance['history']
-                    candidates = utterance['candidates']
-                    if history and candidates:
-                        qa[history[-1].lower()] = candidates[0]
-        elif dataset_name == 'daily_dialog':
-            for dialog in ds['train']:
-                utterances = dialog['dialog']
-                for i in range(len(utterances)-1):
-                    qa[utterances[i].lower()] = utterances[i+1]
-        elif dataset_name == 'cornell_movie_dialog':
-            print(f"cornell_movie_dialog: ds['train'] length = {len(ds['train'])}")
-            if len(ds['train']) > 0:
-                print(f"cornell_movie_dialog: first item keys = {list(ds['train'][0].keys())}")
-            for conv in ds['train']:
-                lines = conv.get('utterance', {}).get('text', [])
-                if not isinstance(lines, list) or len(lines) < 2:
+Record = Tuple[str, str]
+
+class Source:
+    """A registered converter and where its rows come from."""
+
+    def __init__(self, name: str, hub_id: str, convert: Callable[[Iterable[Dict]], Iterator[Record]],
+                 trust_remote_code: bool = False, auto: bool = True):
+        self.name = name  # Stem of the raw input and JSONL output files
+        self.hub_id = hub_id
+        self.convert = convert
+        self.trust_remote_code = trust_remote_code
+        self.auto = auto  # Converted by load_all_datasets()
+
+SOURCES: Dict[str, Source] = {}  # Registration order is merge order: later sources win
+
+def converter(name: str, hub_id: Optional[str] = None, trust_remote_code: bool = False, auto: bool = True):
+    """Register a generator of (question, answer) records over a dataset's train rows.
+
+    Args:
+        name: Source name, used for ``raw/<name>.*`` and ``<name>.jsonl``
+        hub_id: Hugging Face dataset ID when no local file exists (defaults to ``name``)
+        trust_remote_code: Whether the hub dataset needs its loading script
+        auto: Whether load_all_datasets() converts this source
+    """
+    def register(func):
+        SOURCES[name] = Source(name, hub_id or name, func, trust_remote_code, auto)
+        return func
+    return register
+
+def _turn_pairs(turns: List, text_key: str, role_key: Optional[str] = None,
+                asker: Optional[str] = None, answerer: Optional[str] = None) -> Iterator[Record]:
+    """Consecutive turns of a conversation as records, optionally only asker -> answerer."""
+    for first, second in zip(turns, turns[1:]):
+        if role_key and (first.get(role_key) != asker or second.get(role_key) != answerer):
+            continue
+        q = first.get(text_key, '').strip().lower()
+        a = second.get(text_key, '').strip()
+        if q and a:
+            yield q, a
+
+def _field_pairs(rows: Iterable[Dict], question_key: str, answer_key: str) -> Iterator[Record]:
+    """One record per row from two of its fields."""
+    for row in rows:
+        q = row.get(question_key, '').strip().lower()
+        a = row.get(answer_key, '').strip()
+        if q and a:
+            yield q, a
+
+@converter('daily_dialog', trust_remote_code=True)
+def daily_dialog(rows):
+    for dialog in rows:
+        utterances = dialog['dialog']
+        for i in range(len(utterances) - 1):
+            yield utterances[i].lower(), utterances[i + 1]
+
+@converter('cornell_movie_dialog', trust_remote_code=True)
+def cornell_movie_dialog(rows):
+    for conv in rows:
+        lines = conv.get('utterance', {}).get('text', [])
+        if not isinstance(lines, list) or len(lines) < 2:
+            continue
+        for i in range(len(lines) - 1):
+            q = lines[i].strip().lower()
+            a = lines[i + 1].strip()
+            if q and a:
+                yield q, a
+
+@converter('empathetic_dialogues', trust_remote_code=True)
+def empathetic_dialogues(rows):
+    return _field_pairs(rows, 'context', 'utterance')
+
+@converter('conv_ai_2', trust_remote_code=True)
+def conv_ai_2(rows):
+    for dialog in rows:
+        yield from _turn_pairs(dialog.get('dialog', []), 'text')
+
+@converter('multi_woz_v22', trust_remote_code=True)
+def multi_woz_v22(rows):
+    for dialog in rows:
+        dialogue = [turn if isinstance(turn, dict) else {'text': str(turn)} for turn in dialog.get('dialogue', [])]
+        yield from _turn_pairs(dialogue, 'text')
+
+@converter('oasst1', hub_id='OpenAssistant/oasst1')
+def oasst1(rows):
+    for conv in rows:
+        yield from _turn_pairs(conv.get('messages', []), 'content', 'role', 'user', 'assistant')
+
+@converter('guanaco', hub_id='OpenAssistant/guanaco', auto=False)
+def guanaco(rows):
+    for conv in rows:
+        yield from _turn_pairs(conv.get('conversations', []), 'value', 'from', 'human', 'gpt')
+
+@converter('sharegpt', hub_id='ShareGPT/sharegpt')
+def sharegpt(rows):
+    for conv in rows:
+        yield from _turn_pairs(conv.get('conversations', []), 'value', 'from', 'human', 'gpt')
+
+@converter('ultrachat_200k', hub_id='HuggingFaceH4/ultrachat_200k')
+def ultrachat_200k(rows):
+    for conv in rows:
+        yield from _turn_pairs(conv.get('messages', []), 'content', 'role', 'user', 'assistant')
+
+@converter('hh_rlhf', hub_id='Anthropic/hh-rlhf')
+def hh_rlhf(rows):
+    for row in rows:
+        yield from _turn_pairs(row.get('chosen', {}).get('messages', []), 'content', 'role', 'user', 'assistant')
+
+@converter('alpaca', hub_id='tatsu-lab/alpaca')
+def alpaca(rows):
+    return _field_pairs(rows, 'instruction', 'output')
+
+@converter('dolly_15k', hub_id='databricks/databricks-dolly-15k')
+def dolly_15k(rows):
+    return _field_pairs(rows, 'instruction', 'response')
+
+@converter('shp', hub_id='stanfordnlp/SHP')
+def shp(rows):
+    for row in rows:
+        history = row.get('history', [])
+        prompt = row.get('prompt', '').strip().lower()
+        chosen = row.get('chosen', '').strip()
+        if history and prompt and chosen:
+            yield ' '.join(history + [prompt]), chosen
+
+@converter('self_instruct', hub_id='yizhongw/self-instruct')
+def self_instruct(rows):
+    return _field_pairs(rows, 'instruction', 'output')
+
+@converter('blenderbot-3B', hub_id='facebook/blenderbot-3B')
+def blenderbot_3b(rows):
+    return _field_pairs(rows, 'context', 'response')
+
+@converter('persona_chat', auto=False)
+def persona_chat(rows):
+    for dialog in rows:
+        for utterance in dialog['utterances']:
+            history = utterance['history']
+            candidates = utterance['candidates']
+            if history and candidates:
+                yield history[-1].lower(), candidates[0]
+
+def read_rows(path: str) -> Iterator[Dict]:
+    """Stream the rows of a local JSONL, Parquet or Arrow (IPC file or stream) file as dicts.
+
+    Raises:
+        ValueError: For other file types
+        RuntimeError: If a Parquet/Arrow file is given and pyarrow is not installed
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    if ext not in ('.parquet', '.arrow'):
+        raise ValueError(f"Unsupported dataset file {path}; expected one of {', '.join(RAW_FORMATS)}")
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(f"Reading {ext} files needs pyarrow (pip install pyarrow)")
+    if ext == '.parquet':
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=_ARROW_BATCH_ROWS):
+            yield from batch.to_pylist()
+        return
+    with pa.memory_map(path) as source:
+        try:
+            reader = pyarrow.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pyarrow.ipc.open_stream(source)  # Hugging Face's cache files use the stream format
+        for batch in batches:
+            yield from batch.to_pylist()
+
+def local_file(name: str, raw_dir: str = RAW_DIR) -> Optional[str]:
+    """The local raw input for a source, if there is one."""
+    for ext in RAW_FORMATS:
+        path = os.path.join(raw_dir, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def _hub_rows(source: Source) -> Iterable[Dict]:
+    import datasets  # Hugging Face; only needed without a local file
+    return datasets.load_dataset(source.hub_id, split='train', trust_remote_code=source.trust_remote_code)
+
+def output_path(name: str, output_dir: str = DATASET_DIR) -> str:
+    return os.path.join(output_dir, f"{name}.jsonl")
+
+def convert_source(name: str, output_dir: str = DATASET_DIR, raw_dir: str = RAW_DIR) -> Dict:
+    """Run one converter end to end, writing its JSONL output atomically (runs in a worker process).
+
+    Returns:
+        Stats dict with the source name, input, records written and seconds taken
+    """
+    source = SOURCES[name]
+    raw = local_file(name, raw_dir)
+    rows = read_rows(raw) if raw else _hub_rows(source)
+    path = output_path(name, output_dir)
+    tmp = path + '.tmp'
+    start = time.perf_counter()
+    records = 0
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for question, answer in source.convert(rows):
+                if not (isinstance(question, str) and isinstance(answer, str) and question and answer):
                     continue
-                for i in range(len(lines)-1):
-                    q = lines[i].strip().lower()
-                    a = lines[i+1].strip()
-                    if q and a:
-                        qa[q] = a
-        elif dataset_name == 'empathetic_dialogues':
-            for row in ds['train']:
-                context = row.get('context', '').strip().lower()
-                utterance = row.get('utterance', '').strip()
-                if context and utterance:
-                    qa[context] = utterance
-        elif dataset_name == 'multi_woz_v22':
-            for dialog in ds['train']:
-                dialogue = dialog.get('dialogue', [])
-                for i in range(len(dialogue)-1):
-                    q = dialogue[i].get('text', '') if isinstance(dialogue[i], dict) else str(dialogue[i])
-                    a = dialogue[i+1].get('text', '') if isinstance(dialogue[i+1], dict) else str(dialogue[i+1])
-                    q = q.strip().lower()
-                    a = a.strip()
-                    if q and a:
-                        qa[q] = a
-        elif dataset_name == 'conv_ai_2':
-            for dialog in ds['train']:
-                utterances = dialog.get('dialog', [])
-                for i in range(len(utterances)-1):
-                    q = utterances[i].get('text', '').strip().lower()
-                    a = utterances[i+1].get('text', '').strip()
-                    if q and a:
-                        qa[q] = a
-        elif dataset_name == 'OpenAssistant/oasst1':
-            if len(ds['train']) > 0:
-                print(f"oasst1: first item = {json.dumps(ds['train'][0], indent=2)}")
-            for conv in ds['train']:
-                messages = conv.get('messages', [])
-                for i in range(len(messages)-1):
-                    q = messages[i].get('content', '').strip().lower()
-                    a = messages[i+1].get('content', '').strip()
-                    if q and a and messages[i].get('role') == 'user' and messages[i+1].get('role') == 'assistant':
-                        qa[q] = a
-        elif dataset_name == 'OpenAssistant/guanaco':
-            for conv in ds['train']:
-                messages = conv.get('conversations', [])
-                for i in range(len(messages)-1):
-                    q = messages[i].get('value', '').strip().lower()
-                    a = messages[i+1].get('value', '').strip()
-                    if q and a and messages[i].get('from') == 'human' and messages[i+1].get('from') == 'gpt':
-                        qa[q] = a
-        elif dataset_name == 'sharegpt':
-            for conv in ds['train']:
-                messages = conv.get('conversations', [])
-                for i in range(len(messages)-1):
-                    q = messages[i].get('value', '').strip().lower()
-                    a = messages[i+1].get('value', '').strip()
-                    if q and a and messages[i].get('from') == 'human' and messages[i+1].get('from') == 'gpt':
-                        qa[q] = a
-        elif dataset_name == 'HuggingFaceH4/ultrachat_200k':
-            for conv in ds['train']:
-                messages = conv.get('messages', [])
-                for i in range(len(messages)-1):
-                    q = messages[i].get('content', '').strip().lower()
-                    a = messages[i+1].get('content', '').strip()
-                    if q and a and messages[i].get('role') == 'user' and messages[i+1].get('role') == 'assistant':
-                        qa[q] = a
-        elif dataset_name == 'Anthropic/hh-rlhf':
-            for row in ds['train']:
-                chosen = row.get('chosen', {}).get('messages', [])
-                for i in range(len(chosen)-1):
-                    q = chosen[i].get('content', '').strip().lower()
-                    a = chosen[i+1].get('content', '').strip()
-                    if q and a and chosen[i].get('role') == 'user' and chosen[i+1].get('role') == 'assistant':
-                        qa[q] = a
-        elif dataset_name == 'tatsu-lab/alpaca':
-            for row in ds['train']:
-                q = row.get('instruction', '').strip().lower()
-                a = row.get('output', '').strip()
-                if q and a:
-                    qa[q] = a
-        elif dataset_name == 'databricks/databricks-dolly-15k':
-            for row in ds['train']:
-                q = row.get('instruction', '').strip().lower()
-                a = row.get('response', '').strip()
-                if q and a:
-                    qa[q] = a
-        elif dataset_name == 'stanfordnlp/SHP':
-            for row in ds['train']:
-                history = row.get('history', [])
-                prompt = row.get('prompt', '').strip().lower()
-                chosen = row.get('chosen', '').strip()
-                if history and prompt and chosen:
-                    q = ' '.join(history + [prompt])
-                    qa[q] = chosen
-        elif dataset_name == 'yizhongw/self-instruct':
-            for row in ds['train']:
-                q = row.get('instruction', '').strip().lower()
-                a = row.get('output', '').strip()
-                if q and a:
-                    qa[q] = a
-        elif dataset_name == 'facebook/blenderbot-3B':
-            for row in ds['train']:
-                q = row.get('context', '').strip().lower()
-                a = row.get('response', '').strip()
-                if q and a:
-                    qa[q] = a
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(qa, f, ensure_ascii=False, indent=2)
-        print(f"Saved {dataset_name} to {filename} with {len(qa)} Q&A pairs.")
+                f.write(json.dumps({'q': question, 'a': answer}, ensure_ascii=False))
+                f.write('\n')
+                records += 1
+                if records % DATASET_PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"[Datasets] {name}: {records} records ({records / elapsed:.0f}/s)", flush=True)
+        os.replace(tmp, path)
+    except BaseException:
+        # Don't leave a partial output behind for a failed or interrupted converter
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {'name': name, 'input': raw or source.hub_id, 'records': records,
+            'seconds': time.perf_counter() - start}
+
+def _pool_context():
+    # Forked workers inherit the registry without re-importing the bot package
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+def convert_datasets(names: Optional[Iterable[str]] = None, workers: int = DATASET_WORKERS,
+                     output_dir: str = DATASET_DIR, raw_dir: str = RAW_DIR, force: bool = False) -> Dict[str, Dict]:
+    """Convert sources concurrently, one per worker process, reporting progress and throughput.
+
+    Args:
+        names: Sources to convert (defaults to every ``auto`` source)
+        workers: Worker processes; 1 converts in this process
+        output_dir: Where ``<name>.jsonl`` files are written
+        raw_dir: Where local inputs are looked up
+        force: Reconvert sources whose output already exists
+
+    Returns:
+        Stats per source; failed sources have an ``error`` entry instead of ``records``
+    """
+    names = [n for n, s in SOURCES.items() if s.auto] if names is None else list(names)
+    todo = []
+    for name in names:
+        if force or not os.path.exists(output_path(name, output_dir)):
+            todo.append(name)
+        else:
+            print(f"[Datasets] {output_path(name, output_dir)} already exists. Skipping.")
+    results: Dict[str, Dict] = {}
+    if not todo:
+        return results
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    def report(name, stats):
+        results[name] = stats
+        if 'error' in stats:
+            print(f"[Datasets] Could not convert {name}: {stats['error']}")
+        else:
+            rate = stats['records'] / stats['seconds'] if stats['seconds'] else 0
+            print(f"[Datasets] {name}: {stats['records']} records from {stats['input']} in "
+                  f"{stats['seconds']:.1f}s ({rate:.0f}/s) [{len(results)}/{len(todo)}]")
+
+    if workers <= 1 or len(todo) == 1:
+        for name in todo:
+            try:
+                report(name, convert_source(name, output_dir, raw_dir))
+            except Exception as e:
+                report(name, {'name': name, 'error': str(e)})
     else:
-        print(f"{filename} already exists. Skipping download.")
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo)), mp_context=_pool_context()) as pool:
+            futures = {pool.submit(convert_source, name, output_dir, raw_dir): name for name in todo}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    report(name, future.result())
+                except Exception as e:
+                    report(name, {'name': name, 'error': str(e)})
+
+    elapsed = time.perf_counter() - start
+    records = sum(stats.get('records', 0) for stats in results.values())
+    print(f"[Datasets] Converted {len(todo)} sources: {records} records in {elapsed:.1f}s "
+          f"({records / elapsed if elapsed else 0:.0f} records/s, {workers} workers)")
+    return results
+
+def iter_jsonl_records(path: str) -> Iterator[Record]:
+    """The (question, answer) records of a converter's JSONL output."""
+    for row in read_rows(path):
+        yield row.get('q'), row.get('a')
 
 def load_py_qa_dataset(pyfile):
     import importlib.util
@@ -156,71 +328,38 @@ def load_py_qa_dataset(pyfile):
             return value
     return {}
 
-def load_all_datasets():
-    DATASET_FILE = os.path.join(DATASET_DIR, 'chatbot_dataset.json')
-    ADDITIONAL_DATASETS = [
-        ("empathetic_dialogues", os.path.join(DATASET_DIR, "empathetic_dialogues.json")),
-        ("conv_ai_2", os.path.join(DATASET_DIR, "conv_ai_2.json")),
-        ("multi_woz_v22", os.path.join(DATASET_DIR, "multi_woz_v22.json")),
-        ("OpenAssistant/oasst1", os.path.join(DATASET_DIR, "oasst1.json")),
-        ("ShareGPT/sharegpt", os.path.join(DATASET_DIR, "sharegpt.json")),
-        ("HuggingFaceH4/ultrachat_200k", os.path.join(DATASET_DIR, "ultrachat_200k.json")),
-        ("Anthropic/hh-rlhf", os.path.join(DATASET_DIR, "hh_rlhf.json")),
-        ("tatsu-lab/alpaca", os.path.join(DATASET_DIR, "alpaca.json")),
-        ("databricks/databricks-dolly-15k", os.path.join(DATASET_DIR, "dolly_15k.json")),
-        ("stanfordnlp/SHP", os.path.join(DATASET_DIR, "shp.json")),
-        ("yizhongw/self-instruct", os.path.join(DATASET_DIR, "self_instruct.json")),
-        ("facebook/blenderbot-3B", os.path.join(DATASET_DIR, "blenderbot-3B.json")),
-        # ("dialogsum", os.path.join(DATASET_DIR, "dialogsum.json")),  # Removed, not available
-    ]
-    # Download core datasets
-    try:
-        ensure_dataset('daily_dialog', 'daily_dialog.json')
-    except Exception as e:
-        print(f"Could not download daily_dialog: {e}")
-    try:
-        ensure_dataset('cornell_movie_dialog', 'cornell_movie_dialog.json')
-    except Exception as e:
-        print(f"Could not download cornell_movie_dialog: {e}")
-    for dataset_name, filename in ADDITIONAL_DATASETS:
-        try:
-            ensure_dataset(dataset_name, filename)
-        except Exception as e:
-            print(f"Could not download {dataset_name}: {e}")
-    # Merge all datasets
-    if os.path.exists(DATASET_FILE):
-        with open(DATASET_FILE, 'r', encoding='utf-8') as f:
-            qa_pairs = json.load(f)
-    else:
-        qa_pairs = {}
-    for dataset_file in [
-        os.path.join(DATASET_DIR, "daily_dialog.py"), os.path.join(DATASET_DIR, "cornell_movie_dialog.py")
-    ]:
-        if os.path.exists(dataset_file):
-            dataset_qa = load_py_qa_dataset(dataset_file)
-            for k, v in dataset_qa.items():
-                if isinstance(k, str) and isinstance(v, str):
-                    qa_pairs[k] = v
+def load_all_datasets(store=QA_STORE, workers: int = DATASET_WORKERS, dataset_dir: str = DATASET_DIR,
+                      dedup_threshold: float = DEDUP_THRESHOLD, dedup_keep: str = DEDUP_KEEP):
+    """Convert every ``auto`` source that has no output yet, then merge all outputs into ``store``.
+
+    Sources are merged in registration order, so later ones win, as before;
+    ``<name>.json`` files written by older versions are still read when
+    there is no ``<name>.jsonl``. Local inputs are looked up in
+    ``<dataset_dir>/raw``. Near-duplicate questions are then collapsed to one
+    pair each, unless ``dedup_threshold`` is 0.
+    """
+    DATASET_FILE = os.path.join(dataset_dir, 'chatbot_dataset.json')
+    convert_datasets(workers=workers, output_dir=dataset_dir, raw_dir=os.path.join(dataset_dir, 'raw'))
+    # Merge all datasets into the on-disk Q&A store
+    qa_pairs = store
+    if not qa_pairs and os.path.exists(DATASET_FILE):
+        qa_pairs.import_json(DATASET_FILE)
     for dataset_file in [
-        os.path.join(DATASET_DIR, "daily_dialog.json"), os.path.join(DATASET_DIR, "cornell_movie_dialog.json"), os.path.join(DATASET_DIR, "empathetic_dialogues.json"), os.path.join(DATASET_DIR, "conv_ai_2.json"), os.path.join(DATASET_DIR, "multi_woz_v22.json"),
-        os.path.join(DATASET_DIR, "oasst1.json"), os.path.join(DATASET_DIR, "guanaco.json"), os.path.join(DATASET_DIR, "sharegpt.json"), os.path.join(DATASET_DIR, "ultrachat_200k.json"), os.path.join(DATASET_DIR, "hh_rlhf.json"), os.path.join(DATASET_DIR, "alpaca.json"), os.path.join(DATASET_DIR, "dolly_15k.json"),
-        os.path.join(DATASET_DIR, "shp.json"), os.path.join(DATASET_DIR, "self_instruct.json"), os.path.join(DATASET_DIR, "blenderbot-3B.json")
-        # os.path.join(DATASET_DIR, "dialogsum.json"),  # Removed
+        os.path.join(dataset_dir, "daily_dialog.py"), os.path.join(dataset_dir, "cornell_movie_dialog.py")
     ]:
         if os.path.exists(dataset_file):
-            with open(dataset_file, 'r', encoding='utf-8') as f:
-                dataset_qa = json.load(f)
-                for k, v in dataset_qa.items():
-                    if isinstance(k, str) and isinstance(v, str):
-                        qa_pairs[k] = v
-    mistress_dataset_path = os.path.join(DATASET_DIR, "mistress_dataset.json")
+            qa_pairs.update_many(load_py_qa_dataset(dataset_file).items())
+    for name in SOURCES:
+        jsonl_file = output_path(name, dataset_dir)
+        legacy_file = os.path.join(dataset_dir, f"{name}.json")
+        if os.path.exists(jsonl_file):
+            qa_pairs.update_many(iter_jsonl_records(jsonl_file))
+        elif os.path.exists(legacy_file):
+            qa_pairs.import_json(legacy_file)
+    mistress_dataset_path = os.path.join(dataset_dir, "mistress_dataset.json")
     if os.path.exists(mistress_dataset_path):
-        with open(mistress_dataset_path, 'r', encoding='utf-8') as f:
-            mistress_qa = json.load(f)
-            for k, v in mistress_qa.items():
-                if isinstance(k, str) and isinstance(v, str):
-                    qa_pairs[k] = v
-    with open(DATASET_FILE, 'w', encoding='utf-8') as f:
-        json.dump(qa_pairs, f, ensure_ascii=False, indent=2)
+        qa_pairs.import_json(mistress_dataset_path)
+    if dedup_threshold > 0 and len(qa_pairs) > 1:
+        dedupe_store(qa_pairs, dedup_threshold, dedup_keep)
     print(f"Yumi loaded {len(qa_pairs)} Q&A pairs from datasets!")
     return qa_pairs
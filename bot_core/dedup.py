@@ -0,0 +1,243 @@
+"""
+Near-duplicate detection for the merged Q&A corpus.
+
+MinHash/LSH finds questions whose character shingles are at least YUMI_DEDUP_THRESHOLD similar.
+"""
+
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+DEDUP_THRESHOLD = float(os.getenv('YUMI_DEDUP_THRESHOLD', '0.8'))  # Jaccard similarity; 0 disables
+DEDUP_KEEP = os.getenv('YUMI_DEDUP_KEEP', 'last')  # last, first or longest
+DEDUP_NUM_PERM = 64  # MinHash permutations
+DEDUP_SHINGLE = 3  # Characters per shingle
+KEEP_POLICIES = ('last', 'first', 'longest')
+_CHUNK_ROWS = 1000  # Questions MinHashed per vectorized step (~20 MiB of intermediates)
+_PRIME = np.uint64(4294967291)  # Largest prime below 2**32
+_GRAM_MIX = np.uint64(0x9E3779B97F4A7C15)  # Odd multiplier folding code points into a shingle hash
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SHORTHAND = {
+    'u': 'you', 'r': 'are', 'ur': 'your', 'y': 'why', 'im': 'i am', 'pls': 'please', 'plz': 'please',
+    'thx': 'thanks', 'ty': 'thank you', 'wat': 'what', 'wut': 'what', 'dont': 'do not', 'cant': 'can not',
+    'b4': 'before', 'gr8': 'great', 'k': 'ok', 'okay': 'ok', 'ya': 'you', 'cuz': 'because', 'bc': 'because',
+}
+
+def normalize(text: str) -> str:
+    """Lowercase words with punctuation dropped and chat shorthand spelled out ("how r u?" -> "how are you")."""
+    words = _WORD_RE.findall(text.lower().replace("'", '').replace('’', ''))
+    return ' '.join(_SHORTHAND.get(word, word) for word in words)
+
+def shingles(text: str, size: int = DEDUP_SHINGLE) -> Set[str]:
+    """Character shingles of the normalized text (the whole text if it is shorter); empty if no words."""
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def lsh_params(threshold: float, num_perm: int = DEDUP_NUM_PERM,
+               fp_weight: float = 0.05, fn_weight: float = 0.95) -> Tuple[int, int]:
+    """(bands, rows per band) minimizing weighted false positive/negative probability mass.
+
+    False negatives weigh more: candidates are verified exactly, so a false
+    positive only costs one comparison while a miss leaves a duplicate.
+    """
+    s = np.linspace(0, 1, 201)
+    below = s < threshold
+    best, best_cost = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            p = 1 - (1 - s ** rows) ** bands  # Chance a pair with similarity s shares a bucket
+            cost = fp_weight * p[below].sum() + fn_weight * (1 - p[~below]).sum()
+            if cost < best_cost:
+                best, best_cost = (bands, rows), cost
+    return best
+
+class MinHashLSH:
+    """Band hashes of MinHash signatures for a stream of (row ID, text) items."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)  # Fixed seed: the same corpus always yields the same groups
+        perm = self.bands * self.rows
+        self._a = rng.integers(1, int(_PRIME), perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), perm, dtype=np.uint64)
+        self._mix = rng.integers(1, 2**63, self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def band_hashes(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Band hashes (len(kept), bands) as uint32, and the positions of texts that had any words."""
+        normalized, kept = [], []
+        for position, text in enumerate(texts):
+            text = normalize(text)
+            if text:
+                normalized.append(text.ljust(DEDUP_SHINGLE))  # A short text is one padded shingle
+                kept.append(position)
+        if not normalized:
+            return np.empty((0, self.bands), dtype=np.uint32), np.empty(0, dtype=np.int64)
+        # Hash every shingle of the chunk at once from its code points; MinHash doesn't
+        # need them deduplicated, as a repeated shingle can't change a minimum
+        codes = np.frombuffer(''.join(normalized).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter(map(len, normalized), dtype=np.int64, count=len(normalized))
+        counts = lengths - DEDUP_SHINGLE + 1
+        offsets = np.repeat(np.cumsum(lengths) - lengths, counts)
+        starts = offsets + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        grams = np.zeros(len(starts), dtype=np.uint64)
+        for i in range(DEDUP_SHINGLE):
+            grams = (grams ^ codes[starts + i]) * _GRAM_MIX
+        grams = (grams >> np.uint64(32)) ^ (grams & np.uint64(0xFFFFFFFF))
+        values = (grams[:, None] * self._a + self._b) % _PRIME
+        signatures = np.minimum.reduceat(values, np.cumsum(counts) - counts, axis=0)
+        bands = (signatures.reshape(len(normalized), self.bands, self.rows) * self._mix).sum(axis=2)
+        return (bands >> np.uint64(32)).astype(np.uint32), np.asarray(kept, dtype=np.int64)
+
+    def index(self, items: Iterable[Tuple[int, str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Row IDs and their band hashes for every item with words, computed a chunk at a time."""
+        ids, bands = [], []
+        chunk_ids: List[int] = []
+        chunk_texts: List[str] = []
+        for row_id, text in items:
+            chunk_ids.append(row_id)
+            chunk_texts.append(text)
+            if len(chunk_ids) >= _CHUNK_ROWS:
+                self._add_chunk(chunk_ids, chunk_texts, ids, bands)
+                chunk_ids, chunk_texts = [], []
+        if chunk_ids:
+            self._add_chunk(chunk_ids, chunk_texts, ids, bands)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.bands), dtype=np.uint32)
+        return np.concatenate(ids), np.concatenate(bands)
+
+    def _add_chunk(self, chunk_ids, chunk_texts, ids, bands) -> None:
+        hashes, kept = self.band_hashes(chunk_texts)
+        ids.append(np.asarray(chunk_ids, dtype=np.int64)[kept])
+        bands.append(hashes)
+
+def candidate_pairs(bands: np.ndarray) -> np.ndarray:
+    """(i, j) row positions sharing a bucket in some band, each pair once.
+
+    Within a bucket every member is paired with the bucket's first member and
+    with its predecessor, so the work stays linear however large buckets get.
+    """
+    pairs = []
+    for band in range(bands.shape[1]):
+        order = np.argsort(bands[:, band], kind='stable')
+        values = bands[order, band]
+        same = values[1:] == values[:-1]
+        if not same.any():
+            continue
+        new_bucket = np.concatenate(([True], ~same))
+        starts = np.flatnonzero(new_bucket)
+        members = np.flatnonzero(~new_bucket)  # Every sorted position after the first of its bucket
+        pairs.append(np.stack([order[members - 1], order[members]], axis=1))
+        heads = order[starts[np.cumsum(new_bucket)[members] - 1]]
+        not_adjacent = heads != order[members - 1]
+        pairs.append(np.stack([heads[not_adjacent], order[members][not_adjacent]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    return np.unique(pairs, axis=0)
+
+def find_duplicates(items: Iterable[Tuple[int, str]], get_texts: Callable[[List[int]], Dict[int, str]],
+                    threshold: float = DEDUP_THRESHOLD, stats: Optional[Dict] = None) -> List[List[int]]:
+    """Groups of row IDs whose texts are near-duplicates (each group has two or more IDs).
+
+    Args:
+        items: (row ID, text) for every row, streamed once
+        get_texts: Looks up the texts of candidate rows by ID
+        threshold: Minimum Jaccard similarity of the shingle sets
+        stats: Optional dict that receives candidate/verified counts
+    """
+    lsh = MinHashLSH(threshold)
+    ids, bands = lsh.index(items)
+    pairs = candidate_pairs(bands)
+    del bands
+    involved = np.unique(pairs)
+    texts = get_texts(ids[involved].tolist()) if len(involved) else {}
+
+    def shingles_of(position):
+        # Recomputed per pair: caching every candidate's set costs far more memory than time saved
+        return shingles(texts.get(int(ids[position]), ''))
+
+    parent: Dict[int, int] = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:  # Path compression
+            parent[x], x = root, parent[x]
+        return root
+
+    verified = 0
+    for i, j in pairs.tolist():
+        if jaccard(shingles_of(i), shingles_of(j)) >= threshold:
+            verified += 1
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = parent[min(ri, rj)] = min(ri, rj)
+
+    groups: Dict[int, List[int]] = {}
+    for position in parent:
+        groups.setdefault(find(position), []).append(int(ids[position]))
+    if stats is not None:
+        stats.update(rows=len(ids), bands=lsh.bands, rows_per_band=lsh.rows,
+                     candidates=len(pairs), verified=verified)
+    return [sorted(group) for group in groups.values()]
+
+def choose_keeper(rows: Dict[int, Tuple[str, str]], policy: str = DEDUP_KEEP) -> int:
+    """The row ID a duplicate group keeps; ties always resolve to the later row.
+
+    Raises:
+        ValueError: For an unknown policy
+    """
+    if policy == 'last':
+        return max(rows)
+    if policy == 'first':
+        return min(rows)
+    if policy == 'longest':
+        return max(rows, key=lambda row_id: (len(rows[row_id][1]), row_id))
+    raise ValueError(f"Unknown dedup keep policy {policy!r}; expected one of {', '.join(KEEP_POLICIES)}")
+
+def dedupe_store(store, threshold: float = DEDUP_THRESHOLD, keep: str = DEDUP_KEEP) -> Dict:
+    """Remove near-duplicate questions from a QAStore, keeping one pair per group (blocking).
+
+    Pairs curated from the dashboard are never removed: a group holding any
+    keeps all of those and drops its dataset pairs; other groups keep one
+    pair chosen by ``keep``.
+
+    Returns:
+        Stats: pairs before/after, pairs removed, groups, candidates checked and seconds taken
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"Unknown dedup keep policy {keep!r}; expected one of {', '.join(KEEP_POLICIES)}")
+    start = time.perf_counter()
+    before = len(store)
+    stats: Dict = {'pairs_before': before}
+    groups = find_duplicates(
+        store.iter_rows(),
+        lambda row_ids: {row_id: q for row_id, (q, _) in store.get_rows(row_ids).items()},
+        threshold, stats)
+    rows = store.get_rows(row_id for group in groups for row_id in group)
+    curated = store.curated_ids(rows)
+    doomed = []
+    for group in groups:
+        members = {row_id: rows[row_id] for row_id in group if row_id in rows}
+        keepers = curated.intersection(members) or {choose_keeper(members, keep)}
+        doomed.extend(row_id for row_id in members if row_id not in keepers)
+    removed = store.remove_ids(doomed)
+    stats.update(groups=len(groups), removed=removed, pairs_after=before - removed,
+                 seconds=time.perf_counter() - start)
+    shrink = removed / before if before else 0.0
+    print(f"[Dedup] Removed {removed} near-duplicate pairs from {len(groups)} groups "
+          f"({before} -> {before - removed}, {shrink:.1%} smaller) in {stats['seconds']:.1f}s")
+    return stats
@@ -0,0 +1,237 @@
+"""
+Background extraction of personal facts from user messages.
+
+Messages are queued without waiting and extracted in batches, one LLM call per batch.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from . import llm
+from .fact_filter import FactPrefilter
+from .scheduler import PRIORITY_EXTRACTION
+
+FACT_QUEUE_SIZE = int(os.getenv('YUMI_FACT_QUEUE_SIZE', '256'))  # Pending messages; oldest dropped beyond this
+FACT_BATCH_SIZE = int(os.getenv('YUMI_FACT_BATCH_SIZE', '8'))  # Messages per LLM call
+FACT_BATCH_WAIT = float(os.getenv('YUMI_FACT_BATCH_WAIT', '5'))  # Seconds to wait for a batch to fill
+FACT_MIN_LENGTH = 10
+FACT_MAX_MESSAGE_CHARS = 500
+FACT_MAX_KEY_CHARS = 32
+FACT_MAX_VALUE_CHARS = 200
+
+FACT_INSTRUCTIONS = """You extract personal facts that chat users state about themselves. Extract only clear, factual information about each user.
+
+Examples of good facts to extract:
+- name: if they say "my name is..." or "I'm called..." or "call me..."
+- location: if they mention where they live/are from
+- age: if they mention their age
+- occupation: if they mention their job
+- interests: if they clearly state they like/love something
+- relationship_status: if they mention being married, single, dating, etc.
+- pets: if they mention having pets
+- family: if they mention family members
+
+Only extract facts that are:
+1. Clearly stated by the user
+2. About the user themselves (not others)
+3. Factual information (not opinions or temporary states)
+
+Return ONLY a JSON object with one entry per user label, each an object of new facts (empty if there are none), for example: {"u1": {"name": "Sam"}, "u2": {}}"""
+
+_NAME_PATTERNS = [re.compile(p) for p in (
+    r"my name is (\w+)",
+    r"i'm (\w+)",
+    r"call me (\w+)",
+    r"i am (\w+)",
+    r"name's (\w+)",
+)]
+_EMPTY_VALUES = {'', 'none', 'null', 'unknown', 'n/a'}
+
+def basic_facts(content: str) -> Dict[str, str]:
+    """Pattern-matching fallback for when the model's answer can't be used (names only)."""
+    lowered = content.lower()
+    for pattern in _NAME_PATTERNS:
+        match = pattern.search(lowered)
+        if match:
+            name = match.group(1).strip()
+            if len(name) > 1 and name.isalpha():
+                return {'name': name}
+    return {}
+
+def build_extraction_prompt(batch: Dict[str, List[str]], known_facts: Dict[str, Dict]) -> Tuple[str, Dict[str, str]]:
+    """Build one prompt covering every user in ``batch``.
+
+    Users are shown under short labels (u1, u2, ...) rather than their
+    Discord IDs, which models tend to mangle.
+
+    Args:
+        batch: User ID -> that user's queued messages
+        known_facts: USER_FACTS, to show what is already known
+
+    Returns:
+        The prompt and a label -> user ID mapping
+    """
+    labels = {}
+    blocks = []
+    for n, (user_id, messages) in enumerate(batch.items(), 1):
+        label = f"u{n}"
+        labels[label] = user_id
+        lines = '\n'.join(f'- "{text[:FACT_MAX_MESSAGE_CHARS]}"' for text in messages)
+        blocks.append(f"{label} (known facts: {json.dumps(known_facts.get(user_id, {}), ensure_ascii=False)}):\n{lines}")
+    prompt = f"{FACT_INSTRUCTIONS}\n\nMessages:\n\n" + '\n\n'.join(blocks) + "\n\nJSON:"
+    return prompt, labels
+
+def _clean_facts(raw: Any) -> Dict[str, str]:
+    """Keep string-like facts with sane keys and lengths."""
+    if not isinstance(raw, dict):
+        return {}
+    facts = {}
+    for key, value in raw.items():
+        if isinstance(value, (list, tuple)):
+            value = ', '.join(str(v) for v in value)
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            continue
+        key = re.sub(r'\W+', '_', str(key).strip().lower()).strip('_')[:FACT_MAX_KEY_CHARS]
+        value = str(value).strip()[:FACT_MAX_VALUE_CHARS]
+        if key and value.lower() not in _EMPTY_VALUES:
+            facts[key] = value
+    return facts
+
+def parse_extraction(text: Optional[str], labels: Dict[str, str]) -> Optional[Dict[str, Dict[str, str]]]:
+    """Parse the model's JSON answer into user ID -> facts; None if it is unusable."""
+    if not text:
+        return None
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {user_id: _clean_facts(data.get(label)) for label, user_id in labels.items()}
+
+class FactExtractor:
+    """Bounded queue of messages plus the batching logic that drains it."""
+
+    def __init__(self, queue_size: int = FACT_QUEUE_SIZE, batch_size: int = FACT_BATCH_SIZE,
+                 batch_wait: float = FACT_BATCH_WAIT, prefilter: Optional[FactPrefilter] = None):
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.prefilter = prefilter if prefilter is not None else FactPrefilter()
+        self._queue: Deque[Tuple[str, str]] = deque(maxlen=max(1, queue_size))
+        self._ready: Optional[asyncio.Event] = None  # Created by the worker, inside the running loop
+        self.stats = {'submitted': 0, 'skipped': 0, 'prefiltered': 0, 'dropped': 0, 'batches': 0,
+                      'messages': 0, 'llm_calls': 0, 'failed_calls': 0, 'fallbacks': 0,
+                      'facts_updated': 0, 'batch_ms': 0.0}
+
+    def submit(self, user_id: str, content: str) -> bool:
+        """Queue a message for extraction without waiting; returns False if it was skipped."""
+        content = (content or '').strip()
+        if len(content) < FACT_MIN_LENGTH or content.startswith(('!', '/')):
+            self.stats['skipped'] += 1
+            return False
+        if not self.prefilter.check(content):
+            self.stats['prefiltered'] += 1
+            return False
+        if len(self._queue) == self._queue.maxlen:
+            self.stats['dropped'] += 1  # deque drops the oldest message
+        self._queue.append((str(user_id), content))
+        self.stats['submitted'] += 1
+        if self._ready is not None:
+            self._ready.set()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def next_batch(self) -> List[Tuple[str, str]]:
+        """Wait for queued messages, give the batch a moment to fill, then take up to batch_size."""
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        deadline = time.monotonic() + self.batch_wait
+        while len(self._queue) < self.batch_size and time.monotonic() < deadline:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+        return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    async def process_batch(self, batch: List[Tuple[str, str]], user_facts: Dict[str, Dict]) -> List[str]:
+        """Extract facts for a batch with one LLM call and merge them into ``user_facts``.
+
+        Falls back to pattern matching for every message if the call fails or
+        its answer is not usable JSON.
+
+        Returns:
+            IDs of the users whose facts changed
+        """
+        if not batch:
+            return []
+        start = time.perf_counter()
+        grouped: Dict[str, List[str]] = {}
+        for user_id, content in batch:
+            grouped.setdefault(user_id, []).append(content)
+
+        prompt, labels = build_extraction_prompt(grouped, user_facts)
+        self.stats['llm_calls'] += 1
+        text = await llm.generate_completion(
+            prompt,
+            temperature=0.3,  # Lower temperature for more consistent extraction
+            num_predict=min(100 + 60 * len(grouped), 800),
+            priority=PRIORITY_EXTRACTION
+        )
+        extracted = parse_extraction(text, labels)
+        if extracted is None:
+            self.stats['failed_calls'] += 1
+            extracted = {}
+            for user_id, messages in grouped.items():
+                for content in messages:
+                    facts = basic_facts(content)
+                    if facts:
+                        self.stats['fallbacks'] += 1
+                        extracted.setdefault(user_id, {}).update(facts)
+
+        updated = []
+        for user_id, facts in extracted.items():
+            current = user_facts.setdefault(user_id, {})
+            changed = {k: v for k, v in facts.items() if current.get(k) != v}
+            if changed:
+                current.update(changed)
+                self.stats['facts_updated'] += len(changed)
+                updated.append(user_id)
+                print(f"[Memory] Extracted facts for user {user_id}: {changed}")
+        self.stats['batches'] += 1
+        self.stats['messages'] += len(batch)
+        self.stats['batch_ms'] += (time.perf_counter() - start) * 1000
+        return updated
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return counters, queue depth, average batch size/latency and LLM calls per message.
+
+        ``llm_calls_avoided`` estimates the extraction calls the pre-filter
+        saved: the messages it rejected, at the average batch size so far.
+        """
+        batches = self.stats['batches']
+        avg_batch_size = self.stats['messages'] / batches if batches else 0.0
+        return dict(
+            self.stats,
+            queued=len(self._queue),
+            prefilter=self.prefilter.get_stats(),
+            llm_calls_avoided=self.stats['prefiltered'] / (avg_batch_size or self.batch_size),
+            avg_batch_size=avg_batch_size,
+            avg_batch_ms=self.stats['batch_ms'] / batches if batches else 0.0,
+            calls_per_message=self.stats['llm_calls'] / self.stats['messages'] if self.stats['messages'] else 0.0,
+        )
+
+FACT_EXTRACTOR = FactExtractor()
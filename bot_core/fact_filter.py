@@ -0,0 +1,82 @@
+"""
+Cheap local pre-filter for fact extraction.
+
+Scores how likely a message is to state a personal fact, so only likely ones reach the LLM.
+"""
+
+import math
+import os
+import re
+from typing import Dict, Tuple
+
+FACT_PREFILTER_THRESHOLD = float(os.getenv('YUMI_FACT_PREFILTER_THRESHOLD', '0.5'))
+
+# Cue category -> (pattern, log-odds weight); compiled into a single alternation
+_CUES = {
+    'name': (r"\bmy name(?:'s| is)\b|\bcall me\b|\bi(?:'m| am) called\b|\bname's\b", 4.0),
+    'location': (r"\bi (?:live|grew up) in\b|\bi(?:'m| am) (?:from|based in)\b|\bmoved to\b"
+                 r"|\bmy (?:city|country|hometown)\b", 3.5),
+    'age': (r"\b\d{1,2} (?:years?|yrs?) old\b|\bi(?:'m| am) \d{1,2}\b|\bmy birthday\b|\bi was born\b", 3.5),
+    'work': (r"\bi work\b|\bmy (?:job|boss|work|major|school|class)\b|\bi study\b|\bi(?:'m| am) studying\b"
+             r"|\bi(?:'m| am) an? (?:student|teacher|nurse|doctor|developer|programmer|engineer|artist"
+             r"|designer|writer|chef|cook|driver|manager|lawyer|musician)\b", 3.0),
+    'family': (r"\bmy (?:wife|husband|girlfriend|boyfriend|partner|mom|mum|mother|dad|father|sister"
+               r"|brother|son|daughter|kids?|children|family|grandma|grandpa|parents)\b", 2.5),
+    'pets': (r"\bmy (?:dog|cat|pet|puppy|kitten|bird|fish|hamster|rabbit|bunny)s?\b"
+             r"|\bi (?:have|own|got) an? (?:dog|cat|pet|puppy|kitten|bird|fish|hamster|rabbit|bunny)\b", 3.0),
+    'relationship': (r"\bi(?:'m| am) (?:married|single|engaged|divorced|dating|taken|in a relationship)\b", 3.0),
+    'preference': (r"\bi (?:really |totally |absolutely )?(?:love|like|enjoy|hate|adore|prefer)\b"
+                   r"|\bmy fav(?:ou?rite)?\b|\bi(?:'m| am) (?:really )?into\b|\bbig fan of\b", 2.0),
+}
+_CUE_PATTERN = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, (pattern, _) in _CUES.items()))
+_CUE_WEIGHTS = {name: weight for name, (_, weight) in _CUES.items()}
+_FIRST_PERSON = re.compile(r"\b(?:i|me|my|mine|myself|i'm|i've|i'd|i'll)\b")
+_SECOND_PERSON = re.compile(r"\b(?:you|your|you're|yours)\b")
+
+_BIAS = -2.5
+_FIRST_PERSON_WEIGHT = 0.5  # Per pronoun, capped
+_FIRST_PERSON_CAP = 3
+_QUESTION_WEIGHT = -1.5
+_SECOND_PERSON_WEIGHT = -0.75  # When "you" outnumbers "I"
+
+def score_message(text: str) -> Tuple[float, Tuple[str, ...]]:
+    """Probability that ``text`` states a personal fact, and the cue categories found."""
+    lowered = text.lower().replace('’', "'")
+    cues = tuple(sorted({m.lastgroup for m in _CUE_PATTERN.finditer(lowered)}))
+    first = len(_FIRST_PERSON.findall(lowered))
+    logit = _BIAS + sum(_CUE_WEIGHTS[c] for c in cues)
+    logit += _FIRST_PERSON_WEIGHT * min(first, _FIRST_PERSON_CAP)
+    if lowered.rstrip().endswith('?'):
+        logit += _QUESTION_WEIGHT
+    if len(_SECOND_PERSON.findall(lowered)) > first:
+        logit += _SECOND_PERSON_WEIGHT
+    return 1 / (1 + math.exp(-logit)), cues
+
+class FactPrefilter:
+    """Decides which messages are worth an LLM extraction, with counters."""
+
+    def __init__(self, threshold: float = FACT_PREFILTER_THRESHOLD):
+        self.threshold = threshold
+        self.stats = {'scored': 0, 'passed': 0, 'rejected': 0}
+        self.cue_hits: Dict[str, int] = {}
+
+    def check(self, text: str) -> bool:
+        """True if ``text`` should go to the LLM extractor."""
+        if self.threshold <= 0:
+            return True
+        probability, cues = score_message(text)
+        self.stats['scored'] += 1
+        for cue in cues:
+            self.cue_hits[cue] = self.cue_hits.get(cue, 0) + 1
+        if probability >= self.threshold:
+            self.stats['passed'] += 1
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def get_stats(self) -> Dict:
+        """Return counters, the pass rate and how often each cue category fired."""
+        scored = self.stats['scored']
+        return dict(self.stats, threshold=self.threshold,
+                    pass_rate=self.stats['passed'] / scored if scored else 0.0,
+                    cue_hits=dict(self.cue_hits))
@@ -1,13 +1,85 @@
 import os
+import gzip
 import json
 import re
-from collections import defaultdict, deque
-from typing import Dict, List, Any, Deque
+import sys
+import threading
+import time
+from collections import defaultdict, deque, OrderedDict
+from itertools import islice
+from datetime import datetime
+from typing import Dict, List, Any, Deque, Optional, Union
+from urllib.parse import quote, unquote
 
 CONVO_HISTORY_FILE = 'convo_history.json'
 # Store last 100 messages, but use a sliding window for context
 TOTAL_HISTORY_LENGTH = 9000000  # Total messages to store
 CONTEXT_WINDOW_SIZE = 9000000    # Messages to use for immediate context
+# Per-turn prompt window: the newest messages are offered verbatim (the prompt budget keeps
+# what fits), and those before them, back to the lookback, are sampled for important ones
+PROMPT_WINDOW_SIZE = int(os.getenv('YUMI_PROMPT_WINDOW', '60'))
+PROMPT_LOOKBACK = int(os.getenv('YUMI_PROMPT_LOOKBACK', '400'))
+
+# Append-only conversation log (one directory of segment files per context)
+CONVO_HISTORY_DIR = os.getenv('YUMI_HISTORY_DIR', 'convo_history')
+HISTORY_SEGMENT_BYTES = int(os.getenv('YUMI_HISTORY_SEGMENT_BYTES', str(256 * 1024)))
+HISTORY_FSYNC_INTERVAL = float(os.getenv('YUMI_HISTORY_FSYNC_INTERVAL', '1.0'))  # seconds
+HISTORY_COMPACT_MIN_SEGMENTS = int(os.getenv('YUMI_HISTORY_COMPACT_MIN_SEGMENTS', '4'))
+HISTORY_MAX_OPEN_FILES = 64
+# Hot-context cache: contexts are loaded from the log on first use and evicted LRU-first
+HISTORY_CACHE_CONTEXTS = int(os.getenv('YUMI_HISTORY_CACHE_CONTEXTS', '1000'))
+HISTORY_CACHE_MESSAGES = int(os.getenv('YUMI_HISTORY_CACHE_MESSAGES', '200000'))
+HISTORY_COMPACT_INTERVAL = float(os.getenv('YUMI_HISTORY_COMPACT_INTERVAL', '600'))  # seconds
+
+class RetentionPolicy:
+    """How long a context's messages stay in the hot log and in the cold archive.
+
+    Args:
+        hot_days: Messages older than this move to the compressed archive (0 = no TTL)
+        max_messages: Hot messages kept per context; older ones move to the archive (0 = no cap)
+        archive_days: Archived days older than this are deleted (0 = keep forever)
+    """
+
+    def __init__(self, hot_days: float = 0, max_messages: int = 0, archive_days: float = 0):
+        self.hot_days = hot_days
+        self.max_messages = max_messages
+        self.archive_days = archive_days
+
+    def __repr__(self) -> str:
+        return f"RetentionPolicy({self.hot_days}, {self.max_messages}, {self.archive_days})"
+
+def _parse_retention_overrides(spec: str) -> Dict[str, RetentionPolicy]:
+    """Parse "guild_id=hot_days:max_messages:archive_days,..." skipping malformed entries."""
+    overrides = {}
+    for entry in spec.split(','):
+        guild_id, _, values = entry.strip().partition('=')
+        parts = values.split(':')
+        if guild_id and len(parts) == 3 and all(p.replace('.', '', 1).isdigit() for p in parts):
+            overrides[guild_id] = RetentionPolicy(float(parts[0]), int(float(parts[1])), float(parts[2]))
+    return overrides
+
+# Tiered retention: hot log -> per-day gzip archive -> deleted
+DM_RETENTION = RetentionPolicy(
+    float(os.getenv('YUMI_RETENTION_DM_DAYS', '90')),
+    int(os.getenv('YUMI_RETENTION_DM_MESSAGES', '5000')),
+    float(os.getenv('YUMI_ARCHIVE_DM_DAYS', '0')),
+)
+GUILD_RETENTION = RetentionPolicy(
+    float(os.getenv('YUMI_RETENTION_GUILD_DAYS', '30')),
+    int(os.getenv('YUMI_RETENTION_GUILD_MESSAGES', '2000')),
+    float(os.getenv('YUMI_ARCHIVE_GUILD_DAYS', '365')),
+)
+# Per-guild overrides, e.g. "123456789=7:500:90"
+GUILD_RETENTION_OVERRIDES = _parse_retention_overrides(os.getenv('YUMI_RETENTION_GUILD_OVERRIDES', ''))
+
+def retention_policy(context_key: Any) -> RetentionPolicy:
+    """Return the retention policy for a context key (``user_dm`` or ``user_guild_channel``)."""
+    parts = str(context_key).split('_')
+    if parts[-1] == 'dm':
+        return DM_RETENTION
+    if len(parts) == 3:
+        return GUILD_RETENTION_OVERRIDES.get(parts[1], GUILD_RETENTION)
+    return GUILD_RETENTION
 
 def clean_response(response: str) -> str:
     """Clean the response of any fabricated dialogue and format issues."""
@@ -22,12 +94,201 @@ def clean_response(response: str) -> str:
     response = ' '.join(response.split())
     return response.strip()
 
-def get_relevant_history(history_queue: Deque, message_type: str = None) -> List[Dict[str, Any]]:
+# --- Message features ---
+# Bit flags computed once when a message is appended and stored with it, so
+# selecting relevant history never has to rescan message text.
+FEATURE_RECALL = 1
+FEATURE_QUESTION = 2
+FEATURE_STATUS = 4
+FEATURE_PREFERENCE = 8
+FEATURE_FACT = 16
+FEATURE_TOPIC_SHIFT = 32
+# "Continues the previous topic" flags, checked against the last status/preference/fact seen
+FEATURE_CONTINUES_STATUS = 64
+FEATURE_CONTINUES_PREFERENCE = 128
+FEATURE_CONTINUES_FACT = 256
+# Not a content feature: marks a record whose text was normalized when appended
+FEATURE_NORMALIZED = 512
+
+_CONTINUATIONS = {
+    FEATURE_STATUS: FEATURE_CONTINUES_STATUS,
+    FEATURE_PREFERENCE: FEATURE_CONTINUES_PREFERENCE,
+    FEATURE_FACT: FEATURE_CONTINUES_FACT,
+}
+
+def _keyword_pattern(words: List[str]):
+    """Compile a substring matcher equivalent to ``any(w in text for w in words)``."""
+    return re.compile('|'.join(re.escape(w) for w in words))
+
+_FEATURE_PATTERNS = [
+    (FEATURE_RECALL, _keyword_pattern(['recall', 'remember', 'what were we talking about'])),
+    (FEATURE_QUESTION, _keyword_pattern(['?', 'who', 'what', 'when', 'where', 'why', 'how'])),
+    (FEATURE_STATUS, _keyword_pattern(['at work', 'working', 'home', 'busy', 'free', 'available'])),
+    (FEATURE_PREFERENCE, _keyword_pattern(['love', 'hate', 'feel', 'think', 'believe', 'favorite', 'prefer', 'like', 'dislike'])),
+    (FEATURE_FACT, _keyword_pattern(['my', 'i am', "i'm", 'i like', 'i want', 'i have', 'i do'])),
+    (FEATURE_CONTINUES_STATUS, _keyword_pattern(['work', 'busy', 'free', 'time'])),
+    (FEATURE_CONTINUES_PREFERENCE, _keyword_pattern(['like', 'love', 'hate', 'feel'])),
+    (FEATURE_CONTINUES_FACT, _keyword_pattern(['i', 'my', 'me'])),
+]
+_TOPIC_SHIFT_PREFIXES = ('so', 'anyway', 'but', 'however', 'speaking of')
+
+def extract_features(content: str) -> int:
+    """Compute the feature flags used by get_relevant_history for a message's text."""
+    content = (content or '').lower()
+    flags = 0
+    for flag, pattern in _FEATURE_PATTERNS:
+        if pattern.search(content):
+            flags |= flag
+    if content.startswith(_TOPIC_SHIFT_PREFIXES):
+        flags |= FEATURE_TOPIC_SHIFT
+    return flags
+
+def message_features(msg: Union['Message', Dict[str, Any]]) -> int:
+    """Return a message's feature flags, computing and caching them if it predates them."""
+    if isinstance(msg, Message):
+        flags = msg.features
+        if flags is None:
+            flags = msg.features = extract_features(msg.content)
+        return flags
+    flags = msg.get('features')
+    if flags is None:
+        flags = extract_features(msg.get('content', ''))
+        msg['features'] = flags
+    return flags
+
+# --- Compact message records ---
+# Known roles are stored as an index into ROLES instead of a string per message
+ROLES = ('user', 'assistant', 'system')
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+_MESSAGE_KEYS = ('role', 'content', 'timestamp', 'features')
+_MISSING = object()
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    """Convert an ISO timestamp string (or epoch number) to float epoch seconds."""
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class Message:
+    """Compact in-memory record of one conversation message.
+
+    A slotted object replaces the per-message dict: the role is a code into
+    ROLES, the timestamp is float epoch seconds and the feature flags are a
+    plain int. The dict accessors used around the bot (``msg['content']``,
+    ``msg.get('role')``, ``'features' in msg``, ``dict(msg)``) keep working, and
+    to_dict() gives the JSON form written to the log, with an ISO timestamp
+    as before.
+
+    Args:
+        role: "user", "assistant" or "system" (other roles are kept as strings)
+        content: Message text
+        created: Epoch seconds the message was sent, if known
+        features: Cached feature flags, see extract_features
+    """
+
+    __slots__ = ('_role', 'content', 'created', 'features')
+
+    def __init__(self, role: str, content: str, created: Optional[float] = None,
+                 features: Optional[int] = None):
+        self.role = role
+        self.content = content
+        self.created = created
+        self.features = features
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Message':
+        """Build a record from a log/legacy message dict."""
+        return cls(data.get('role', ''), data.get('content', ''),
+                   _parse_timestamp(data.get('timestamp')), data.get('features'))
+
+    @property
+    def role(self) -> str:
+        role = self._role
+        return ROLES[role] if role.__class__ is int else role
+
+    @role.setter
+    def role(self, value: str) -> None:
+        code = _ROLE_CODES.get(value)
+        self._role = code if code is not None else sys.intern(value or '')
+
+    @property
+    def timestamp(self) -> Optional[str]:
+        """ISO form of ``created``, matching datetime.now().isoformat()."""
+        if self.created is None:
+            return None
+        return datetime.fromtimestamp(self.created).isoformat()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == 'content':
+            return self.content
+        if key == 'role':
+            return self.role
+        if key in ('timestamp', 'features'):
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == 'timestamp':
+            self.created = _parse_timestamp(value)
+        elif key in _MESSAGE_KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> List[str]:
+        return [key for key in _MESSAGE_KEYS if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Message, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Message) else other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Message({self.to_dict()!r})"
+
+def recent_messages(history_queue, count: int) -> List[Dict[str, Any]]:
+    """The last ``count`` messages in order, read from the tail so long histories cost nothing extra."""
+    if not history_queue or count <= 0:
+        return []
+    tail = list(islice(reversed(history_queue), count))
+    tail.reverse()
+    return tail
+
+def get_relevant_history(history_queue: Deque, message_type: str = None,
+                         window_size: int = CONTEXT_WINDOW_SIZE) -> List[Dict[str, Any]]:
     """Get relevant history based on message type and recency.
     
+    Runs in a single linear pass over the older messages using the feature flags
+    stored with each message, positions instead of ``list.index`` and a set of
+    selected positions instead of list membership checks.
+
     Args:
         history_queue: The full conversation history queue
         message_type: Optional filter for specific types of messages
+        window_size: Number of most recent messages always included
     
     Returns:
         List of relevant messages with priority to recent context
@@ -35,71 +296,59 @@ def get_relevant_history(history_queue: Deque, message_type: str = None) -> List
     if not history_queue:
         return []
 
-    # Convert deque to list for easier manipulation
+    # Convert deque to list once; deque indexing is O(n) away from the ends
     full_history = list(history_queue)
-    
+    split = max(0, len(full_history) - window_size)
+
     # Always include the most recent messages for immediate context
-    recent_context = full_history[-CONTEXT_WINDOW_SIZE:] if len(full_history) > CONTEXT_WINDOW_SIZE else full_history
-    
+    recent_context = full_history[split:]
+    if not split:
+        return recent_context
+
     # For the remaining history, sample important messages
-    older_history = full_history[:-CONTEXT_WINDOW_SIZE] if len(full_history) > CONTEXT_WINDOW_SIZE else []
     important_messages = []
-    
-    # Track the last few topics/statements to maintain continuity
-    last_topic = None
-    for msg in reversed(older_history):
-        content = msg.get('content', '').lower()
-        
+    selected = set()
+
+    def keep(idx: int) -> None:
+        if idx not in selected:
+            selected.add(idx)
+            important_messages.append(full_history[idx])
+
+    # Track the last topic to keep follow-up messages on the same subject
+    last_topic = 0
+    for idx in range(split - 1, -1, -1):
+        flags = message_features(full_history[idx])
+
         # Keep recall requests and their context (previous few messages)
-        if 'recall' in content or 'remember' in content or 'what were we talking about' in content:
-            idx = older_history.index(msg)
-            # Get previous context
-            start_idx = max(0, idx - 5)
-            important_messages.extend(older_history[start_idx:idx + 1])
-            
+        if flags & FEATURE_RECALL:
+            for context_idx in range(max(0, idx - 5), idx + 1):
+                keep(context_idx)
+
         # Keep questions and their answers
-        elif '?' in content or any(w in content for w in ['who', 'what', 'when', 'where', 'why', 'how']):
-            important_messages.append(msg)
-            # Try to get the answer too if it exists
-            idx = older_history.index(msg)
-            if idx + 1 < len(older_history):
-                important_messages.append(older_history[idx + 1])
-        
-        # Keep messages that indicate user status or activity
-        elif any(w in content for w in ['at work', 'working', 'home', 'busy', 'free', 'available']):
-            important_messages.append(msg)
-            last_topic = 'status'
-        
-        # Keep messages with emotional content or user preferences
-        elif any(w in content for w in ['love', 'hate', 'feel', 'think', 'believe', 'favorite', 'prefer', 'like', 'dislike']):
-            important_messages.append(msg)
-            last_topic = 'preferences'
-        
-        # Keep messages that might contain user facts
-        elif any(w in content for w in ['my', 'i am', "i'm", 'i like', 'i want', 'i have', 'i do']):
-            important_messages.append(msg)
-            last_topic = 'facts'
-            
-        # Keep topic transitions to maintain context
-        elif content.startswith(('so', 'anyway', 'but', 'however', 'speaking of')):
-            important_messages.append(msg)
-            # Include the previous message for context
-            idx = older_history.index(msg)
+        elif flags & FEATURE_QUESTION:
+            keep(idx)
+            if idx + 1 < split:
+                keep(idx + 1)
+
+        # Keep user status, preferences and facts, remembering the topic
+        elif flags & (FEATURE_STATUS | FEATURE_PREFERENCE | FEATURE_FACT):
+            keep(idx)
+            for topic in (FEATURE_STATUS, FEATURE_PREFERENCE, FEATURE_FACT):
+                if flags & topic:
+                    last_topic = topic
+                    break
+
+        # Keep topic transitions along with the message they follow
+        elif flags & FEATURE_TOPIC_SHIFT:
+            keep(idx)
             if idx > 0:
-                important_messages.append(older_history[idx - 1])
-        
+                keep(idx - 1)
+
         # If we're continuing a previous topic, include relevant messages
-        elif last_topic:
-            if (last_topic == 'status' and any(w in content for w in ['work', 'busy', 'free', 'time'])) or \
-               (last_topic == 'preferences' and any(w in content for w in ['like', 'love', 'hate', 'feel'])) or \
-               (last_topic == 'facts' and any(w in content for w in ['i', 'my', 'me'])):
-                important_messages.append(msg)
-
-    # Combine recent context with important older messages, removing duplicates
-    all_relevant = recent_context + [msg for msg in important_messages 
-                                   if msg not in recent_context]
-    
-    return all_relevant
+        elif last_topic and flags & _CONTINUATIONS[last_topic]:
+            keep(idx)
+
+    return recent_context + important_messages
 
 def process_message_queue(queue: Deque) -> List[Dict[str, Any]]:
     """Process a queue of messages to ensure proper conversation flow."""
@@ -132,36 +381,6 @@ def process_message_queue(queue: Deque) -> List[Dict[str, Any]]:
     
     return processed
 
-def load_convo_history():
-    """Load and clean conversation history."""
-    if os.path.exists(CONVO_HISTORY_FILE):
-        with open(CONVO_HISTORY_FILE, 'r', encoding='utf-8') as f:
-            raw_history = json.load(f)
-            convo_history = defaultdict(lambda: deque(maxlen=TOTAL_HISTORY_LENGTH))
-            
-            for k, v in raw_history.items():
-                try:
-                    key = int(k)
-                except ValueError:
-                    key = k
-                
-                # Clean and process the message queue
-                queue = deque(v, maxlen=TOTAL_HISTORY_LENGTH)
-                processed = process_message_queue(queue)
-                
-                # Clean responses and add to history
-                cleaned_messages = []
-                for msg in processed:
-                    if msg.get('role') == 'assistant':
-                        msg = dict(msg)
-                        msg['content'] = clean_response(msg['content'])
-                    if msg.get('content'):  # Only add non-empty messages
-                        cleaned_messages.append(msg)
-                
-                convo_history[key] = deque(cleaned_messages, maxlen=TOTAL_HISTORY_LENGTH)
-            return convo_history
-    return defaultdict(lambda: deque(maxlen=TOTAL_HISTORY_LENGTH))
-
 def format_message_for_context(msg: Dict[str, Any]) -> str:
     """Format a message for context in a way that preserves the conversation flow."""
     role = msg.get('role', '')
@@ -172,27 +391,729 @@ def format_message_for_context(msg: Dict[str, Any]) -> str:
     if role == 'user':
         return f"User said: {content}"
     elif role == 'assistant':
-        return f"Yumi replied: {clean_response(content)}"
+        if not msg.get('features', 0) & FEATURE_NORMALIZED:
+            content = clean_response(content)
+        return f"Yumi replied: {content}"
     return content
 
-def save_convo_history(convo_history):
-    """Save cleaned and processed conversation history."""
-    cleaned_history = defaultdict(list)
-    
-    for k, v in convo_history.items():
-        # Process and clean the message queue
-        processed = process_message_queue(v)
-        cleaned_messages = []
-        
-        for msg in processed:
-            if msg.get('role') == 'assistant':
-                msg = dict(msg)
-                msg['content'] = clean_response(msg['content'])
-            if msg.get('content'):  # Only save non-empty messages
-                cleaned_messages.append(msg)
-        
-        cleaned_history[k] = cleaned_messages
-    
-    serializable = {str(k): v for k, v in cleaned_history.items()}
-    with open(CONVO_HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(serializable, f, ensure_ascii=False, indent=2)
+def normalize_message(msg: Union['Message', Dict[str, Any]]) -> 'Message':
+    """Clean a message's text once and mark it FEATURE_NORMALIZED.
+
+    Assistant replies go through clean_response and user text is stripped;
+    feature flags are recomputed from the cleaned text. Records that are
+    already normalized are returned as they are, so loading, saving and
+    prompting never redo the regex work.
+    """
+    if not isinstance(msg, Message):
+        msg = Message.from_dict(msg)
+    if not (msg.features or 0) & FEATURE_NORMALIZED:
+        content = msg.content or ''
+        msg.content = clean_response(content) if msg.role == 'assistant' else content.strip()
+        msg.features = extract_features(msg.content) | FEATURE_NORMALIZED
+    return msg
+
+def _is_repeat(queue, msg: 'Message') -> bool:
+    """True for a user message identical to the one right before it (double sends)."""
+    if msg.role != 'user' or not queue:
+        return False
+    last = queue[-1]
+    return last.get('role') == 'user' and last.get('content') == msg.content
+
+def _parse_key(name: str) -> Any:
+    """Turn a context directory name back into the context key it was created for."""
+    key = unquote(name)
+    # int() accepts underscores, which would turn "user_guild_channel" keys into one number
+    return int(key) if key.isdigit() else key
+
+class HistoryLog:
+    """Append-only, segmented store for per-context conversation history.
+
+    Each context gets its own directory under ``root`` holding numbered segment
+    files of JSON lines and a small ``index.json`` with the message count and
+    byte size of every sealed segment. Appending a message writes one line to the
+    active segment, so persisting a message costs O(1) bytes no matter how much
+    history exists. ``flush`` fsyncs every segment touched since the previous
+    flush as one group, and ``compact`` merges sealed segments in the background.
+
+    ``compact`` also applies the context's RetentionPolicy: sealed messages past
+    the hot TTL or size cap (or already summarized) move to per-day gzip files
+    under ``<context>/archive/``, which stay readable through ``read_archive``
+    and ``export``.
+    """
+
+    def __init__(self, root: str = CONVO_HISTORY_DIR, segment_bytes: int = HISTORY_SEGMENT_BYTES,
+                 compact_min_segments: int = HISTORY_COMPACT_MIN_SEGMENTS,
+                 max_open_files: int = HISTORY_MAX_OPEN_FILES, retention=None):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.compact_min_segments = compact_min_segments
+        self.max_open_files = max_open_files
+        self.retention = retention or retention_policy
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._handles: 'OrderedDict[str, Any]' = OrderedDict()  # context dir -> open active segment
+        self._dirty = set()  # segment paths written since the last flush
+        self.stats = {
+            'appends': 0,
+            'bytes_written': 0,
+            'fsyncs': 0,
+            'segments_sealed': 0,
+            'compactions': 0,
+            'bytes_reclaimed': 0,
+            'messages_archived': 0,
+            'bytes_archived': 0,
+            'archive_files_expired': 0,
+            'archive_reads': 0,
+            'archive_read_seconds': 0.0,
+        }
+
+    # --- Paths and offset index ---
+    def _segment_path(self, name: str, seq: int) -> str:
+        return os.path.join(self.root, name, f'{seq:08d}.log')
+
+    def _names(self) -> List[str]:
+        try:
+            return [n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n))]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _scan_segment(path: str):
+        """Return (records, bytes) for the complete lines of a segment, ignoring a torn tail."""
+        count = size = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    count += 1
+                    size += len(line)
+        except FileNotFoundError:
+            pass
+        return count, size
+
+    def _rebuild_index(self, name: str) -> Dict[str, Any]:
+        """Recreate a missing or corrupt index from the segment files on disk."""
+        try:
+            files = os.listdir(os.path.join(self.root, name))
+        except FileNotFoundError:
+            files = []
+        seqs = sorted(int(fn[:-4]) for fn in files if fn.endswith('.log') and fn[:-4].isdigit())
+        index = {'sealed': [], 'active': seqs[-1] if seqs else 0, 'base': 0}
+        for seq in seqs[:-1]:
+            count, size = self._scan_segment(self._segment_path(name, seq))
+            index['sealed'].append([seq, count, size])
+        return index
+
+    def _load_index(self, name: str) -> Dict[str, Any]:
+        index = self._indexes.get(name)
+        if index is not None:
+            return index
+        try:
+            with open(os.path.join(self.root, name, 'index.json'), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            index = {
+                'sealed': [list(seg) for seg in stored['sealed']],
+                'active': int(stored['active']),
+                'base': int(stored.get('base', 0)),
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            index = self._rebuild_index(name)
+        # Only the active segment can be newer than the index, so replay just its tail
+        index['count'], index['size'] = self._scan_segment(self._segment_path(name, index['active']))
+        self._indexes[name] = index
+        return index
+
+    def _write_index(self, name: str, index: Dict[str, Any]) -> None:
+        path = os.path.join(self.root, name, 'index.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sealed': index['sealed'], 'active': index['active'], 'base': index['base']}, f)
+        os.replace(tmp_path, path)
+
+    # --- Writing ---
+    def _close_handle(self, name: str) -> None:
+        """Close a context's active segment; unsynced writes stay queued for the next flush."""
+        handle = self._handles.pop(name, None)
+        if handle is not None:
+            handle.close()
+
+    def _open_active(self, name: str, index: Dict[str, Any]):
+        handle = self._handles.get(name)
+        if handle is not None:
+            self._handles.move_to_end(name)
+            return handle
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        handle = open(self._segment_path(name, index['active']), 'ab')
+        if handle.tell() != index['size']:
+            # Drop a line torn by a crash before appending after it
+            handle.truncate(index['size'])
+        self._handles[name] = handle
+        while len(self._handles) > self.max_open_files:
+            self._close_handle(next(iter(self._handles)))
+        return handle
+
+    def _seal(self, name: str, index: Dict[str, Any]) -> None:
+        self._close_handle(name)
+        index['sealed'].append([index['active'], index['count'], index['size']])
+        index['active'] += 1
+        index['count'] = index['size'] = 0
+        self._write_index(name, index)
+        self.stats['segments_sealed'] += 1
+
+    def append(self, context_key: Any, message: Dict[str, Any]) -> None:
+        """Append one message to the end of a context's log."""
+        name = quote(str(context_key), safe='')
+        if isinstance(message, Message):
+            message = message.to_dict()
+        line = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            index = self._load_index(name)
+            if index['size'] and index['size'] + len(line) > self.segment_bytes:
+                self._seal(name, index)
+            handle = self._open_active(name, index)
+            handle.write(line)
+            index['count'] += 1
+            index['size'] += len(line)
+            self._dirty.add(handle.name)
+            self.stats['appends'] += 1
+            self.stats['bytes_written'] += len(line)
+
+    def flush(self) -> int:
+        """Fsync every segment written since the last flush as one group.
+
+        Buffers are handed to the OS under the lock, but the fsyncs themselves run
+        on duplicated descriptors outside it so appends are never blocked on disk.
+
+        Returns:
+            The number of segment files synced
+        """
+        fds = []
+        with self._lock:
+            open_paths = {handle.name: handle for handle in self._handles.values()}
+            for path in self._dirty:
+                handle = open_paths.get(path)
+                try:
+                    if handle is not None:
+                        handle.flush()
+                        fds.append(os.dup(handle.fileno()))
+                    else:
+                        fds.append(os.open(path, os.O_RDWR))
+                except OSError:
+                    pass  # Segment was compacted away in the meantime
+            self._dirty.clear()
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if fds:
+            self.stats['fsyncs'] += 1
+        return len(fds)
+
+    def close(self) -> None:
+        """Flush outstanding writes and close every open segment."""
+        self.flush()
+        with self._lock:
+            for name in list(self._handles):
+                self._close_handle(name)
+        self.flush()
+
+    # --- Reading ---
+    @staticmethod
+    def _read_segment(path: str, size: Optional[int] = None) -> List[Dict[str, Any]]:
+        messages = []
+        try:
+            with open(path, 'rb') as f:
+                data = f.read() if size is None else f.read(size)
+        except FileNotFoundError:
+            return messages
+        for line in data.splitlines():
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                continue
+        return messages
+
+    def keys(self) -> List[Any]:
+        """Return every context key that has a log on disk."""
+        return [_parse_key(name) for name in self._names()]
+
+    def base(self, context_key: Any) -> int:
+        """Absolute position of the oldest message still in the hot log."""
+        name = quote(str(context_key), safe='')
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.root, name)):
+                return 0
+            return self._load_index(name)['base']
+
+    def count(self, context_key: Any) -> int:
+        """Total messages ever appended to a context, including ones compacted away."""
+        name = quote(str(context_key), safe='')
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.root, name)):
+                return 0
+            index = self._load_index(name)
+            return index['base'] + sum(seg[1] for seg in index['sealed']) + index['count']
+
+    def read(self, context_key: Any, limit: Optional[int] = None, start: int = 0) -> List[Dict[str, Any]]:
+        """Read a context's messages, oldest first.
+
+        Args:
+            context_key: The conversation context to read
+            limit: Only return the last ``limit`` messages; whole segments before
+                them are skipped using the offset index
+            start: Skip messages before this absolute position (as counted by
+                ``count``), e.g. the ones already folded into a summary
+
+        Returns:
+            List of message dicts in the order they were appended
+        """
+        if limit is not None and limit <= 0:
+            return []
+        name = quote(str(context_key), safe='')
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.root, name)):
+                return []
+            index = self._load_index(name)
+            handle = self._handles.get(name)
+            if handle is not None:
+                handle.flush()
+            segments = index['sealed'] + [[index['active'], index['count'], index['size']]]
+
+            # Use the offset index to skip whole segments before ``start``
+            first, skipped = 0, 0
+            offset = max(0, start - index['base'])
+            while first < len(segments) - 1 and skipped + segments[first][1] <= offset:
+                skipped += segments[first][1]
+                first += 1
+            drop = offset - skipped
+
+            # ...and whole segments outside the last ``limit`` messages
+            if limit is not None:
+                tail, available = len(segments), 0
+                while tail > first and available < limit:
+                    tail -= 1
+                    available += segments[tail][1]
+                if tail > first:
+                    first, drop = tail, 0
+
+            messages = []
+            for seq, _count, size in segments[first:]:
+                messages.extend(self._read_segment(self._segment_path(name, seq), size))
+        messages = messages[drop:]
+        return messages[-limit:] if limit is not None else messages
+
+    # --- Summaries ---
+    def read_summary(self, context_key: Any) -> Dict[str, Any]:
+        """Return a context's rolling summary, or an empty dict if it has none."""
+        path = os.path.join(self.root, quote(str(context_key), safe=''), 'summary.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_summary(self, context_key: Any, summary: Dict[str, Any]) -> None:
+        """Atomically store a context's rolling summary next to its segments."""
+        ctx_dir = os.path.join(self.root, quote(str(context_key), safe=''))
+        os.makedirs(ctx_dir, exist_ok=True)
+        path = os.path.join(ctx_dir, 'summary.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    # --- Compaction ---
+    def _retention_due(self, name: str, sealed: List[List[int]], hot_count: int,
+                       base: int, policy: RetentionPolicy, now: float) -> bool:
+        """Cheaply tell whether retention would move any sealed message to the archive."""
+        if not sealed:
+            return False
+        if policy.max_messages and hot_count > policy.max_messages:
+            return True
+        # A segment's mtime is when its newest message was written
+        if policy.hot_days:
+            try:
+                oldest = os.path.getmtime(self._segment_path(name, sealed[0][0]))
+            except OSError:
+                oldest = now
+            if oldest < now - policy.hot_days * 86400:
+                return True
+        return self.read_summary(_parse_key(name)).get('covered', 0) > base
+
+    def _archive(self, name: str, messages: List[Dict[str, Any]]) -> int:
+        """Append messages to per-day gzip files of a context's archive.
+
+        Each call adds one gzip member to the day's file; readers see the
+        members as a single stream.
+
+        Returns:
+            Compressed bytes written
+        """
+        by_day: Dict[str, List[Dict[str, Any]]] = OrderedDict()
+        day = 'undated'
+        for msg in messages:
+            ts = _parse_timestamp(msg.get('timestamp'))
+            if ts is not None:
+                day = datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+            by_day.setdefault(day, []).append(msg)
+
+        archive_dir = os.path.join(self.root, name, 'archive')
+        os.makedirs(archive_dir, exist_ok=True)
+        written = 0
+        for day, day_messages in by_day.items():
+            path = os.path.join(archive_dir, day + '.jsonl.gz')
+            with open(path, 'ab') as raw:
+                before = raw.tell()
+                with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                    for msg in day_messages:
+                        f.write((json.dumps(msg, ensure_ascii=False) + '\n').encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+                written += raw.tell() - before
+        return written
+
+    def _archive_days(self, name: str) -> List[str]:
+        try:
+            return sorted(f[:-len('.jsonl.gz')] for f in os.listdir(os.path.join(self.root, name, 'archive'))
+                          if f.endswith('.jsonl.gz'))
+        except FileNotFoundError:
+            return []
+
+    def _expire_archive(self, name: str, policy: RetentionPolicy, now: float) -> int:
+        """Delete archived days older than the policy's archive TTL."""
+        if not policy.archive_days:
+            return 0
+        cutoff = datetime.fromtimestamp(now - policy.archive_days * 86400).strftime('%Y-%m-%d')
+        expired = 0
+        for day in self._archive_days(name):
+            if day < cutoff:
+                os.remove(os.path.join(self.root, name, 'archive', day + '.jsonl.gz'))
+                expired += 1
+        self.stats['archive_files_expired'] += expired
+        return expired
+
+    def read_archive(self, context_key: Any, since: Optional[str] = None,
+                     until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Read a context's archived messages, oldest first.
+
+        Args:
+            context_key: The conversation context to read
+            since: First day to include, as "YYYY-MM-DD"
+            until: Last day to include, as "YYYY-MM-DD"
+
+        Returns:
+            List of archived message dicts
+        """
+        started = time.perf_counter()
+        name = quote(str(context_key), safe='')
+        messages = []
+        days = self._archive_days(name)
+        if since or until:
+            days = [d for d in days if d != 'undated' and (not since or d >= since) and (not until or d <= until)]
+        else:
+            # Undated messages were archived before any dated one
+            days = ['undated'] * ('undated' in days) + [d for d in days if d != 'undated']
+        for day in days:
+            try:
+                with gzip.open(os.path.join(self.root, name, 'archive', day + '.jsonl.gz'), 'rb') as f:
+                    data = f.read()
+            except (OSError, EOFError):
+                continue  # Missing, or a member torn by a crash mid-write
+            for line in data.splitlines():
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    continue
+        self.stats['archive_reads'] += 1
+        self.stats['archive_read_seconds'] += time.perf_counter() - started
+        return messages
+
+    def export(self, context_key: Any) -> List[Dict[str, Any]]:
+        """Every stored message of a context, archived and hot, oldest first."""
+        return self.read_archive(context_key) + self.read(context_key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return log counters plus the average archive read latency."""
+        reads = self.stats['archive_reads']
+        return dict(
+            self.stats,
+            archive_read_ms=self.stats['archive_read_seconds'] * 1000 / reads if reads else 0.0,
+        )
+
+    def compact(self, context_key: Any = None) -> int:
+        """Merge sealed segments and apply each context's retention policy.
+
+        Sealed segments are immutable, so they are read and rewritten without
+        holding the lock; only the final swap blocks appends. Messages past the
+        policy's hot TTL or size cap, beyond the last TOTAL_HISTORY_LENGTH, or
+        already folded into the context's rolling summary move to the cold
+        archive while merging. The active segment always stays hot.
+
+        Args:
+            context_key: Compact only this context instead of every context
+
+        Returns:
+            Number of bytes reclaimed on disk
+        """
+        names = [quote(str(context_key), safe='')] if context_key is not None else self._names()
+        reclaimed = 0
+        now = time.time()
+        with self._compact_lock:
+            for name in names:
+                with self._lock:
+                    if not os.path.isdir(os.path.join(self.root, name)):
+                        continue
+                    index = self._load_index(name)
+                    sealed = [list(seg) for seg in index['sealed']]
+                    active_count = index['count']
+                    base = index['base']
+                policy = self.retention(_parse_key(name))
+                self._expire_archive(name, policy, now)
+                hot_count = sum(seg[1] for seg in sealed) + active_count
+                if (len(sealed) < self.compact_min_segments
+                        and not self._retention_due(name, sealed, hot_count, base, policy, now)):
+                    continue
+
+                messages = []
+                for seq, _count, _size in sealed:
+                    messages.extend(self._read_segment(self._segment_path(name, seq)))
+                total = len(messages)
+                # Messages folded into the rolling summary are represented there already
+                covered = self.read_summary(_parse_key(name)).get('covered', 0)
+                dropped = min(total, max(0, covered - base))
+                keep = max(0, TOTAL_HISTORY_LENGTH - active_count)
+                if policy.max_messages:
+                    keep = min(keep, max(0, policy.max_messages - active_count))
+                dropped = max(dropped, total - keep)
+                if policy.hot_days:
+                    cutoff = now - policy.hot_days * 86400
+                    while dropped < total:
+                        ts = _parse_timestamp(messages[dropped].get('timestamp'))
+                        if ts is not None and ts >= cutoff:
+                            break
+                        dropped += 1
+                if dropped:
+                    self.stats['bytes_archived'] += self._archive(name, messages[:dropped])
+                    self.stats['messages_archived'] += dropped
+                messages = messages[dropped:]
+
+                target_seq = sealed[-1][0]
+                target_path = self._segment_path(name, target_seq)
+                tmp_path = target_path + '.compact'
+                new_size = 0
+                with open(tmp_path, 'wb') as f:
+                    for msg in messages:
+                        line = (json.dumps(msg, ensure_ascii=False) + '\n').encode('utf-8')
+                        f.write(line)
+                        new_size += len(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                with self._lock:
+                    index = self._indexes[name]
+                    if index['sealed'][:len(sealed)] != sealed:
+                        os.remove(tmp_path)
+                        continue
+                    if messages:
+                        os.replace(tmp_path, target_path)
+                        merged = [[target_seq, len(messages), new_size]]
+                    else:
+                        os.remove(tmp_path)
+                        os.remove(target_path)
+                        merged = []
+                    for seq, _count, _size in sealed[:-1]:
+                        path = self._segment_path(name, seq)
+                        os.remove(path)
+                        self._dirty.discard(path)
+                    self._dirty.discard(target_path)
+                    index['sealed'] = merged + index['sealed'][len(sealed):]
+                    index['base'] += dropped
+                    self._write_index(name, index)
+                reclaimed += sum(seg[2] for seg in sealed) - new_size
+                self.stats['compactions'] += 1
+        self.stats['bytes_reclaimed'] += reclaimed
+        return reclaimed
+
+HISTORY_LOG = HistoryLog()
+
+def migrate_legacy_history(path: str = CONVO_HISTORY_FILE, log: HistoryLog = None) -> int:
+    """Import a legacy single-file ``convo_history.json`` into the append-only log.
+
+    Messages are normalized on the way in, like append_message does, and the
+    file is renamed to ``<path>.migrated`` afterwards so it is only parsed once.
+
+    Returns:
+        Number of messages imported
+    """
+    log = log or HISTORY_LOG
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        raw_history = json.load(f)
+    imported = 0
+    for k, messages in raw_history.items():
+        last = deque(maxlen=1)
+        for record in messages:
+            msg = normalize_message(record)
+            if not msg.content or _is_repeat(last, msg):
+                continue
+            log.append(k, msg)
+            last.append(msg)
+            imported += 1
+    log.flush()
+    os.replace(path, path + '.migrated')
+    print(f"[History] Migrated {imported} messages from {path} into {log.root}")
+    return imported
+
+class ConversationHistory(deque):
+    """A context's recent messages plus the rolling summary of everything before them."""
+
+    def __init__(self, messages=(), maxlen: int = TOTAL_HISTORY_LENGTH, summary: str = ''):
+        super().__init__(messages, maxlen)
+        self.summary = summary
+
+def _load_context(log: HistoryLog, context_key: Any, limit: int, start: int = 0) -> List[Message]:
+    """Read one context from the log.
+
+    Records normalized on append are used exactly as stored. Only records
+    written before normalization existed are cleaned here, and dropped if
+    empty or a repeated user message.
+    """
+    messages = []
+    for record in log.read(context_key, limit=limit, start=start):
+        msg = Message.from_dict(record)
+        if not (msg.features or 0) & FEATURE_NORMALIZED:
+            msg = normalize_message(msg)
+            if not msg.content or _is_repeat(messages, msg):
+                continue
+        messages.append(msg)
+    return messages
+
+class HistoryManager:
+    """Dict-like view of conversation history that keeps only hot contexts in memory.
+
+    A context is read from the append-only log the first time its key is
+    touched (only the turns after its rolling summary) and then kept in an
+    LRU cache. Least recently used contexts are
+    evicted once more than ``max_contexts`` contexts or ``max_messages``
+    messages are resident; nothing is lost because every message is already
+    in the log (see append_message). Missing contexts behave like a
+    defaultdict and come back as empty ConversationHistory deques.
+    """
+
+    def __init__(self, log: HistoryLog = None, max_contexts: int = HISTORY_CACHE_CONTEXTS,
+                 max_messages: int = HISTORY_CACHE_MESSAGES):
+        self.log = log or HISTORY_LOG
+        self.max_contexts = max_contexts
+        self.max_messages = max_messages
+        self._cache: 'OrderedDict[Any, Deque]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __getitem__(self, context_key: Any) -> Deque:
+        queue = self._cache.get(context_key)
+        if queue is not None:
+            self.stats['hits'] += 1
+            self._cache.move_to_end(context_key)
+            return queue
+        self.stats['misses'] += 1
+        limit = min(TOTAL_HISTORY_LENGTH, self.max_messages)
+        # Turns already folded into the rolling summary are not loaded again
+        summary = self.log.read_summary(context_key)
+        queue = ConversationHistory(
+            _load_context(self.log, context_key, limit, start=summary.get('covered', 0)),
+            summary=summary.get('text', ''),
+        )
+        self._cache[context_key] = queue
+        self._evict()
+        return queue
+
+    def invalidate(self, context_key: Any) -> None:
+        """Drop a context from memory so its next use reloads it from the log."""
+        self._cache.pop(context_key, None)
+
+    def __setitem__(self, context_key: Any, queue: Deque) -> None:
+        self._cache[context_key] = queue
+        self._cache.move_to_end(context_key)
+        self._evict()
+
+    def __delitem__(self, context_key: Any) -> None:
+        del self._cache[context_key]
+
+    def __contains__(self, context_key: Any) -> bool:
+        return context_key in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def get(self, context_key: Any, default=None):
+        """Return a resident context without loading it from disk."""
+        return self._cache.get(context_key, default)
+
+    def keys(self):
+        return self._cache.keys()
+
+    def items(self):
+        return self._cache.items()
+
+    def all_keys(self) -> List[Any]:
+        """Every context key with history, resident or not."""
+        return self.log.keys()
+
+    @property
+    def resident_messages(self) -> int:
+        return sum(len(queue) for queue in self._cache.values())
+
+    def _evict(self) -> None:
+        resident = self.resident_messages
+        # Never evict the context that was just touched
+        while len(self._cache) > 1 and (len(self._cache) > self.max_contexts or resident > self.max_messages):
+            _key, queue = self._cache.popitem(last=False)
+            resident -= len(queue)
+            self.stats['evictions'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache counters along with the current resident size."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+            resident_contexts=len(self._cache),
+            resident_messages=self.resident_messages,
+        )
+
+def load_convo_history() -> HistoryManager:
+    """Open conversation history; contexts are loaded lazily as they are used."""
+    migrate_legacy_history()
+    return HistoryManager(HISTORY_LOG)
+
+def append_message(convo_history, context_key, message: Union[Message, Dict[str, Any]]) -> bool:
+    """Add a message to a context's in-memory history and append it to the log.
+
+    This is the only place message text is normalized (see normalize_message):
+    the cleaned text, its feature flags and the normalized mark are stored
+    once, so later loads are plain deserialization. Empty messages and
+    repeated user messages (double sends) are not stored.
+
+    Returns:
+        True if the message was stored
+    """
+    message = normalize_message(message)
+    queue = convo_history[context_key]
+    if not message.content or _is_repeat(queue, message):
+        return False
+    queue.append(message)
+    HISTORY_LOG.append(context_key, message)
+    return True
+
+def save_convo_history(convo_history=None):
+    """Make appended conversation history durable.
+
+    Messages are written to the log as they are appended, so this no longer
+    rewrites anything; it only group-fsyncs the segments touched since the last call.
+    """
+    HISTORY_LOG.flush()
@@ -0,0 +1,68 @@
+"""
+Shared, pooled HTTP clients for the bot's backends.
+
+One long-lived aiohttp session per backend, opened in setup_hook and closed on shutdown.
+"""
+
+import asyncio
+import os
+from typing import Dict, Tuple
+
+import aiohttp
+
+HTTP_POOL_LIMIT = int(os.getenv('YUMI_HTTP_POOL_LIMIT', '64'))  # Open connections per backend
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('YUMI_HTTP_POOL_LIMIT_PER_HOST', '16'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('YUMI_HTTP_KEEPALIVE_TIMEOUT', '60'))  # seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv('YUMI_HTTP_CONNECT_TIMEOUT', '10'))  # seconds
+HTTP_TIMEOUT = float(os.getenv('YUMI_HTTP_TIMEOUT', '120'))  # Default total timeout per request
+
+# Backends the bot talks to; each gets its own pool
+BACKEND_OLLAMA = 'ollama'
+BACKEND_WEB = 'web'
+
+class HttpClients:
+    """One keep-alive aiohttp.ClientSession per backend, bound to the running loop."""
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = {}
+
+    def get(self, backend: str = BACKEND_OLLAMA) -> aiohttp.ClientSession:
+        """Return the backend's shared session, creating it if needed.
+
+        Must be called from a coroutine. A session left over from another
+        (closed) event loop is replaced, since aiohttp sessions are loop-bound.
+        """
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(backend)
+        if entry is not None and not entry[0].closed and entry[1] is loop:
+            return entry[0]
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        self._sessions[backend] = (session, loop)
+        return session
+
+    async def start(self, *backends: str) -> None:
+        """Open sessions up front (called from the bot's setup_hook)."""
+        for backend in backends or (BACKEND_OLLAMA, BACKEND_WEB):
+            self.get(backend)
+
+    async def close(self) -> None:
+        """Close every session and its pooled connections."""
+        sessions, self._sessions = self._sessions, {}
+        for session, loop in sessions.values():
+            if not session.closed and loop is asyncio.get_running_loop():
+                await session.close()
+
+HTTP_CLIENTS = HttpClients()
+
+def get_session(backend: str = BACKEND_OLLAMA) -> aiohttp.ClientSession:
+    """Shortcut for ``HTTP_CLIENTS.get(backend)``."""
+    return HTTP_CLIENTS.get(backend)
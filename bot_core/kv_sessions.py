@@ -0,0 +1,111 @@
+"""
+Conversation sessions that reuse Ollama's KV context between turns.
+
+A session continues only while the prompt fingerprint and last exchange match what the model has seen.
+"""
+
+import os
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+KV_SESSIONS_ENABLED = os.getenv('YUMI_KV_SESSIONS', 'true').lower() in ('1', 'true', 'yes')
+KV_SESSION_LIMIT = int(os.getenv('YUMI_KV_SESSION_LIMIT', '512'))  # Sessions kept in memory
+KV_SESSION_TTL = float(os.getenv('YUMI_KV_SESSION_TTL', '1800'))  # Idle seconds; match keep-alive
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps the model loaded
+
+class KVSession:
+    """Ollama context tokens for one conversation.
+
+    ``context`` is taken by llm.py when it builds a request and filled in
+    again only by a successful generation, so a failed or interrupted turn
+    leaves the session empty. ``backend`` is the server holding the warm cache.
+    """
+
+    __slots__ = ('key', 'fingerprint', 'anchor', 'context', 'backend', 'turns', 'used')
+
+    def __init__(self, key: Any, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.anchor: Optional[str] = None  # Digest of the exchange the context ends with
+        self.context: Optional[array] = None
+        self.backend: Optional[str] = None
+        self.turns = 0
+        self.used = time.monotonic()
+
+    def set_context(self, tokens, backend: Optional[str] = None) -> None:
+        self.context = array('i', tokens) if tokens else None
+        if backend is not None:
+            self.backend = backend
+
+    def __len__(self) -> int:
+        return len(self.context) if self.context is not None else 0
+
+class KVSessionStore:
+    """LRU of conversation sessions with reuse/invalidation counters."""
+
+    def __init__(self, limit: int = KV_SESSION_LIMIT, ttl: float = KV_SESSION_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._sessions: 'OrderedDict[Any, KVSession]' = OrderedDict()
+        self.stats = {'reused': 0, 'started': 0, 'tokens_reused': 0}
+        self.invalidations: Dict[str, int] = {}
+
+    def invalidate(self, key: Any, reason: str) -> None:
+        """Forget a conversation's session."""
+        if self._sessions.pop(key, None) is not None:
+            self.invalidations[reason] = self.invalidations.get(reason, 0) + 1
+
+    def checkout(self, key: Any, fingerprint: str, anchor: Optional[str]) -> KVSession:
+        """Return the session to use for the next turn.
+
+        The stored session is returned if it is still valid for this
+        fingerprint and previous exchange; otherwise a fresh one (no context,
+        so the full prompt is sent).
+        """
+        session = self._sessions.get(key)
+        if session is not None:
+            reason = None
+            if time.monotonic() - session.used > self.ttl:
+                reason = 'expired'
+            elif session.fingerprint != fingerprint:
+                reason = 'prompt_changed'
+            elif anchor is None or session.anchor != anchor:
+                reason = 'history_changed'
+            if reason is None and session.context is not None:
+                session.used = time.monotonic()
+                self._sessions.move_to_end(key)
+                self.stats['reused'] += 1
+                self.stats['tokens_reused'] += len(session)
+                return session
+            self.invalidate(key, reason or 'empty')
+        self.stats['started'] += 1
+        return KVSession(key, fingerprint)
+
+    def commit(self, session: KVSession, anchor: str) -> None:
+        """Keep a session whose context now ends with the exchange ``anchor``."""
+        if session.context is None:
+            self.invalidate(session.key, 'no_context')
+            return
+        session.anchor = anchor
+        session.turns += 1
+        session.used = time.monotonic()
+        self._sessions[session.key] = session
+        self._sessions.move_to_end(session.key)
+        while len(self._sessions) > self.limit:
+            self._sessions.popitem(last=False)
+            self.invalidations['evicted'] = self.invalidations.get('evicted', 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return counters, reuse rate and resident sessions/tokens."""
+        turns = self.stats['reused'] + self.stats['started']
+        return dict(
+            self.stats,
+            reuse_rate=self.stats['reused'] / turns if turns else 0.0,
+            sessions=len(self._sessions),
+            resident_tokens=sum(len(s) for s in self._sessions.values()),
+            invalidations=dict(self.invalidations),
+        )
+
+KV_SESSIONS = KVSessionStore()
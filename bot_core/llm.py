@@ -5,15 +5,51 @@ import aiohttp
 import time
 import httpx
 import asyncio
-from typing import Tuple, Optional, Dict, List
+import hashlib
+import random
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Tuple, Optional, Dict, List
+
+from .http_client import get_session, BACKEND_OLLAMA
+from .backends import OLLAMA_POOL, OLLAMA_URL, Backend, BackendUnavailable  # OLLAMA_URL kept for importers
+from .scheduler import LLM_SCHEDULER, PRIORITY_INTERACTIVE, PRIORITY_SUMMARY
+from .kv_sessions import KV_SESSIONS, KVSession, OLLAMA_KEEP_ALIVE
+from .prompt import (
+    PromptSection,
+    assemble_prompt,
+    estimate_tokens,
+    format_turn,
+    get_context_budget,
+    PRIORITY_SYSTEM,
+    PRIORITY_PERSONA,
+    PRIORITY_FACTS,
+    PRIORITY_SUMMARY,
+    PRIORITY_RECENT_HISTORY,
+    PRIORITY_QA,
+    PRIORITY_IMPORTANT_HISTORY,
+)
 
 # Load environment variables for Ollama configuration
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://10.0.0.28:11434/api/generate")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistralrp")
 OLLAMA_TEMPERATURE = float(os.getenv("OLLAMA_TEMPERATURE", "0.9"))
 OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "512"))
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+RETRY_DELAY = 1  # seconds; doubles with every attempt, with jitter
+# Adaptive timeouts: a multiple of the backend's recent p95 latency, clamped to these bounds
+LLM_TIMEOUT_MIN = float(os.getenv('YUMI_LLM_TIMEOUT_MIN', '5'))
+LLM_TIMEOUT_MAX = float(os.getenv('YUMI_LLM_TIMEOUT_MAX', '30'))
+LLM_TIMEOUT_FACTOR = float(os.getenv('YUMI_LLM_TIMEOUT_FACTOR', '3'))
+# Send a second copy of a slow request to another backend after this latency percentile (0 disables)
+LLM_HEDGE_PERCENTILE = float(os.getenv('YUMI_LLM_HEDGE_PERCENTILE', '0.95'))
+QA_CONTEXT_PAIRS = 5  # Q&A examples offered to the prompt assembler
+
+# User-facing generations currently running (background work waits for zero)
+_interactive_inflight = 0
+
+# Single-flight: identical requests in flight at the same time share one Ollama call
+_inflight_requests: Dict[str, asyncio.Future] = {}
+SINGLE_FLIGHT_STATS = {'requests': 0, 'coalesced': 0}
+HEDGE_STATS = {'sent': 0, 'won': 0}
 
 def validate_response(response: str, user_message: str) -> Tuple[bool, str]:
     """Validate the LLM response for quality and appropriateness."""
@@ -25,15 +61,110 @@ def validate_response(response: str, user_message: str) -> Tuple[bool, str]:
         return False, "Response matches user message"
     return True, "OK"
 
+FALLBACK_RESPONSES = {
+    "connection": "I'm having trouble connecting to my language model right now. Could you please try again in a moment?",
+    "timeout": "I'm taking longer than usual to process your message. Could you please try again?",
+    "validation": "I wasn't able to generate a good response. Could you please rephrase your message?",
+    "default": "I apologize, but I'm having some technical difficulties. Could you please try again?"
+}
+
 def get_fallback_response(error_type: str) -> str:
     """Get a fallback response based on the type of error."""
-    fallbacks = {
-        "connection": "I'm having trouble connecting to my language model right now. Could you please try again in a moment?",
-        "timeout": "I'm taking longer than usual to process your message. Could you please try again?",
-        "validation": "I wasn't able to generate a good response. Could you please rephrase your message?",
-        "default": "I apologize, but I'm having some technical difficulties. Could you please try again?"
+    return FALLBACK_RESPONSES.get(error_type, FALLBACK_RESPONSES["default"])
+
+def is_fallback_response(text: str) -> bool:
+    """True if ``text`` is one of the canned error replies rather than a generation."""
+    return text in FALLBACK_RESPONSES.values()
+
+def _build_params(
+    user_message: str,
+    system_prompt: str,
+    qa_pairs: Optional[Dict] = None,
+    history: Optional[List] = None,
+    temperature: Optional[float] = None,
+    num_predict: Optional[int] = None,
+    user_facts: Optional[Dict] = None,
+    convo_history: Optional[List] = None,
+    persona_prompt: Optional[str] = None,
+    important_history: Optional[List] = None,
+    summary: Optional[str] = None
+) -> Dict:
+    """Build the Ollama generate request for a chat reply.
+
+    The prompt is assembled within the model's context budget: the system
+    prompt (for persona replies, the precompiled persona prefix) is always
+    kept, then persona, user facts, the rolling conversation summary, the most
+    recent history, Q&A examples and older important history are admitted in
+    that order.
+    """
+    if qa_pairs is None:
+        qa_pairs = {}
+    num_predict = num_predict or OLLAMA_NUM_PREDICT
+    context_tokens = get_context_budget(OLLAMA_MODEL)
+
+    # Rendered in this order: the fixed prefix first, then the variable sections
+    # from least to most volatile so backend prefix caching covers as much as possible
+    sections = [
+        PromptSection('persona', [persona_prompt], PRIORITY_PERSONA),
+        PromptSection('system', [system_prompt], PRIORITY_SYSTEM, required=True),
+        PromptSection('facts', [f"{k.capitalize()}: {v}" for k, v in (user_facts or {}).items()],
+                      PRIORITY_FACTS, header="User facts: ", separator=", "),
+        PromptSection('summary', [summary], PRIORITY_SUMMARY,
+                      header="Summary of the conversation so far:\n"),
+        PromptSection('important_history', [str(msg) for msg in important_history or []],
+                      PRIORITY_IMPORTANT_HISTORY, header="Earlier in this conversation:\n"),
+        PromptSection('recent_history', [str(msg) for msg in convo_history or []],
+                      PRIORITY_RECENT_HISTORY, header="Recent conversation:\n", keep='tail'),
+        # Retrieved per message, so the most volatile section of all
+        PromptSection('qa', [f"Q: {q}\nA: {a}" for q, a in islice(qa_pairs.items(), QA_CONTEXT_PAIRS)],
+                      PRIORITY_QA, header="Example exchanges:\n"),
+    ]
+    # Leave room in the context window for the generated reply
+    full_prompt = assemble_prompt(user_message, sections, context_tokens - num_predict)
+
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": full_prompt,
+        "temperature": temperature or OLLAMA_TEMPERATURE,
+        "num_predict": num_predict,
+        "stream": False,
+        "options": {"num_ctx": context_tokens}
     }
-    return fallbacks.get(error_type, fallbacks["default"])
+
+def request_fingerprint(params: Dict) -> str:
+    """Hash of everything Ollama sees in a request (model, prompt, sampling options)."""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+async def _single_flight(params: Dict, call: Callable[[], Awaitable]):
+    """Run ``call`` once for all concurrent callers with identical ``params``.
+
+    The first caller starts the request; callers arriving while it is in flight
+    wait for the same result instead of sending their own. The shared request
+    is shielded, so a waiter being cancelled does not cancel it for the others.
+    """
+    key = request_fingerprint(params)
+    SINGLE_FLIGHT_STATS['requests'] += 1
+    future = _inflight_requests.get(key)
+    if future is not None and not future.done():
+        SINGLE_FLIGHT_STATS['coalesced'] += 1
+    else:
+        future = asyncio.ensure_future(call())
+        _inflight_requests[key] = future
+        future.add_done_callback(lambda done: _forget_request(key, done))
+    return await asyncio.shield(future)
+
+def _forget_request(key: str, future: asyncio.Future) -> None:
+    """Drop a finished request so later identical calls go to Ollama again."""
+    if _inflight_requests.get(key) is future:
+        del _inflight_requests[key]
+
+def get_single_flight_stats() -> Dict[str, float]:
+    """Return how many generate calls were made and how many shared another call's request."""
+    stats = dict(SINGLE_FLIGHT_STATS)
+    stats['coalesce_rate'] = stats['coalesced'] / stats['requests'] if stats['requests'] else 0.0
+    stats['in_flight'] = len(_inflight_requests)
+    return stats
 
 async def generate_llm_response(
     user_message: str,
@@ -43,73 +174,311 @@ async def generate_llm_response(
     temperature: Optional[float] = None,
     num_predict: Optional[int] = None,
     user_facts: Optional[Dict] = None,
-    convo_history: Optional[List] = None
+    convo_history: Optional[List] = None,
+    persona_prompt: Optional[str] = None,
+    important_history: Optional[List] = None,
+    summary: Optional[str] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    tenant: Optional[str] = None,
+    kv_session: Optional[KVSession] = None
 ) -> str:
-    """Generate a response using the Ollama LLM asynchronously."""
-    if qa_pairs is None:
-        qa_pairs = {}
+    """Generate a response using the Ollama LLM asynchronously.
 
-    context = ""
+    ``priority`` and ``tenant`` (see scheduler.tenant_for) decide when the
+    request gets one of the backend's slots. With a ``kv_session`` (see
+    kv_sessions.py) that already holds context, only the new user turn is
+    sent; the context Ollama returns is stored back on the session.
+    """
+    params = _build_params(
+        user_message, system_prompt, qa_pairs=qa_pairs, history=history,
+        temperature=temperature, num_predict=num_predict, user_facts=user_facts,
+        convo_history=convo_history, persona_prompt=persona_prompt,
+        important_history=important_history, summary=summary
+    )
+    params = _apply_session(params, user_message, kv_session)
 
-    # Add user facts to context
-    if user_facts:
-        facts_str = ", ".join(f"{k.capitalize()}: {v}" for k, v in user_facts.items())
-        context += f"User facts: {facts_str}\n"
+    global _interactive_inflight
+    _interactive_inflight += 1
+    try:
+        return await _single_flight(params, lambda: _generate_with_retries(
+            params, user_message, priority=priority, tenant=tenant, kv_session=kv_session))
+    finally:
+        _interactive_inflight -= 1
 
-    # Add Q&A pairs
-    if qa_pairs:
-        for q, a in list(qa_pairs.items())[:5]:
-            context += f"Q: {q}\nA: {a}\n"
+def _apply_session(params: Dict, user_message: str, kv_session: Optional[KVSession]) -> Dict:
+    """Turn a full-prompt request into a continuation of the session's KV context.
 
-    # Add conversation history
-    if convo_history:
-        context += "\nRecent conversation:\n"
-        for msg in convo_history[-5:]:  # Last 5 messages
-            context += f"{msg}\n"
+    Falls back to the full prompt (and drops the old context) when there is
+    no context yet or the continued conversation would overflow the model's
+    window.
+    """
+    if kv_session is None:
+        return params
+    params = dict(params)
+    if OLLAMA_KEEP_ALIVE:
+        params["keep_alive"] = OLLAMA_KEEP_ALIVE
+    context, kv_session.context = kv_session.context, None  # Only a successful reply sets it again
+    if not context:
+        return params
+    turn = format_turn(user_message)
+    if len(context) + estimate_tokens(turn) + params["num_predict"] > params["options"]["num_ctx"]:
+        KV_SESSIONS.invalidate(kv_session.key, 'overflow')
+        return params
+    params["prompt"] = turn
+    params["context"] = list(context)
+    return params
 
-    full_prompt = f"{system_prompt}\n\nContext:\n{context}\n\nUser: {user_message}\nYumi:"
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so retries from many users don't arrive together."""
+    return RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.0)
 
-    params = {
-        "model": OLLAMA_MODEL,
-        "prompt": full_prompt,
-        "temperature": temperature or OLLAMA_TEMPERATURE,
-        "num_predict": num_predict or OLLAMA_NUM_PREDICT,
-        "stream": False
-    }
+def _request_timeout(backend: Backend) -> float:
+    """Adaptive total timeout for one generate request to ``backend``, streamed or not."""
+    return OLLAMA_POOL.timeout_for(backend, 0.95, LLM_TIMEOUT_FACTOR, LLM_TIMEOUT_MIN, LLM_TIMEOUT_MAX)
+
+async def _post_generate(params: Dict, priority: int, tenant: Optional[str], prefer: Optional[str] = None,
+                         avoid: Optional[str] = None, chosen: Optional[List[Backend]] = None) -> Tuple[Dict, Backend]:
+    """POST one non-streaming generate request; return Ollama's JSON and the backend that answered.
+
+    The backend is appended to ``chosen`` as soon as it is picked. Successful
+    latencies feed the adaptive timeouts; a timeout counts as a sample of the
+    timeout itself, so a slowing backend stretches its own limit.
+    """
+    session = get_session(BACKEND_OLLAMA)
+    async with LLM_SCHEDULER.slot(priority, tenant), \
+            OLLAMA_POOL.request(params["model"], prefer, avoid) as backend:
+        if chosen is not None:
+            chosen.append(backend)
+        timeout = _request_timeout(backend)
+        start = time.monotonic()
+        try:
+            async with session.post(backend.generate_url, json=params,
+                                    timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                resp.raise_for_status()
+                result = await resp.json()
+        except asyncio.TimeoutError:
+            OLLAMA_POOL.observe(backend, timeout)
+            raise
+        OLLAMA_POOL.observe(backend, time.monotonic() - start)
+        return result, backend
 
+def _hedge_delay(model: str) -> Optional[float]:
+    """How long to wait before hedging a request, or None if hedging is off or pointless."""
+    if LLM_HEDGE_PERCENTILE <= 0 or OLLAMA_POOL.available(model) < 2:
+        return None
+    return OLLAMA_POOL.latency.percentile(LLM_HEDGE_PERCENTILE)
+
+async def _hedged_generate(params: Dict, priority: int, tenant: Optional[str],
+                           prefer: Optional[str] = None) -> Tuple[Dict, Backend]:
+    """Run _post_generate, racing a second copy on another backend if the first is slow.
+
+    The hedge is sent only once the first request has been running longer
+    than the pool's LLM_HEDGE_PERCENTILE latency, another backend can take it
+    and the scheduler has an idle slot, so it never queues ahead of other
+    users' requests. The first successful answer wins; the other is cancelled.
+    """
+    model = params["model"]
+    delay = _hedge_delay(model)
+    if delay is None:
+        return await _post_generate(params, priority, tenant, prefer)
+
+    chosen: List[Backend] = []
+    tasks = [asyncio.ensure_future(_post_generate(params, priority, tenant, prefer, chosen=chosen))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if (done or not chosen or LLM_SCHEDULER.running >= LLM_SCHEDULER.slots
+                or not OLLAMA_POOL.available(model, avoid=chosen[0].url)):
+            return await tasks[0]
+        HEDGE_STATS['sent'] += 1
+        tasks.append(asyncio.ensure_future(
+            _post_generate(params, priority, tenant, avoid=chosen[0].url)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        HEDGE_STATS['won'] += 1
+                    return task.result()
+        return tasks[0].result()  # Both failed: raise the original request's error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def get_hedge_stats() -> Dict[str, float]:
+    """Return how many hedged requests were sent and how many beat the original."""
+    stats = dict(HEDGE_STATS)
+    stats['win_rate'] = stats['won'] / stats['sent'] if stats['sent'] else 0.0
+    return stats
+
+async def _generate_with_retries(params: Dict, user_message: str, priority: int = PRIORITY_INTERACTIVE,
+                                 tenant: Optional[str] = None, kv_session: Optional[KVSession] = None) -> str:
+    """POST a generate request, retrying invalid or failed responses.
+
+    Each attempt holds a scheduler slot only while its request is running,
+    times out adaptively and may be hedged (see _hedged_generate). Retries
+    back off exponentially; when every backend's circuit breaker is open the
+    fallback text is returned at once instead of waiting out more attempts.
+    """
+    prefer = kv_session.backend if kv_session is not None else None
+    error_type = "default"
     for attempt in range(MAX_RETRIES):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(OLLAMA_URL, json=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            result, backend = await _hedged_generate(params, priority, tenant, prefer)
+        except BackendUnavailable:
+            return get_fallback_response("connection")
+        except asyncio.TimeoutError:
+            error_type = "timeout"
+        except (aiohttp.ClientError, json.JSONDecodeError):
+            error_type = "connection"
+        else:
+            generated_text = (result.get("response") or "").strip()
+            is_valid, message = validate_response(generated_text, user_message)
+            if is_valid:
+                if kv_session is not None:
+                    kv_session.set_context(result.get("context"), backend.url)
+                return generated_text
+            error_type = "validation"
+
+        if attempt < MAX_RETRIES - 1:
+            await asyncio.sleep(_retry_delay(attempt))
+
+    return get_fallback_response(error_type)
+
+async def _read_stream(params: Dict, priority: int, tenant: Optional[str], prefer: Optional[str],
+                       kv_session, chunks: asyncio.Queue) -> None:
+    """Read one streaming generate request into ``chunks``, then put None.
+
+    Runs as its own task, so the scheduler slot and backend are released as
+    soon as Ollama finishes, however slowly the caller consumes the chunks.
+    Timeouts and latency samples work as in _post_generate.
+    """
+    try:
+        session = get_session(BACKEND_OLLAMA)
+        async with LLM_SCHEDULER.slot(priority, tenant), \
+                OLLAMA_POOL.request(params["model"], prefer) as backend:
+            timeout = _request_timeout(backend)
+            start = time.monotonic()
+            try:
+                async with session.post(backend.generate_url, json=params,
+                                        timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
                     resp.raise_for_status()
-                    result = await resp.json()
+                    async for line in resp.content:
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("response"):
+                            chunks.put_nowait(chunk["response"])
+                        if chunk.get("done"):
+                            if kv_session is not None:
+                                kv_session.set_context(chunk.get("context"), backend.url)
+                            break
+            except asyncio.TimeoutError:
+                OLLAMA_POOL.observe(backend, timeout)
+                raise
+            OLLAMA_POOL.observe(backend, time.monotonic() - start)
+    finally:
+        chunks.put_nowait(None)
 
-                    if "response" in result:
-                        generated_text = result["response"].strip()
-                        is_valid, message = validate_response(generated_text, user_message)
-                        if is_valid:
-                            return generated_text
+async def stream_llm_response(user_message: str, system_prompt: str, **kwargs) -> AsyncIterator[str]:
+    """Generate a response as a stream of text chunks.
 
-            # Retry if response was invalid
+    Reads Ollama's NDJSON stream incrementally and yields each ``response``
+    fragment as it arrives. Failed connections are retried only while nothing
+    has been yielded yet; otherwise the fallback text is yielded instead, at
+    once if no backend can take the request. Takes the same arguments as
+    generate_llm_response.
+    """
+    priority = kwargs.pop('priority', PRIORITY_INTERACTIVE)
+    tenant = kwargs.pop('tenant', None)
+    kv_session = kwargs.pop('kv_session', None)
+    params = _build_params(user_message, system_prompt, **kwargs)
+    params = _apply_session(params, user_message, kv_session)
+    params["stream"] = True
+    prefer = kv_session.backend if kv_session is not None else None
+
+    global _interactive_inflight
+    _interactive_inflight += 1
+    try:
+        error_type = "default"
+        for attempt in range(MAX_RETRIES):
+            produced = False
+            chunks: asyncio.Queue = asyncio.Queue()
+            reader = asyncio.ensure_future(_read_stream(params, priority, tenant, prefer, kv_session, chunks))
+            try:
+                while True:
+                    text = await chunks.get()
+                    if text is None:
+                        break
+                    produced = True
+                    yield text
+                await reader
+                if produced:
+                    return
+                error_type = "validation"
+            except BackendUnavailable:
+                error_type = "connection"
+                break
+            except asyncio.TimeoutError:
+                error_type = "timeout"
+            except (aiohttp.ClientError, json.JSONDecodeError):
+                error_type = "connection"
+            finally:
+                if not reader.done():
+                    reader.cancel()  # The caller stopped reading
+            if produced:
+                return  # Partial text already shown; don't restart mid-reply
             if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(RETRY_DELAY * (attempt + 1))
-                continue
-            return get_fallback_response("validation")
+                await asyncio.sleep(_retry_delay(attempt))
+        yield get_fallback_response(error_type)
+    finally:
+        _interactive_inflight -= 1
 
-        except asyncio.TimeoutError:
-            if attempt == MAX_RETRIES - 1:
-                return get_fallback_response("timeout")
-            await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+async def generate_completion(
+    prompt: str,
+    temperature: Optional[float] = None,
+    num_predict: Optional[int] = None,
+    timeout: float = 120,
+    priority: int = PRIORITY_SUMMARY,
+    tenant: Optional[str] = None
+) -> Optional[str]:
+    """Run a raw prompt through Ollama for background work (summaries, extraction).
+
+    Unlike generate_llm_response there are no retries and no fallback text:
+    failures return None so callers never mistake an apology for model output.
+    """
+    params = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "temperature": temperature or OLLAMA_TEMPERATURE,
+        "num_predict": num_predict or OLLAMA_NUM_PREDICT,
+        "stream": False,
+        "options": {"num_ctx": get_context_budget(OLLAMA_MODEL)}
+    }
+    return await _single_flight(params, lambda: _post_completion(params, timeout, priority, tenant))
 
-        except (aiohttp.ClientError, json.JSONDecodeError) as e:
-            if attempt == MAX_RETRIES - 1:
-                return get_fallback_response("connection")
-            await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+async def _post_completion(params: Dict, timeout: float, priority: int = PRIORITY_SUMMARY,
+                           tenant: Optional[str] = None) -> Optional[str]:
+    """POST a raw generate request once; None on any failure."""
+    try:
+        session = get_session(BACKEND_OLLAMA)
+        async with LLM_SCHEDULER.slot(priority, tenant), \
+                OLLAMA_POOL.request(params["model"]) as backend, \
+                session.post(backend.generate_url, json=params, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            result = await resp.json()
+            return (result.get("response") or "").strip() or None
+    except (BackendUnavailable, asyncio.TimeoutError, aiohttp.ClientError, json.JSONDecodeError):
+        return None
 
-    return get_fallback_response("default")
+async def wait_until_idle(poll_interval: float = 1.0) -> None:
+    """Wait until no user-facing generation is in flight, so background work yields to replies."""
+    while _interactive_inflight:
+        await asyncio.sleep(poll_interval)
 
 # Add compatibility function for the old HF model loading call
 def load_hf_model():
     """Compatibility function that returns placeholders since we're using Ollama now"""
-    print("Using Ollama LLM at", OLLAMA_URL, "with model", OLLAMA_MODEL)
+    print("Using Ollama LLM at", ", ".join(b.url for b in OLLAMA_POOL.backends), "with model", OLLAMA_MODEL)
     return True, None, None
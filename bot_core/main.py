@@ -14,12 +14,23 @@ import logging
 import sys
 import importlib
 import re
+import time
 
 # Local imports
 from . import history
 from . import feedback
 from . import image_caption
 from . import llm
+from . import summarizer
+from .store import JSON_STORE, JSON_STORE_FLUSH_INTERVAL
+from .http_client import HTTP_CLIENTS
+from .scheduler import tenant_for
+from .backends import OLLAMA_POOL, BACKEND_PROBE_INTERVAL
+from .fact_extractor import FACT_EXTRACTOR
+from .qa_store import QA_STORE
+from . import qa_vectors
+from .qa_vectors import QA_VECTORS
+from . import streaming
 from .feedback import (
     save_feedback_scores, 
     save_user_feedback, 
@@ -38,7 +49,7 @@ from .status_publisher import initialize_status_publisher
 
 
 # --- Load initial state ---
-# Load conversation history
+# Open conversation history (contexts are loaded on first use)
 CONVO_HISTORY = history.load_convo_history()
 
 # File path for server tracking
@@ -132,17 +143,9 @@ def admin_only():
     return check(predicate)
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'datasets')
-CHATBOT_DATASET_FILE = os.path.join(DATASET_DIR, 'chatbot_dataset.json')
-def load_chatbot_dataset():
-    try:
-        with open(CHATBOT_DATASET_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
-def save_chatbot_dataset():
-    with open(CHATBOT_DATASET_FILE, 'w', encoding='utf-8') as f:
-        json.dump(qa_pairs, f, ensure_ascii=False, indent=2)
-qa_pairs = load_chatbot_dataset()
+CHATBOT_DATASET_FILE = os.path.join(DATASET_DIR, 'chatbot_dataset.json')  # Imported into QA_STORE once
+# Q&A pairs live on disk and are read on demand; see qa_store.py
+qa_pairs = QA_STORE
 
 # --- Custom Persona Storage ---
 CUSTOM_PERSONAS_FILE = os.path.join(DATASET_DIR, 'custom_personas.json')
@@ -166,8 +169,7 @@ def load_channel_personas():
     except Exception:
         return {}
 def save_channel_personas(personas):
-    with open(CHANNEL_PERSONAS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(personas, f, ensure_ascii=False, indent=2)
+    JSON_STORE.mark_dirty(CHANNEL_PERSONAS_FILE, personas, indent=2)
 CHANNEL_PERSONAS = load_channel_personas()
 
 # --- User Long-Term Memory ---
@@ -179,8 +181,7 @@ def load_user_facts():
     except Exception:
         return {}
 def save_user_facts(facts):
-    with open(USER_FACTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(facts, f, ensure_ascii=False, indent=2)
+    JSON_STORE.mark_dirty(USER_FACTS_FILE, facts, indent=2)
 USER_FACTS = load_user_facts()
 
 # --- XP/Leveling Storage ---
@@ -192,8 +193,7 @@ def load_user_xp():
     except Exception:
         return {}
 def save_user_xp(xp):
-    with open(USER_XP_FILE, 'w', encoding='utf-8') as f:
-        json.dump(xp, f, ensure_ascii=False, indent=2)
+    JSON_STORE.mark_dirty(USER_XP_FILE, xp, indent=2)
 USER_XP = load_user_xp()
 
 def get_xp(user_id):
@@ -257,6 +257,9 @@ intents.members = True
 
 class YumiBot(commands.Bot):    
     async def setup_hook(self):
+        # Open the pooled keep-alive HTTP clients used for Ollama and image downloads
+        await HTTP_CLIENTS.start()
+
         try:
             # Register slash commands
             self.tree.add_command(yumi_mode_slash)
@@ -274,6 +277,22 @@ class YumiBot(commands.Bot):
         
         print("[Commands] All custom commands loaded successfully.")
 
+    async def close(self):
+        # Make every buffered conversation message and pending JSON write durable before shutting down
+        try:
+            history.HISTORY_LOG.close()
+        except Exception as e:
+            print(f"[History] Error closing conversation log: {e}")
+        try:
+            JSON_STORE.flush()
+        except Exception as e:
+            print(f"[Store] Error flushing JSON files: {e}")
+        try:
+            await HTTP_CLIENTS.close()
+        except Exception as e:
+            print(f"[HTTP] Error closing HTTP clients: {e}")
+        await super().close()
+
 bot = YumiBot(command_prefix='!', intents=intents)
 
 @app_commands.command(name="yumi_mode", description="Change Yumi's persona mode (see help)")
@@ -581,8 +600,6 @@ async def yumi_mode(ctx, mode: str):
 
 # Import and initialize modules
 from collections import deque
-from .history import TOTAL_HISTORY_LENGTH, load_convo_history, save_convo_history
-CONVO_HISTORY = load_convo_history()
 feedback_scores, user_feedback = feedback.load_feedback()
 BLIP_READY, blip_processor, blip_model = image_caption.load_blip()
 AI_READY, ai_tokenizer, ai_model = llm.load_hf_model()
@@ -623,10 +640,9 @@ def set_context_mode(ctx, mode):
         CONTEXT_MODES[f"guild_{ctx.guild.id}"] = mode
     else:
         CONTEXT_MODES[f"user_{ctx.author.id}"] = mode
-    with open(MODE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(CONTEXT_MODES, f, ensure_ascii=False, indent=2)
+    JSON_STORE.mark_dirty(MODE_FILE, CONTEXT_MODES, indent=2)
 
-from .persona import yumi_sugoi_response, set_persona_mode, get_persona_mode, PERSONA_MODES, get_persona_openers
+from .persona import yumi_sugoi_response, stream_response, set_persona_mode, get_persona_mode, PERSONA_MODES, get_persona_openers, invalidate_prompt_prefix
 
 # Patch: add missing modes to PERSONA_MODES if not present
 if 'genalpha' not in PERSONA_MODES:
@@ -635,7 +651,6 @@ if 'egirl' not in PERSONA_MODES:
     PERSONA_MODES.append('egirl')
 
 from .llm import generate_llm_response
-from .history import save_convo_history, load_convo_history
 from .feedback import save_feedback_scores, save_user_feedback, save_user_feedback, reset_feedback, export_feedback, export_user_feedback, get_user_feedback_stats
 from .websearch import duckduckgo_search_and_summarize
 from .image_caption import caption_image
@@ -649,12 +664,11 @@ LOCKDOWN_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'datase
 LOCKED_CHANNELS = defaultdict(set)
 
 def save_lockdown_channels():
-    try:
-        with open(LOCKDOWN_FILE, 'w', encoding='utf-8') as f:
-            # Save as {guild_id: [channel_id, ...]} for JSON compatibility
-            json.dump({str(gid): list(cids) for gid, cids in LOCKED_CHANNELS.items()}, f)
-    except Exception as e:
-        print(f"[Lockdown] Failed to save: {e}")
+    # Save as {guild_id: [channel_id, ...]} for JSON compatibility; rendered at flush time
+    JSON_STORE.mark_dirty(
+        LOCKDOWN_FILE,
+        lambda: {str(gid): list(cids) for gid, cids in LOCKED_CHANNELS.items()},
+    )
 
 def load_lockdown_channels():
     global LOCKED_CHANNELS
@@ -703,32 +717,24 @@ def load_dashboard_stats():
 async def update_message_stats(message):
     """Update message statistics"""
     try:
-        # Make sure the directory exists
-        os.makedirs(DASHBOARD_DATA_DIR, exist_ok=True)
-        
         # Update hourly message count
         hour = datetime.now().hour
         message_count[f"hour_{hour}"] += 1
         
-        # Save to file
-        with open(MESSAGE_STATS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(dict(message_count), f, ensure_ascii=False, indent=2)
+        # Written by the store's flush task (which also creates the directory)
+        JSON_STORE.mark_dirty(MESSAGE_STATS_FILE, message_count, indent=2)
     except Exception as e:
         print(f"[Stats] Error updating message stats: {e}")
 
 def update_command_stats(ctx):
     """Update command statistics"""
     try:
-        # Make sure the directory exists
-        os.makedirs(DASHBOARD_DATA_DIR, exist_ok=True)
-        
         # Update command usage count
         command_name = ctx.command.name if ctx.command else "unknown"
         command_usage[command_name] += 1
         
-        # Save to file
-        with open(COMMAND_STATS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(dict(command_usage), f, ensure_ascii=False, indent=2)
+        # Written by the store's flush task (which also creates the directory)
+        JSON_STORE.mark_dirty(COMMAND_STATS_FILE, command_usage, indent=2)
     except Exception as e:
         print(f"[Stats] Error updating command stats: {e}")
 
@@ -795,8 +801,7 @@ def load_user_names():
     except Exception:
         return {}
 def save_user_names():
-    with open(USER_NAMES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(USER_NAMES, f, ensure_ascii=False, indent=2)
+    JSON_STORE.mark_dirty(USER_NAMES_FILE, USER_NAMES, indent=2)
 USER_NAMES = load_user_names()
 
 # Background task: randomly DM users Yumi has interacted with
@@ -961,122 +966,119 @@ async def yumi_reminder_task():
         # Wait between 12-24 hours before the next reminder
         await asyncio.sleep(random.randint(43200, 86400))  # 12-24 hours
 
-async def setup_tasks():
-    bot.loop.create_task(scheduled_announcement_task())
-    bot.loop.create_task(yumi_reminder_task())
-
-def extract_and_store_user_facts(message):
-    """Extract and store user facts from natural language messages."""
-    try:
-        user_id = str(message.author.id)
-        content = message.content.lower().strip()
-        
-        # Skip if message is too short or is a command
-        if len(content) < 10 or content.startswith('!') or content.startswith('/'):
-            return
-        
-        # Get current user facts
-        current_facts = USER_FACTS.get(user_id, {})
-        
-        # Use LLM to extract facts from the message
-        fact_extraction_prompt = """You are a helpful assistant that extracts personal facts from user messages. Extract only clear, factual information about the user. Return ONLY a JSON object with extracted facts, or an empty JSON object {} if no clear facts are found.
+async def history_flush_task():
+    """Background task to group-fsync the append-only conversation log"""
+    await bot.wait_until_ready()
+    loop = asyncio.get_running_loop()
+    while not bot.is_closed():
+        try:
+            await loop.run_in_executor(None, history.HISTORY_LOG.flush)
+        except Exception as e:
+            print(f"[History] Error flushing conversation log: {e}")
+        await asyncio.sleep(history.HISTORY_FSYNC_INTERVAL)
 
-Examples of good facts to extract:
-- name: if they say "my name is..." or "I'm called..." or "call me..."
-- location: if they mention where they live/are from
-- age: if they mention their age
-- occupation: if they mention their job
-- interests: if they clearly state they like/love something
-- relationship_status: if they mention being married, single, dating, etc.
-- pets: if they mention having pets
-- family: if they mention family members
+async def json_store_flush_task():
+    """Background task to write coalesced JSON state changes to disk"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            await JSON_STORE.flush_async()
+        except Exception as e:
+            print(f"[Store] Error flushing JSON files: {e}")
+        await asyncio.sleep(JSON_STORE_FLUSH_INTERVAL)
 
-Only extract facts that are:
-1. Clearly stated by the user
-2. About the user themselves (not others)
-3. Factual information (not opinions or temporary states)
+async def history_compaction_task():
+    """Background task to merge sealed log segments and apply history retention"""
+    await bot.wait_until_ready()
+    loop = asyncio.get_running_loop()
+    while not bot.is_closed():
+        await asyncio.sleep(history.HISTORY_COMPACT_INTERVAL)
+        try:
+            reclaimed = await loop.run_in_executor(None, history.HISTORY_LOG.compact)
+            if reclaimed:
+                stats = history.HISTORY_LOG.get_stats()
+                print(f"[History] Compaction reclaimed {reclaimed} bytes "
+                      f"(total reclaimed {stats['bytes_reclaimed']}, archived {stats['messages_archived']} messages "
+                      f"in {stats['bytes_archived']} bytes, avg archive read {stats['archive_read_ms']:.1f} ms)")
+        except Exception as e:
+            print(f"[History] Error compacting conversation log: {e}")
 
-User message: "{message}"
+async def backend_health_task():
+    """Background task to probe the Ollama backends so dead ones leave rotation"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            await OLLAMA_POOL.probe_all()
+        except Exception as e:
+            print(f"[Backends] Error probing Ollama backends: {e}")
+        await asyncio.sleep(BACKEND_PROBE_INTERVAL)
 
-Current known facts about user: {current_facts}
+async def summarizer_task():
+    """Background task to fold old conversation turns into rolling summaries"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(summarizer.SUMMARY_INTERVAL)
+        try:
+            updated = await summarizer.summarize_hot_contexts(CONVO_HISTORY)
+            if updated:
+                print(f"[Summary] Updated rolling summaries for {updated} contexts")
+        except Exception as e:
+            print(f"[Summary] Error in summarizer task: {e}")
 
-Extract new facts as JSON:"""
-        
+async def fact_extraction_task():
+    """Background task to extract user facts from queued messages in batches"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
         try:
-            # Generate fact extraction using the LLM
-            from .llm import generate_llm_response
-            
-            extraction_response = generate_llm_response(
-                user_message=content,
-                system_prompt=fact_extraction_prompt.format(
-                    message=content,
-                    current_facts=json.dumps(current_facts)
-                ),
-                temperature=0.3,  # Lower temperature for more consistent extraction
-                num_predict=200   # Shorter response for JSON facts
-            )
-            
-            # Try to parse the JSON response
-            if extraction_response and extraction_response.strip():
-                # Clean the response - remove any text before/after JSON
-                cleaned_response = extraction_response.strip()
-                
-                # Find JSON object in response
-                start_idx = cleaned_response.find('{')
-                end_idx = cleaned_response.rfind('}') + 1
-                
-                if start_idx != -1 and end_idx > start_idx:
-                    json_str = cleaned_response[start_idx:end_idx]
-                    
-                    try:
-                        extracted_facts = json.loads(json_str)
-                        
-                        # Only update if we got valid facts
-                        if isinstance(extracted_facts, dict) and extracted_facts:
-                            # Merge with existing facts (new facts override old ones)
-                            current_facts.update(extracted_facts)
-                            USER_FACTS[user_id] = current_facts
-                            
-                            print(f"[Memory] Extracted facts for user {user_id}: {extracted_facts}")
-                            
-                    except json.JSONDecodeError:
-                        # Fallback: try to extract basic name patterns manually
-                        extract_basic_facts_fallback(content, user_id, current_facts)
-                        
+            batch = await FACT_EXTRACTOR.next_batch()
+            if await FACT_EXTRACTOR.process_batch(batch, USER_FACTS):
+                save_user_facts(USER_FACTS)
         except Exception as e:
-            print(f"[Memory] Error in LLM fact extraction: {e}")
-            # Fallback to basic pattern matching
-            extract_basic_facts_fallback(content, user_id, current_facts)
-            
-    except Exception as e:
-        print(f"[Memory] Error in extract_and_store_user_facts: {e}")
+            print(f"[Memory] Error in fact extraction task: {e}")
+            await asyncio.sleep(1)
 
-def extract_basic_facts_fallback(content, user_id, current_facts):
-    """Fallback method to extract basic facts using pattern matching."""
+async def qa_store_task():
+    """Background task to import the legacy JSON dataset into an empty Q&A store"""
+    loop = asyncio.get_running_loop()
     try:
-        import re
-        
-        # Basic name extraction patterns
-        name_patterns = [
-            r"my name is (\w+)",
-            r"i'm (\w+)",
-            r"call me (\w+)",
-            r"i am (\w+)",
-            r"name's (\w+)"
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, content)
-            if match:
-                name = match.group(1).strip()
-                if len(name) > 1 and name.isalpha():
-                    current_facts['name'] = name
-                    USER_FACTS[user_id] = current_facts
-                    print(f"[Memory] Extracted name (fallback) for user {user_id}: {name}")
-                    break
-                    
+        if await loop.run_in_executor(None, bool, QA_STORE) or not os.path.exists(CHATBOT_DATASET_FILE):
+            return
+        start = time.perf_counter()
+        written = await loop.run_in_executor(None, QA_STORE.import_json, CHATBOT_DATASET_FILE)
+        print(f"[QA] Imported {written} Q&A pairs from {CHATBOT_DATASET_FILE} "
+              f"in {time.perf_counter() - start:.1f}s")
     except Exception as e:
-        print(f"[Memory] Error in fallback fact extraction: {e}")
+        print(f"[QA] Error importing Q&A dataset: {e}")
+
+async def qa_vector_task():
+    """Background task to embed new Q&A pairs for semantic example retrieval"""
+    if not qa_vectors.QA_VECTORS_ENABLED:
+        return
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            added = await QA_VECTORS.sync(qa_pairs, idle_wait=llm.wait_until_idle)
+            if added:
+                print(f"[QA] Embedded {added} new Q&A pairs ({QA_VECTORS.store.count} stored)")
+        except Exception as e:
+            print(f"[QA] Error syncing Q&A embeddings: {e}")
+        await asyncio.sleep(qa_vectors.QA_VECTOR_SYNC_INTERVAL)
+
+async def setup_tasks():
+    bot.loop.create_task(scheduled_announcement_task())
+    bot.loop.create_task(yumi_reminder_task())
+    bot.loop.create_task(history_flush_task())
+    bot.loop.create_task(history_compaction_task())
+    bot.loop.create_task(json_store_flush_task())
+    bot.loop.create_task(summarizer_task())
+    bot.loop.create_task(backend_health_task())
+    bot.loop.create_task(fact_extraction_task())
+    bot.loop.create_task(qa_store_task())
+    bot.loop.create_task(qa_vector_task())
+
+def extract_and_store_user_facts(message):
+    """Queue a message for background fact extraction (see fact_extractor.py)."""
+    FACT_EXTRACTOR.submit(str(message.author.id), message.content)
 
 @bot.event
 async def on_message(message):
@@ -1145,42 +1147,61 @@ async def on_message(message):
         context_key = f"{message.author.id}_dm"
     
     # Add user message to conversation history
-    user_msg = {"role": "user", "content": message.content, "timestamp": datetime.now().isoformat()}
-    CONVO_HISTORY[context_key].append(user_msg)
+    user_msg = history.Message("user", message.content, time.time())
+    history.append_message(CONVO_HISTORY, context_key, user_msg)
     
     # Generate a response using your LLM/persona system
     try:
         # Show typing indicator to make Yumi appear more human
         async with message.channel.typing():
-            # Add a small delay to make typing feel natural
-            await asyncio.sleep(random.uniform(0.5, 2.0))
-            
             # Get user facts for this user
             user_facts = USER_FACTS.get(str(message.author.id), {})
             
             # Get conversation history for context
             convo_history = CONVO_HISTORY[context_key]
+            # Queue LLM work fairly per guild (or per user in DMs)
+            tenant = tenant_for(message.guild.id if message.guild else None, message.author.id)
+            
+            if streaming.STREAM_RESPONSES:
+                # Post the first sentence as soon as it exists and edit the rest in as it streams
+                response = await streaming.stream_to_channel(message.channel, stream_response(
+                    message.content,
+                    qa_pairs=qa_pairs,
+                    user_facts=user_facts,
+                    convo_history=convo_history,
+                    tenant=tenant,
+                    session_key=context_key
+                ))
+                if response:
+                    assistant_msg = history.Message("assistant", response, time.time())
+                    history.append_message(CONVO_HISTORY, context_key, assistant_msg)
+                    save_user_facts(USER_FACTS)
+                return
+            
+            # Add a small delay to make typing feel natural
+            await asyncio.sleep(random.uniform(0.5, 2.0))
             
             # Generate response with memory and context
             response = await yumi_sugoi_response(
                 message.content,
                 qa_pairs=qa_pairs,
                 user_facts=user_facts,
-                convo_history=convo_history
+                convo_history=convo_history,
+                tenant=tenant,
+                session_key=context_key
 )
             
             if response:
                 # Add assistant response to conversation history
-                assistant_msg = {"role": "assistant", "content": response, "timestamp": datetime.now().isoformat()}
-                CONVO_HISTORY[context_key].append(assistant_msg)
+                assistant_msg = history.Message("assistant", response, time.time())
+                history.append_message(CONVO_HISTORY, context_key, assistant_msg)
                 
                 # Add another small delay based on response length to simulate typing time
                 typing_delay = min(len(response) * 0.02, 3.0)  # Max 3 seconds
                 await asyncio.sleep(typing_delay)
                 await message.channel.send(response)
                 
-                # Save updated conversation history and user facts
-                save_convo_history(CONVO_HISTORY)
+                # Save updated user facts (conversation history is already in the append-only log)
                 save_user_facts(USER_FACTS)
                 
     except Exception as e:
@@ -1419,6 +1440,7 @@ async def yumi_persona_create(ctx, name: str, *, description: str):
     save_json_file(CUSTOM_PERSONAS_FILE, custom_personas)
     # Reload custom_personas so new persona is available instantly
     custom_personas = load_json_file(CUSTOM_PERSONAS_FILE, {})
+    invalidate_prompt_prefix(name)
     await ctx.send(f"Custom persona '{name}' created! Use `!yumi_persona_activate {name}` to use it.")
 
 @bot.command()
@@ -1434,6 +1456,7 @@ async def yumi_persona_edit(ctx, name: str, *, description: str):
         return
     persona['description'] = description
     save_json_file(CUSTOM_PERSONAS_FILE, custom_personas)
+    invalidate_prompt_prefix(name)
     await ctx.send(f"Persona '{name}' updated!")
 
 @bot.command()
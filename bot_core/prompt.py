@@ -0,0 +1,210 @@
+"""
+Token-budgeted prompt assembly for the Ollama backend.
+
+A precompiled persona prefix comes first, then prioritized sections from least to most volatile.
+"""
+
+import hashlib
+import os
+from typing import Callable, Dict, List, Optional
+
+# Context window assumed for any model without an explicit entry below
+OLLAMA_CONTEXT_TOKENS = int(os.getenv("OLLAMA_CONTEXT_TOKENS", "4096"))
+
+def _parse_model_budgets(spec: str) -> Dict[str, int]:
+    """Parse "model=tokens,model=tokens" into a dict, skipping malformed entries."""
+    budgets = {}
+    for entry in spec.split(','):
+        model, _, tokens = entry.strip().rpartition('=')
+        if model and tokens.isdigit():
+            budgets[model] = int(tokens)
+    return budgets
+
+# Per-model context windows, e.g. "mistralrp=8192,llava:7b=4096"
+MODEL_CONTEXT_TOKENS = _parse_model_budgets(os.getenv("OLLAMA_MODEL_CONTEXT_TOKENS", ""))
+
+# Section priorities: lower numbers are admitted first and dropped last
+PRIORITY_SYSTEM = 0
+PRIORITY_PERSONA = 1
+PRIORITY_FACTS = 2
+PRIORITY_SUMMARY = 3
+PRIORITY_RECENT_HISTORY = 4
+PRIORITY_QA = 5
+PRIORITY_IMPORTANT_HISTORY = 6
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate how many tokens a model will see for ``text``.
+
+    Roughly four characters per token for plain ASCII, plus extra weight for
+    multi-byte characters such as emoji, which tokenizers split into several
+    pieces. Runs in C-speed string operations, no tokenizer needed.
+    """
+    if not text:
+        return 0
+    extra_bytes = len(text.encode('utf-8')) - len(text)
+    return (len(text) + 3) // 4 + extra_bytes // 2
+
+# Prompt size accounting, in UTF-8 bytes per section
+PROMPT_STATS = {'prompts': 0, 'prefix_compiled': 0, 'prefix_reused': 0, 'section_bytes': {}}
+
+class PromptPrefix:
+    """Immutable leading block of a prompt with a stable hash.
+
+    Args:
+        parts: Blocks joined with blank lines, as assemble_prompt joins sections
+    """
+
+    __slots__ = ('text', 'hash', 'tokens', 'bytes')
+
+    def __init__(self, parts: List[str]):
+        self.text = '\n\n'.join(part for part in parts if part)
+        encoded = self.text.encode('utf-8')
+        self.hash = hashlib.sha256(encoded).hexdigest()[:16]
+        self.tokens = estimate_tokens(self.text)
+        self.bytes = len(encoded)
+
+    def __repr__(self) -> str:
+        return f"PromptPrefix(hash={self.hash!r}, tokens={self.tokens})"
+
+class PrefixCache:
+    """Compiled prefixes by name, rebuilt only when their source text changes."""
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, name: str, source: str, build: Callable[[], List[str]]) -> PromptPrefix:
+        """Return the prefix for ``name``, compiling ``build()`` if ``source`` differs from last time."""
+        entry = self._entries.get(name)
+        if entry is not None and (entry[0] is source or entry[0] == source):
+            PROMPT_STATS['prefix_reused'] += 1
+            return entry[1]
+        prefix = PromptPrefix(build())
+        self._entries[name] = (source, prefix)
+        PROMPT_STATS['prefix_compiled'] += 1
+        return prefix
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Forget one compiled prefix, or all of them."""
+        if name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(name, None)
+
+def get_prompt_stats() -> Dict:
+    """Return prefix cache counters and the average bytes each section adds to a prompt."""
+    prompts = PROMPT_STATS['prompts']
+    return {
+        'prompts': prompts,
+        'prefix_compiled': PROMPT_STATS['prefix_compiled'],
+        'prefix_reused': PROMPT_STATS['prefix_reused'],
+        'avg_section_bytes': {name: total / prompts for name, total in PROMPT_STATS['section_bytes'].items()}
+                             if prompts else {},
+    }
+
+def get_context_budget(model: str) -> int:
+    """Return the context window (in tokens) configured for a model."""
+    return MODEL_CONTEXT_TOKENS.get(model, OLLAMA_CONTEXT_TOKENS)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` so its estimate fits in ``max_tokens``, keeping the beginning."""
+    if max_tokens <= 0:
+        return ''
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Shrink by the measured overshoot until it fits; converges in a few steps
+    end = min(len(text), max_tokens * 4)
+    while end > 0 and estimate_tokens(text[:end]) > max_tokens:
+        end -= max(1, (estimate_tokens(text[:end]) - max_tokens) * 2)
+    return text[:max(end, 0)].rstrip()
+
+class PromptSection:
+    """A block of prompt text made of items that can be dropped one at a time.
+
+    Args:
+        name: Section name, used in the assembly report
+        items: Individual entries (facts, Q&A pairs, history lines)
+        priority: Lower values are admitted first when the budget is tight
+        header: Text rendered before the items when at least one is kept
+        separator: String used to join the kept items
+        keep: "head" keeps the first items (ranked lists), "tail" keeps the
+            last items (chronological history)
+        required: Required sections are truncated instead of dropped
+    """
+
+    def __init__(self, name: str, items: List[str], priority: int, header: str = '',
+                 separator: str = '\n', keep: str = 'head', required: bool = False):
+        self.name = name
+        self.items = [item for item in items if item]
+        self.priority = priority
+        self.header = header
+        self.separator = separator
+        self.keep = keep
+        self.required = required
+
+    def fit(self, budget: int) -> List[str]:
+        """Return the items that fit in ``budget`` tokens, honouring ``keep``."""
+        if not self.items:
+            return []
+        remaining = budget - estimate_tokens(self.header)
+        sep_cost = estimate_tokens(self.separator)
+        ordered = self.items if self.keep == 'head' else list(reversed(self.items))
+        kept = []
+        for item in ordered:
+            cost = estimate_tokens(item) + (sep_cost if kept else 0)
+            if cost > remaining:
+                if self.required and not kept:
+                    kept.append(truncate_to_tokens(item, remaining))
+                break
+            kept.append(item)
+            remaining -= cost
+        return kept if self.keep == 'head' else list(reversed(kept))
+
+    def render(self, items: List[str]) -> str:
+        if not items:
+            return ''
+        return self.header + self.separator.join(items)
+
+def format_turn(user_message: str) -> str:
+    """The closing user turn of a prompt, which the model answers as Yumi."""
+    return f"User: {user_message}\nYumi:"
+
+def assemble_prompt(user_message: str, sections: List[PromptSection], budget: int,
+                    report: Optional[Dict[str, int]] = None) -> str:
+    """Build a prompt that fits ``budget`` tokens from prioritized sections.
+
+    Sections are admitted by priority (ties broken by their position in
+    ``sections``) and rendered in the order given. The user turn is always
+    included and charged against the budget first, so the result is fully
+    deterministic for the same inputs.
+
+    Args:
+        user_message: The message being answered
+        sections: Sections in render order
+        budget: Tokens available for the whole prompt
+        report: Optional dict filled with the estimated tokens kept per section
+
+    Returns:
+        The prompt text
+    """
+    tail = format_turn(user_message)
+    remaining = budget - estimate_tokens(tail)
+    kept_items = {}
+    joiner_cost = estimate_tokens('\n\n')
+    for position, section in sorted(enumerate(sections), key=lambda pair: (pair[1].priority, pair[0])):
+        items = section.fit(remaining - joiner_cost)
+        kept_items[position] = items
+        if items:
+            cost = estimate_tokens(section.render(items)) + joiner_cost
+            remaining -= cost
+            if report is not None:
+                report[section.name] = cost
+
+    rendered = [section.render(kept_items[position]) for position, section in enumerate(sections)]
+    if report is not None:
+        report['user'] = estimate_tokens(tail)
+    section_bytes = PROMPT_STATS['section_bytes']
+    for section, block in zip(sections, rendered):
+        section_bytes[section.name] = section_bytes.get(section.name, 0) + len(block.encode('utf-8'))
+    section_bytes['user'] = section_bytes.get('user', 0) + len(tail.encode('utf-8'))
+    PROMPT_STATS['prompts'] += 1
+    return '\n\n'.join([block for block in rendered if block] + [tail])
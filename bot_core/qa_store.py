@@ -0,0 +1,428 @@
+"""
+On-disk Q&A dataset backed by SQLite with full-text search.
+
+QAStore behaves like a dict, and search() ranks questions with FTS5 and BM25.
+"""
+
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'datasets')
+QA_STORE_PATH = os.getenv('YUMI_QA_STORE', os.path.join(DATASET_DIR, 'qa_pairs.db'))
+QA_STORE_SCAN_BUDGET = int(os.getenv('YUMI_QA_STORE_SCAN_BUDGET', '5000'))  # Matches ranked per query
+QA_STORE_MMAP_BYTES = int(os.getenv('YUMI_QA_STORE_MMAP_MB', '256')) * 2**20
+QA_STORE_CANDIDATES = 200  # Candidates re-scored in full per query
+BM25_K1 = 1.2
+BM25_B = 0.75
+_PAGE_ROWS = 1000  # Rows read per query while iterating
+_IMPORT_BATCH = 10000  # Rows per transaction when importing
+_SQL_VARIABLES = 500  # IDs per IN (...) lookup
+_TERM_CACHE_SIZE = 65536  # Terms whose match counts are remembered between queries
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    question TEXT NOT NULL UNIQUE,
+    answer TEXT NOT NULL,
+    curated INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pairs_fts USING fts5(
+    question, content='pairs', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS pairs_ai AFTER INSERT ON pairs BEGIN
+    INSERT INTO pairs_fts(rowid, question) VALUES (new.id, new.question);
+END;
+CREATE TRIGGER IF NOT EXISTS pairs_ad AFTER DELETE ON pairs BEGIN
+    INSERT INTO pairs_fts(pairs_fts, rowid, question) VALUES ('delete', old.id, old.question);
+END;
+CREATE TRIGGER IF NOT EXISTS pairs_au AFTER UPDATE OF question ON pairs BEGIN
+    INSERT INTO pairs_fts(pairs_fts, rowid, question) VALUES ('delete', old.id, old.question);
+    INSERT INTO pairs_fts(rowid, question) VALUES (new.id, new.question);
+END;
+"""
+
+_UPSERT = ("INSERT INTO pairs (question, answer) VALUES (?, ?) "
+           "ON CONFLICT(question) DO UPDATE SET answer = excluded.answer WHERE answer != excluded.answer")
+
+_WORD_RE = re.compile(r'[^\W_]+')
+_SEPARATORS_RE = re.compile(r'[\s,:]*')
+
+def terms(text: str) -> List[str]:
+    """Word tokens the way FTS5's unicode61 tokenizer sees them: lowercase, diacritics removed."""
+    text = text.lower()
+    if text.isascii():
+        return _WORD_RE.findall(text)
+    folded = unicodedata.normalize('NFKD', text)
+    return _WORD_RE.findall(''.join(c for c in folded if not unicodedata.combining(c)))
+
+def _phrase(term: str) -> str:
+    return f'"{term}"'
+
+def iter_json_object(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple]:
+    """Yield the (key, value) pairs of a file holding one JSON object without loading it whole.
+
+    Raises:
+        ValueError: If the file is not a JSON object or is truncated
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos, eof = '', 0, False
+        started, key, have_key = False, None, False
+        while True:
+            pos = _SEPARATORS_RE.match(buffer, pos).end()
+            if pos < len(buffer):
+                if not started:
+                    if buffer[pos] != '{':
+                        raise ValueError(f"{path} does not hold a JSON object")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == '}':
+                    return
+                try:
+                    token, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    end = None
+                # A token ending at the buffer's end (e.g. a number) may continue in the next chunk
+                if end is not None and (end < len(buffer) or eof):
+                    pos = end
+                    if have_key:
+                        yield key, token
+                        have_key = False
+                    else:
+                        key, have_key = token, True
+                    continue
+            if eof:
+                raise ValueError(f"{path} is truncated or not valid JSON")
+            chunk = f.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+
+class QAStore(MutableMapping):
+    """Dict-like Q&A dataset in an SQLite file, with FTS5 retrieval."""
+
+    def __init__(self, path: str = QA_STORE_PATH):
+        self.path = path
+        self._local = threading.local()  # One connection per thread
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._count = None
+        self._term_counts: 'OrderedDict[str, int]' = OrderedDict()
+        self.stats = {'queries': 0, 'query_ms': 0.0, 'added': 0, 'removed': 0, 'imported': 0,
+                      'term_cache_hits': 0, 'term_probes': 0}
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={QA_STORE_MMAP_BYTES}')
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        # Stores created before dashboard pairs were marked lack the curated column
+        if any(row[1] == 'curated' for row in conn.execute('PRAGMA table_info(pairs)')):
+            return
+        try:
+            with conn:
+                conn.execute('ALTER TABLE pairs ADD COLUMN curated INTEGER NOT NULL DEFAULT 0')
+        except sqlite3.OperationalError:
+            pass  # Another connection added it first
+
+    def close(self) -> None:
+        """Close every thread's connection (they reopen on next use)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def __getitem__(self, question: str) -> str:
+        row = self._db().execute('SELECT answer FROM pairs WHERE question = ?', (question,)).fetchone()
+        if row is None:
+            raise KeyError(question)
+        return row[0]
+
+    def __contains__(self, question) -> bool:
+        if not isinstance(question, str):
+            return False
+        return self._db().execute('SELECT 1 FROM pairs WHERE question = ?', (question,)).fetchone() is not None
+
+    def __setitem__(self, question: str, answer: str) -> None:
+        self.add(question, answer)
+
+    def __delitem__(self, question: str) -> None:
+        if not self.remove(question):
+            raise KeyError(question)
+
+    def __iter__(self) -> Iterator[str]:
+        for _, question, _ in self._pages('question, NULL'):
+            yield question
+
+    def iter_items(self) -> Iterator[Tuple[str, str]]:
+        """Every (question, answer) pair in insertion order, read a page at a time."""
+        for _, question, answer in self._pages('question, answer'):
+            yield question, answer
+
+    def iter_rows(self) -> Iterator[Tuple[int, str]]:
+        """Every (row ID, question) in insertion order, read a page at a time."""
+        for row_id, question, _ in self._pages('question, NULL'):
+            yield row_id, question
+
+    def get_rows(self, row_ids: Iterable[int]) -> Dict[int, Tuple[str, str]]:
+        """(question, answer) for each of ``row_ids`` that still exists."""
+        conn = self._db()
+        ids = list(row_ids)
+        rows = {}
+        for start in range(0, len(ids), _SQL_VARIABLES):
+            chunk = ids[start:start + _SQL_VARIABLES]
+            query = f"SELECT id, question, answer FROM pairs WHERE id IN ({','.join('?' * len(chunk))})"
+            for row_id, question, answer in conn.execute(query, chunk):
+                rows[row_id] = (question, answer)
+        return rows
+
+    def curated_ids(self, row_ids: Iterable[int]) -> Set[int]:
+        """Which of ``row_ids`` were added or edited from the dashboard rather than imported."""
+        conn = self._db()
+        ids = list(row_ids)
+        curated = set()
+        for start in range(0, len(ids), _SQL_VARIABLES):
+            chunk = ids[start:start + _SQL_VARIABLES]
+            query = f"SELECT id FROM pairs WHERE curated AND id IN ({','.join('?' * len(chunk))})"
+            curated.update(row_id for row_id, in conn.execute(query, chunk))
+        return curated
+
+    def get_many(self, questions: Iterable[str]) -> Dict[str, str]:
+        """Answers for each of ``questions`` still in the store, in one query per 500 questions."""
+        conn = self._db()
+        wanted = list(questions)
+        answers = {}
+        for start in range(0, len(wanted), _SQL_VARIABLES):
+            chunk = wanted[start:start + _SQL_VARIABLES]
+            query = f"SELECT question, answer FROM pairs WHERE question IN ({','.join('?' * len(chunk))})"
+            answers.update(conn.execute(query, chunk))
+        return answers
+
+    def remove_ids(self, row_ids: Iterable[int]) -> int:
+        """Delete rows by ID in batched transactions; returns how many existed."""
+        conn = self._db()
+        ids = list(row_ids)
+        removed = 0
+        for start in range(0, len(ids), _IMPORT_BATCH):
+            with conn:
+                removed += conn.executemany('DELETE FROM pairs WHERE id = ?',
+                                            ((i,) for i in ids[start:start + _IMPORT_BATCH])).rowcount
+        self._count = None
+        with self._lock:
+            self._term_counts.clear()
+        self.stats['removed'] += removed
+        return removed
+
+    def _pages(self, columns: str) -> Iterator[Tuple]:
+        # Keyset pagination: no cursor stays open across yields, so writes can interleave
+        last = 0
+        while True:
+            rows = self._db().execute(f'SELECT id, {columns} FROM pairs WHERE id > ? ORDER BY id LIMIT ?',
+                                      (last, _PAGE_ROWS)).fetchall()
+            yield from rows
+            if len(rows) < _PAGE_ROWS:
+                return
+            last = rows[-1][0]
+
+    def __len__(self) -> int:
+        count = self._count
+        if count is None:
+            count = self._count = self._db().execute('SELECT count(*) FROM pairs').fetchone()[0]
+        return count
+
+    def __bool__(self) -> bool:
+        return self._db().execute('SELECT 1 FROM pairs LIMIT 1').fetchone() is not None
+
+    def add(self, question: str, answer: str, curated: bool = False) -> None:
+        """Add a pair or replace a known question's answer.
+
+        Args:
+            question: The question text
+            answer: Its answer
+            curated: Mark the pair as edited by hand (dashboard); curated pairs
+                stay curated and dataset dedup never removes them
+        """
+        conn = self._db()
+        with conn:
+            if conn.execute('UPDATE pairs SET answer = ?, curated = max(curated, ?) WHERE question = ?',
+                            (answer, int(curated), question)).rowcount:
+                return
+            conn.execute('INSERT INTO pairs (question, answer, curated) VALUES (?, ?, ?)',
+                         (question, answer, int(curated)))
+        self._forget_terms(question)
+        self.stats['added'] += 1
+        if self._count is not None:
+            self._count += 1
+
+    def remove(self, question: str) -> bool:
+        """Delete a pair; returns False if the question was unknown."""
+        conn = self._db()
+        with conn:
+            removed = conn.execute('DELETE FROM pairs WHERE question = ?', (question,)).rowcount
+        if not removed:
+            return False
+        self._forget_terms(question)
+        self.stats['removed'] += 1
+        if self._count is not None:
+            self._count -= 1
+        return True
+
+    def _forget_terms(self, question: str) -> None:
+        # A cached 0 would otherwise keep a newly added question unreachable
+        with self._lock:
+            for term in set(terms(question)):
+                self._term_counts.pop(term, None)
+
+    def update_many(self, items: Iterable[Tuple[str, str]], batch_size: int = _IMPORT_BATCH) -> int:
+        """Upsert (question, answer) pairs in batched transactions (blocking; run in an executor).
+
+        Non-string or empty entries are skipped; later pairs win, as with dict.update.
+
+        Returns:
+            Number of pairs written
+        """
+        conn = self._db()
+        written = 0
+        batch = []
+        for question, answer in items:
+            if isinstance(question, str) and isinstance(answer, str) and question:
+                batch.append((question, answer))
+            if len(batch) >= batch_size:
+                with conn:
+                    conn.executemany(_UPSERT, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            with conn:
+                conn.executemany(_UPSERT, batch)
+            written += len(batch)
+        self._count = None
+        with self._lock:
+            self._term_counts.clear()
+        self.stats['imported'] += written
+        return written
+
+    def import_json(self, path: str) -> int:
+        """Stream a ``{question: answer}`` JSON file into the store; returns pairs written."""
+        return self.update_many(iter_json_object(path))
+
+    def search(self, text: str, k: int = 5) -> List[Tuple[str, str]]:
+        """Top ``k`` (question, answer) pairs for ``text``, best first; only pairs sharing a term."""
+        start = time.perf_counter()
+        try:
+            return self._search(text, k)
+        finally:
+            self.stats['queries'] += 1
+            self.stats['query_ms'] += (time.perf_counter() - start) * 1000
+
+    def _search(self, text: str, k: int) -> List[Tuple[str, str]]:
+        query_terms = set(terms(text))
+        if not query_terms or k <= 0:
+            return []
+        conn = self._db()
+        matches = {t: c for t, c in ((t, self._matches(conn, t)) for t in query_terms) if c}
+        if not matches:
+            return []
+
+        # Candidates from the rarest terms, within the budget
+        ordered = sorted(matches, key=matches.__getitem__)
+        selected, walked = [], 0
+        for term in ordered:
+            if walked + matches[term] > QA_STORE_SCAN_BUDGET:
+                break
+            selected.append(term)
+            walked += matches[term]
+        limit = max(QA_STORE_CANDIDATES, k)
+        if selected:
+            hits = ('SELECT rowid FROM pairs_fts WHERE pairs_fts MATCH ? ORDER BY rank LIMIT ?',
+                    (' OR '.join(map(_phrase, selected)), limit))
+        else:
+            # Nothing rarer matched: sample the rarest term's first rows
+            hits = ('SELECT rowid FROM pairs_fts WHERE pairs_fts MATCH ? LIMIT ?', (_phrase(ordered[0]), limit))
+        rows = conn.execute(f'SELECT p.question, p.answer FROM ({hits[0]}) AS hits JOIN pairs p ON p.id = hits.rowid',
+                            hits[1]).fetchall()
+
+        # Re-score the candidates against every query term (counts past the budget are floors)
+        n = max(len(self), 1)
+        idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in matches.items()}
+        counts = [Counter(terms(question)) for question, _ in rows]
+        lengths = [sum(c.values()) for c in counts]
+        avg_length = sum(lengths) / len(lengths) if lengths else 1
+        ranked = []
+        for position, ((question, answer), tf_counts, length) in enumerate(zip(rows, counts, lengths)):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+            score = sum(idf[t] * tf * (BM25_K1 + 1) / (tf + norm) for t, tf in tf_counts.items() if t in idf)
+            ranked.append((score, -position, question, answer))
+        return [(question, answer) for _, _, question, answer in heapq.nlargest(k, ranked)]
+
+    def _matches(self, conn: sqlite3.Connection, term: str) -> int:
+        """Rows containing ``term``, counted no further than QA_STORE_SCAN_BUDGET + 1."""
+        with self._lock:
+            count = self._term_counts.get(term)
+            if count is not None:
+                self._term_counts.move_to_end(term)
+                self.stats['term_cache_hits'] += 1
+                return count
+        count = conn.execute('SELECT count(*) FROM (SELECT 1 FROM pairs_fts WHERE pairs_fts MATCH ? LIMIT ?)',
+                             (_phrase(term), QA_STORE_SCAN_BUDGET + 1)).fetchone()[0]
+        with self._lock:
+            self.stats['term_probes'] += 1
+            self._term_counts[term] = count
+            if len(self._term_counts) > _TERM_CACHE_SIZE:
+                self._term_counts.popitem(last=False)
+        return count
+
+    def get_stats(self) -> Dict:
+        """Return pair count, file size, write counters and average query latency."""
+        queries = self.stats['queries']
+        return dict(
+            self.stats,
+            pairs=len(self),
+            file_bytes=os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            avg_query_ms=self.stats['query_ms'] / queries if queries else 0.0,
+        )
+
+def relevant_pairs(qa_pairs: Optional[Dict[str, str]], message: str, k: int) -> Dict[str, str]:
+    """Q&A examples for a prompt: the best matches from a searchable dataset (the QAStore).
+
+    Any other dict gets its first ``k`` pairs, as before.
+    """
+    if not qa_pairs:
+        return {}
+    search = getattr(qa_pairs, 'search', None)
+    if search is not None:
+        return dict(search(message, k))
+    return dict(islice(qa_pairs.items(), k))
+
+async def retrieve_pairs(qa_pairs: Optional[Dict[str, str]], message: str, k: int) -> Dict[str, str]:
+    """relevant_pairs without blocking the event loop: store searches run in an executor."""
+    if getattr(qa_pairs, 'search', None) is None:
+        return relevant_pairs(qa_pairs, message, k)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, relevant_pairs, qa_pairs, message, k)
+
+QA_STORE = QAStore()
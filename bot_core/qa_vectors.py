@@ -0,0 +1,432 @@
+"""
+Semantic retrieval of Q&A examples over memory-mapped embeddings.
+
+Question embeddings live in np.memmap files; larger corpora are searched through an IVF partitioning.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp
+import numpy as np
+
+from .backends import BACKEND_ERRORS, OLLAMA_POOL, BackendUnavailable
+from .http_client import BACKEND_OLLAMA, get_session
+from .scheduler import LLM_SCHEDULER, PRIORITY_INTERACTIVE, PRIORITY_SUMMARY
+
+QA_VECTORS_ENABLED = os.getenv('YUMI_QA_VECTORS', 'false').lower() in ('1', 'true', 'yes')
+EMBED_MODEL = os.getenv('YUMI_EMBED_MODEL', 'nomic-embed-text')
+EMBED_BATCH = int(os.getenv('YUMI_EMBED_BATCH', '64'))  # Questions per /api/embed call
+QA_VECTOR_DIR = os.getenv('YUMI_QA_VECTOR_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'datasets', 'qa_vectors'))
+QA_VECTOR_DTYPE = os.getenv('YUMI_QA_VECTOR_DTYPE', 'float16')  # float16 or float32
+QA_IVF_MIN_ROWS = int(os.getenv('YUMI_QA_IVF_MIN_ROWS', '50000'))  # Exact search below this
+QA_IVF_PROBES = int(os.getenv('YUMI_QA_IVF_PROBES', '8'))  # Lists scanned per query
+QA_VECTOR_SYNC_INTERVAL = float(os.getenv('YUMI_QA_VECTOR_SYNC_INTERVAL', '600'))  # seconds
+QUERY_EMBED_TIMEOUT = 2.0  # seconds; the reply falls back to BM25 examples beyond this
+_SEARCH_CHUNK = 65536  # Rows converted to float32 at a time
+_SCAN_CHUNK = 1000  # Questions hashed between event-loop yields while looking for new ones
+_IVF_RETRAIN_FRACTION = 0.2  # Re-partition once this share of rows is unpartitioned
+_KMEANS_ITERATIONS = 10
+_RRF_K = 60
+# Failures that make a semantic lookup or embedding batch give up (bad answers included)
+_EMBED_ERRORS = (BackendUnavailable, ValueError, KeyError, TypeError) + BACKEND_ERRORS
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+async def embed_texts(texts: Sequence[str], priority: int = PRIORITY_SUMMARY,
+                      tenant: Optional[str] = None, timeout: float = 120) -> np.ndarray:
+    """Embed ``texts`` with one Ollama call; returns unit-length float32 rows."""
+    session = get_session(BACKEND_OLLAMA)
+    async with LLM_SCHEDULER.slot(priority, tenant), \
+            OLLAMA_POOL.request(EMBED_MODEL) as backend, \
+            session.post(backend.embed_url, json={"model": EMBED_MODEL, "input": list(texts)},
+                         timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        resp.raise_for_status()
+        result = await resp.json()
+    vectors = np.asarray(result["embeddings"], dtype=np.float32)
+    if vectors.ndim != 2 or len(vectors) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got shape {vectors.shape}")
+    return _normalize(vectors)
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, best first."""
+    if len(scores) > k:
+        idx = np.argpartition(-scores, k)[:k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind='stable')]
+
+def question_hash(question) -> int:
+    """Stable 64-bit hash of a question (str or its UTF-8 bytes)."""
+    if isinstance(question, str):
+        question = question.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(question, digest_size=8).digest(), 'little')
+
+def _missing_batches(questions: Iterable, stored: np.ndarray, batch_size: int) -> Iterator[List[str]]:
+    """Batches of the questions whose hash is not in the sorted ``stored`` array.
+
+    Questions are checked _SCAN_CHUNK at a time; a chunk that completes no
+    batch yields an empty list, so an async caller can let the loop run.
+    """
+    questions = iter(questions)
+    pending: List[str] = []
+    while True:
+        scanned = list(islice(questions, _SCAN_CHUNK))
+        if not scanned:
+            break
+        chunk = [q for q in scanned if isinstance(q, str) and q.strip()]
+        hashes = np.fromiter((question_hash(q) for q in chunk), dtype=np.uint64, count=len(chunk))
+        if len(stored):
+            found = stored[np.minimum(np.searchsorted(stored, hashes), len(stored) - 1)] == hashes
+            chunk = [q for q, known in zip(chunk, found.tolist()) if not known]
+        pending.extend(chunk)
+        if len(pending) < batch_size:
+            yield []
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if pending:
+        yield pending
+
+class VectorStore:
+    """Append-only, memory-mapped embedding matrix with question text and an optional IVF index.
+
+    Readers work on an immutable snapshot (``self._state``) that is swapped
+    in one assignment after each append, so searches can run in executor
+    threads while the background sync appends.
+    """
+
+    def __init__(self, directory: str = QA_VECTOR_DIR, model: str = EMBED_MODEL, dtype: str = QA_VECTOR_DTYPE):
+        self.directory = directory
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._state: Optional[Dict] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta: Dict) -> None:
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path('meta.json'))
+
+    @property
+    def count(self) -> int:
+        return self._state['count'] if self._state else 0
+
+    def open(self) -> int:
+        """Map the files on disk; returns the number of rows (0 if there is no usable store).
+
+        A store written for another model or dtype is discarded and rebuilt.
+        """
+        meta = self._read_meta()
+        if not meta or meta.get('model') != self.model or meta.get('dtype') != self.dtype.name:
+            if meta:
+                print(f"[QA] Discarding embeddings for {meta.get('model')}/{meta.get('dtype')}; "
+                      f"now using {self.model}/{self.dtype.name}")
+                self.reset()
+            return 0
+        self.dim = meta['dim']
+        self._map(meta)
+        return self.count
+
+    def reset(self) -> None:
+        """Delete the store's files."""
+        for name in ('meta.json', 'vectors.bin', 'text.bin', 'offsets.bin',
+                     'ivf_centroids.npy', 'ivf_rows.npy', 'ivf_bounds.npy'):
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+        self.dim = None
+        self._state = None
+
+    def _map(self, meta: Dict) -> None:
+        count = meta['count']
+        if count == 0:
+            self._state = None
+            return
+        state = {
+            'count': count,
+            'vectors': np.memmap(self._path('vectors.bin'), dtype=self.dtype, mode='r', shape=(count, self.dim)),
+            'offsets': np.memmap(self._path('offsets.bin'), dtype=np.int64, mode='r', shape=(count,)),
+            'text': np.memmap(self._path('text.bin'), dtype=np.uint8, mode='r'),
+            'ivf': None,
+        }
+        ivf = meta.get('ivf')
+        if ivf and ivf['rows'] <= count:
+            state['ivf'] = {
+                'rows': ivf['rows'],
+                'centroids': np.load(self._path('ivf_centroids.npy'), mmap_mode='r'),
+                'members': np.load(self._path('ivf_rows.npy'), mmap_mode='r'),
+                'bounds': np.load(self._path('ivf_bounds.npy')),
+            }
+        self._state = state
+
+    def append(self, questions: Sequence[str], vectors: np.ndarray) -> None:
+        """Add embedded questions to the end of the store (blocking file I/O)."""
+        if not len(questions):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        meta = self._read_meta() or {'model': self.model, 'dtype': self.dtype.name, 'dim': vectors.shape[1], 'count': 0}
+        if meta['count'] == 0:
+            meta['dim'] = vectors.shape[1]
+        if vectors.shape[1] != meta['dim']:
+            raise ValueError(f"Embedding size changed from {meta['dim']} to {vectors.shape[1]}")
+        self.dim = meta['dim']
+        end = self._truncate(meta)
+        encoded = [q.encode('utf-8') for q in questions]
+        with open(self._path('offsets.bin'), 'ab') as f:
+            (np.cumsum([len(b) for b in encoded], dtype=np.int64) + end).tofile(f)
+        with open(self._path('text.bin'), 'ab') as f:
+            f.write(b''.join(encoded))
+        with open(self._path('vectors.bin'), 'ab') as f:
+            np.ascontiguousarray(vectors, dtype=self.dtype).tofile(f)
+        meta['count'] += len(questions)
+        self._write_meta(meta)
+        self._map(meta)
+
+    def _truncate(self, meta: Dict) -> int:
+        """Cut the files back to the rows meta.json counts (a crash may have left a partial append).
+
+        Returns the text length of those rows.
+        """
+        count = meta['count']
+        end = 0
+        if count:
+            end = int(np.fromfile(self._path('offsets.bin'), dtype=np.int64, count=1, offset=(count - 1) * 8)[0])
+        sizes = {'vectors.bin': count * meta['dim'] * self.dtype.itemsize, 'offsets.bin': count * 8, 'text.bin': end}
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+        return end
+
+    def question(self, row: int, state: Optional[Dict] = None) -> str:
+        state = state or self._state
+        start = int(state['offsets'][row - 1]) if row else 0
+        return bytes(state['text'][start:int(state['offsets'][row])]).decode('utf-8')
+
+    def questions(self) -> List[str]:
+        """Every stored question, in row order."""
+        state = self._state
+        if not state:
+            return []
+        text = bytes(state['text'][:int(state['offsets'][-1])])
+        ends = state['offsets']
+        starts = np.concatenate(([0], ends[:-1]))
+        return [text[s:e].decode('utf-8') for s, e in zip(starts.tolist(), ends.tolist())]
+
+    def question_hashes(self) -> np.ndarray:
+        """Sorted 64-bit hashes of the stored questions (8 bytes a row, to find what still needs embedding)."""
+        state = self._state
+        if not state:
+            return np.empty(0, dtype=np.uint64)
+        text, ends = state['text'], state['offsets']
+        hashes = np.empty(state['count'], dtype=np.uint64)
+        start = 0
+        for row, end in enumerate(ends.tolist()):
+            hashes[row] = question_hash(bytes(text[start:end]))
+            start = end
+        hashes.sort()
+        return hashes
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """Top ``k`` (question, cosine similarity) pairs for a unit-length query vector."""
+        state = self._state
+        if not state or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        vectors, ivf = state['vectors'], state['ivf']
+        if ivf is not None:
+            centroid_scores = np.asarray(ivf['centroids']) @ query
+            probes = _top_k(centroid_scores, QA_IVF_PROBES)
+            bounds, members = ivf['bounds'], ivf['members']
+            rows = [np.asarray(members[bounds[c]:bounds[c + 1]]) for c in probes]
+            rows.append(np.arange(ivf['rows'], state['count']))  # Not yet partitioned
+            rows = np.sort(np.concatenate(rows))
+            scores = vectors[rows].astype(np.float32) @ query
+            best = _top_k(scores, k)
+            hits = [(int(rows[i]), float(scores[i])) for i in best]
+        else:
+            hits = []
+            for start in range(0, state['count'], _SEARCH_CHUNK):
+                scores = np.asarray(vectors[start:start + _SEARCH_CHUNK], dtype=np.float32) @ query
+                hits.extend((start + int(i), float(scores[i])) for i in _top_k(scores, k))
+            hits = sorted(hits, key=lambda h: -h[1])[:k]
+        return [(self.question(row, state), score) for row, score in hits]
+
+    def build_ivf(self, nlist: Optional[int] = None, seed: int = 0) -> int:
+        """Partition the rows with spherical k-means (blocking; run in an executor); returns nlist."""
+        state = self._state
+        if not state:
+            return 0
+        count, vectors = state['count'], state['vectors']
+        nlist = nlist or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * 32)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = _normalize(sums[filled])
+
+        assign = np.empty(count, dtype=np.int32)
+        for start in range(0, count, _SEARCH_CHUNK):
+            block = np.asarray(vectors[start:start + _SEARCH_CHUNK], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        members = np.argsort(assign, kind='stable').astype(np.int32)
+        bounds = np.searchsorted(assign[members], np.arange(nlist + 1)).astype(np.int64)
+        np.save(self._path('ivf_centroids.npy'), centroids)
+        np.save(self._path('ivf_rows.npy'), members)
+        np.save(self._path('ivf_bounds.npy'), bounds)
+        meta = self._read_meta()
+        meta['ivf'] = {'nlist': nlist, 'rows': count}
+        self._write_meta(meta)
+        self._map(meta)
+        return nlist
+
+class QAVectorIndex:
+    """Keeps a VectorStore in step with the Q&A dataset and answers semantic queries."""
+
+    def __init__(self, store: Optional[VectorStore] = None):
+        self.store = store or VectorStore()
+        self.pairs: Optional[Dict[str, str]] = None
+        self.stats = {'embedded': 0, 'embed_calls': 0, 'embed_failures': 0, 'queries': 0,
+                      'query_failures': 0, 'query_ms': 0.0}
+
+    @property
+    def ready(self) -> bool:
+        return self.pairs is not None and self.store.count > 0
+
+    async def sync(self, pairs: Dict[str, str], batch_size: int = EMBED_BATCH,
+                   idle_wait=None) -> int:
+        """Embed the dataset's questions that are not in the store yet; returns how many were added.
+
+        Each batch waits for ``idle_wait`` (llm.wait_until_idle in the bot) so
+        embedding only uses spare capacity. Afterwards the IVF index is
+        (re)built when the corpus is large enough and enough rows are
+        unpartitioned. Rows of deleted pairs stay in the store and are
+        skipped at query time.
+        """
+        loop = asyncio.get_running_loop()
+        if self.store.count == 0:
+            await loop.run_in_executor(None, self.store.open)
+        self.pairs = pairs
+        stored = await loop.run_in_executor(None, self.store.question_hashes)
+        # A QAStore pages through its rows; a plain dict is snapshotted since it may change meanwhile
+        questions = pairs if hasattr(pairs, 'iter_items') else list(pairs)
+        added = 0
+        for batch in _missing_batches(questions, stored, batch_size):
+            if not batch:
+                await asyncio.sleep(0)
+                continue
+            if idle_wait is not None:
+                await idle_wait()
+            self.stats['embed_calls'] += 1
+            try:
+                vectors = await embed_texts(batch)
+            except _EMBED_ERRORS as e:
+                self.stats['embed_failures'] += 1
+                print(f"[QA] Embedding batch failed, will retry on the next sync: {e}")
+                break
+            await loop.run_in_executor(None, self.store.append, batch, vectors)
+            added += len(batch)
+            self.stats['embedded'] += len(batch)
+
+        state = self.store._state
+        if state and state['count'] >= QA_IVF_MIN_ROWS:
+            partitioned = state['ivf']['rows'] if state['ivf'] else 0
+            if state['count'] - partitioned > _IVF_RETRAIN_FRACTION * state['count']:
+                nlist = await loop.run_in_executor(None, self.store.build_ivf)
+                print(f"[QA] Partitioned {state['count']} embeddings into {nlist} lists")
+        return added
+
+    async def search(self, message: str, k: int, tenant: Optional[str] = None) -> Optional[List[Tuple[str, str]]]:
+        """(question, answer) pairs nearest to ``message`` that are still in the dataset; None if unavailable."""
+        if not self.ready:
+            return None
+        start = time.perf_counter()
+        self.stats['queries'] += 1
+        try:
+            query = await asyncio.wait_for(
+                embed_texts([message], PRIORITY_INTERACTIVE, tenant, timeout=QUERY_EMBED_TIMEOUT),
+                QUERY_EMBED_TIMEOUT)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._nearest_pairs, query[0], k)
+        except _EMBED_ERRORS:
+            self.stats['query_failures'] += 1
+            return None
+        finally:
+            self.stats['query_ms'] += (time.perf_counter() - start) * 1000
+
+    def _nearest_pairs(self, query: List[float], k: int) -> List[Tuple[str, str]]:
+        hits = self.store.search(query, k * 2)
+        answers = lookup_answers(self.pairs, [q for q, _ in hits])
+        return [(q, answers[q]) for q, _ in hits if q in answers][:k]
+
+    def get_stats(self) -> Dict:
+        """Return embedding/query counters, stored rows and average query latency."""
+        state = self.store._state
+        queries = self.stats['queries']
+        return dict(
+            self.stats,
+            rows=self.store.count,
+            ivf_lists=len(state['ivf']['bounds']) - 1 if state and state['ivf'] else 0,
+            avg_query_ms=self.stats['query_ms'] / queries if queries else 0.0,
+        )
+
+def lookup_answers(pairs: Dict[str, str], questions: List[str]) -> Dict[str, str]:
+    """Answers for the questions still in ``pairs``; one batched query for the QAStore."""
+    get_many = getattr(pairs, 'get_many', None)
+    if get_many is not None:
+        return get_many(questions)
+    return {q: pairs[q] for q in questions if q in pairs}
+
+def fuse_rankings(rankings: Sequence[Sequence[str]], k: int) -> List[str]:
+    """Reciprocal rank fusion: items ranked high in any list come first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1 / (_RRF_K + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])[:k]
+
+async def relevant_examples(qa_pairs: Optional[Dict[str, str]], message: str, lexical: Dict[str, str],
+                            k: int, tenant: Optional[str] = None) -> Dict[str, str]:
+    """Fuse the BM25 examples with semantic neighbours of ``message``.
+
+    Returns ``lexical`` unchanged when semantic retrieval is off, not built
+    for ``qa_pairs`` yet, or fails.
+    """
+    if not QA_VECTORS_ENABLED or not qa_pairs or qa_pairs is not QA_VECTORS.pairs:
+        return lexical
+    semantic = await QA_VECTORS.search(message, k, tenant)
+    if not semantic:
+        return lexical
+    answers = dict(semantic)
+    answers.update(lexical)
+    fused = fuse_rankings([[q for q, _ in semantic], list(lexical)], k)
+    return {q: answers[q] for q in fused}
+
+QA_VECTORS = QAVectorIndex()
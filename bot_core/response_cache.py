@@ -0,0 +1,154 @@
+"""
+Response cache for repeated, near-identical chat messages.
+
+Context-free messages such as greetings share entries across users; entries expire by TTL and LRU.
+"""
+
+import hashlib
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+RESPONSE_CACHE_ENABLED = os.getenv('YUMI_RESPONSE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_TTL = float(os.getenv('YUMI_RESPONSE_CACHE_TTL', '3600'))  # seconds
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('YUMI_RESPONSE_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+# Distinct replies collected per key before it starts serving hits, so repeats don't sound canned
+RESPONSE_CACHE_VARIANTS = int(os.getenv('YUMI_RESPONSE_CACHE_VARIANTS', '3'))
+
+# Context-free messages are short and do not refer back to the conversation
+CONTEXT_FREE_MAX_WORDS = 5
+_CONTEXT_WORDS = frozenset((
+    'it', 'that', 'this', 'these', 'those', 'them', 'he', 'she', 'they', 'him', 'her',
+    'again', 'before', 'earlier', 'remember', 'why', 'yes', 'no', 'yeah', 'nope', 'ok',
+    'okay', 'sure', 'and', 'also', 'then', 'too', 'more', 'same',
+))
+_NON_WORD = re.compile(r"[^\w\s']+")
+_ENTRY_OVERHEAD = 200  # Approximate bytes per entry beyond its text (key tuple, list, timestamps)
+
+def normalize_prompt_text(text: str) -> str:
+    """Lowercase, drop punctuation/emoji and collapse whitespace: "Hi Yumi!! 💕" -> "hi yumi"."""
+    return ' '.join(_NON_WORD.sub(' ', (text or '').lower()).split())
+
+def is_context_free(normalized: str) -> bool:
+    """True for short messages that do not refer to earlier turns."""
+    words = normalized.split()
+    return 0 < len(words) <= CONTEXT_FREE_MAX_WORDS and not _CONTEXT_WORDS.intersection(words)
+
+def context_digest(parts: Iterable[Any]) -> str:
+    """Stable digest of prompt parts: the conversation context here, KV session fingerprints in persona."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(repr(part).encode('utf-8', 'surrogatepass'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+def make_key(persona_mode: str, persona_prompt: str, user_message: str,
+             context: Iterable[Any]) -> Optional[Tuple[str, str, str, str]]:
+    """Build a cache key, or None for messages that normalize to nothing.
+
+    Args:
+        persona_mode: Current persona mode (the cache's partition)
+        persona_prompt: Persona prompt text, so edited custom personas miss
+        user_message: The raw user message
+        context: Prompt context (summary, history lines, user facts); ignored
+            for context-free messages
+    """
+    normalized = normalize_prompt_text(user_message)
+    if not normalized:
+        return None
+    digest = '' if is_context_free(normalized) else context_digest(context)
+    return (persona_mode, context_digest([persona_prompt]), normalized, digest)
+
+class ResponseCache:
+    """LRU + TTL cache of replies, partitioned by persona mode and capped in bytes."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL,
+                 variants: int = RESPONSE_CACHE_VARIANTS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self._entries: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0}
+        self.persona_stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: Tuple, outcome: str) -> None:
+        self.stats[outcome] += 1
+        counts = self.persona_stats.setdefault(key[0], {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+
+    def _drop(self, key: Tuple) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def get(self, key: Optional[Tuple]) -> Optional[str]:
+        """Return a cached reply for ``key``, or None on a miss."""
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry['created'] > self.ttl:
+            self._drop(key)
+            self.stats['expired'] += 1
+            entry = None
+        if entry is None or len(entry['replies']) < self.variants:
+            self._count(key, 'misses')
+            return None
+        self._entries.move_to_end(key)
+        self._count(key, 'hits')
+        return random.choice(entry['replies'])
+
+    def put(self, key: Optional[Tuple], reply: str) -> None:
+        """Store a generated reply under ``key``."""
+        if key is None or not reply:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {'replies': [], 'created': time.monotonic(), 'size': _ENTRY_OVERHEAD + len(key[2])}
+            self._entries[key] = entry
+            self._bytes += entry['size']
+        elif reply in entry['replies'] or len(entry['replies']) >= self.variants:
+            return
+        entry['replies'].append(reply)
+        size = len(reply.encode('utf-8'))
+        entry['size'] += size
+        self._bytes += size
+        self._entries.move_to_end(key)
+        self.stats['stores'] += 1
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+
+    def clear(self, persona_mode: Optional[str] = None) -> None:
+        """Drop every entry, or only one persona's partition."""
+        for key in [k for k in self._entries if persona_mode is None or k[0] == persona_mode]:
+            self._drop(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return counters, hit rate and current size."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+            entries=len(self._entries),
+            bytes=self._bytes,
+            by_persona={mode: dict(counts) for mode, counts in self.persona_stats.items()},
+        )
+
+RESPONSE_CACHE = ResponseCache()
+
+def mentions_user_context(reply: str, user_facts: Optional[Dict]) -> bool:
+    """True if a reply repeats one of the user's stored facts, so it must not be shared."""
+    lowered = reply.lower()
+    return any(len(str(value)) >= 3 and str(value).lower() in lowered for value in (user_facts or {}).values())
+
+def request_context(request: Dict[str, Any]) -> List[Any]:
+    """The parts of a persona._prepare_request result that describe the conversation."""
+    return [
+        request.get('summary'),
+        request.get('convo_history'),
+        request.get('important_history'),
+        sorted((request.get('user_facts') or {}).items()),
+    ]
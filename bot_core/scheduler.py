@@ -0,0 +1,158 @@
+"""
+Fair, priority-aware admission of requests to the LLM backend.
+
+Requests are ordered by priority class, then by weighted fair queuing between tenants (guilds or DMs).
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+LLM_CONCURRENCY = int(os.getenv('YUMI_LLM_CONCURRENCY', '4'))  # Match OLLAMA_NUM_PARALLEL on the server
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_EXTRACTION = 1
+PRIORITY_SUMMARY = 2
+PRIORITY_REMINDER = 3
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_EXTRACTION: 'extraction',
+    PRIORITY_SUMMARY: 'summary',
+    PRIORITY_REMINDER: 'reminder',
+}
+
+DEFAULT_TENANT = 'global'
+_WAIT_SAMPLES = 512  # Recent wait times kept per priority for percentiles
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    """Parse "guild:123=2,dm:456=0.5" into tenant weights."""
+    weights = {}
+    for item in value.split(','):
+        tenant, _, weight = item.strip().rpartition('=')
+        if not tenant:
+            continue
+        try:
+            weights[tenant] = max(float(weight), 0.01)
+        except ValueError:
+            print(f"[Scheduler] Ignoring invalid tenant weight: {item!r}")
+    return weights
+
+TENANT_WEIGHTS = _parse_weights(os.getenv('YUMI_LLM_TENANT_WEIGHTS', ''))
+
+def tenant_for(guild_id=None, user_id=None) -> str:
+    """Tenant name for fair queuing: the guild, or the user for DMs."""
+    if guild_id is not None:
+        return f"guild:{guild_id}"
+    if user_id is not None:
+        return f"dm:{user_id}"
+    return DEFAULT_TENANT
+
+class LLMScheduler:
+    """Bounded-concurrency scheduler with priority classes and per-tenant fair queuing.
+
+    Args:
+        slots: Requests allowed to run at once
+        weights: Optional tenant -> weight overrides (default weight 1)
+    """
+
+    def __init__(self, slots: int = LLM_CONCURRENCY, weights: Optional[Dict[str, float]] = None):
+        self.slots = max(1, slots)
+        self.weights = TENANT_WEIGHTS if weights is None else weights
+        self.running = 0
+        self._queue: List[Tuple[int, float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._virtual_time: Dict[int, float] = {}  # Per priority class
+        self._finish: Dict[Tuple[int, str], float] = {}  # Last finish tag per (priority, tenant)
+        self._waits: Dict[int, Deque[float]] = {p: deque(maxlen=_WAIT_SAMPLES) for p in PRIORITY_NAMES}
+        self.stats = {'admitted': 0, 'queued': 0, 'cancelled': 0, 'max_queue_depth': 0}
+
+    def _finish_tag(self, priority: int, tenant: str) -> float:
+        """Virtual finish time of a new request from ``tenant``."""
+        start = max(self._virtual_time.get(priority, 0.0), self._finish.get((priority, tenant), 0.0))
+        finish = start + 1.0 / self.weights.get(tenant, 1.0)
+        self._finish[(priority, tenant)] = finish
+        return finish
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the best waiting requests."""
+        while self.running < self.slots and self._queue:
+            priority, finish, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # Waiter was cancelled
+            self._virtual_time[priority] = max(self._virtual_time.get(priority, 0.0), finish)
+            self.running += 1
+            future.set_result(None)
+        if len(self._finish) > 4096:
+            # Tenants whose tags the clock has passed start fresh either way
+            self._finish = {k: v for k, v in self._finish.items()
+                            if v > self._virtual_time.get(k[0], 0.0)}
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, tenant: str = DEFAULT_TENANT) -> None:
+        """Wait for a slot. Pair with release()."""
+        started = time.monotonic()
+        finish = self._finish_tag(priority, tenant)
+        if self.running < self.slots and not self._queue:
+            self._virtual_time[priority] = max(self._virtual_time.get(priority, 0.0), finish)
+            self.running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, finish, next(self._seq), future))
+            self.stats['queued'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self._queue))
+            self._dispatch()  # The queue may only hold cancelled waiters
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()  # Slot was granted just as we were cancelled
+                else:
+                    future.cancel()
+                self.stats['cancelled'] += 1
+                raise
+        self.stats['admitted'] += 1
+        self._waits.setdefault(priority, deque(maxlen=_WAIT_SAMPLES)).append(time.monotonic() - started)
+
+    def release(self) -> None:
+        """Free a slot and admit the next waiting request."""
+        self.running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, tenant: Optional[str] = None):
+        """``async with scheduler.slot(priority, tenant):`` around one backend request."""
+        await self.acquire(priority, tenant or DEFAULT_TENANT)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Waiting requests per priority class."""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depth
+
+    def get_stats(self) -> Dict:
+        """Return counters, queue depth and wait-time percentiles (ms) per priority class."""
+        waits = {}
+        for priority, samples in self._waits.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            waits[PRIORITY_NAMES.get(priority, str(priority))] = {
+                'avg_ms': sum(ordered) / len(ordered) * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'max_ms': ordered[-1] * 1000,
+            }
+        return dict(self.stats, running=self.running, slots=self.slots,
+                    queue_depth=self.queue_depth(), wait=waits)
+
+LLM_SCHEDULER = LLMScheduler()
@@ -0,0 +1,94 @@
+"""
+Write-behind persistence for the bot's JSON state files.
+
+Dirty files are flushed at most once per interval, written on a worker thread through an atomic rename.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Dict
+
+JSON_STORE_FLUSH_INTERVAL = float(os.getenv('YUMI_STORE_FLUSH_INTERVAL', '2.0'))  # seconds
+
+class JsonStore:
+    """Coalescing, write-behind store of JSON files keyed by path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}  # path -> (data or callable, json.dump kwargs)
+        self.stats = {'marked': 0, 'files_written': 0, 'write_errors': 0}
+
+    def mark_dirty(self, path: str, data: Any, **dump_kwargs) -> None:
+        """Schedule ``path`` to be rewritten with ``data`` on the next flush.
+
+        Args:
+            path: File to write
+            data: Object to serialize, or a callable returning it; it is read at
+                flush time, so later changes to the same object are included
+            **dump_kwargs: Extra json.dumps arguments (e.g. ``indent=2``)
+        """
+        with self._lock:
+            self._pending[path] = (data, dump_kwargs)
+            self.stats['marked'] += 1
+
+    def pending(self) -> int:
+        """Number of files waiting to be written."""
+        return len(self._pending)
+
+    def _serialize(self) -> Dict[str, str]:
+        """Take every pending file and render its current contents."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        payloads = {}
+        for path, (data, dump_kwargs) in pending.items():
+            try:
+                payloads[path] = json.dumps(data() if callable(data) else data,
+                                            ensure_ascii=False, **dump_kwargs)
+            except Exception as e:
+                self.stats['write_errors'] += 1
+                print(f"[Store] Error serializing {path}: {e}")
+        return payloads
+
+    def _write(self, payloads: Dict[str, str]) -> int:
+        """Atomically replace each file with its payload; blocking."""
+        written = 0
+        for path, payload in payloads.items():
+            tmp_path = path + '.tmp'
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+                written += 1
+            except OSError as e:
+                self.stats['write_errors'] += 1
+                print(f"[Store] Error writing {path}: {e}")
+        self.stats['files_written'] += written
+        return written
+
+    async def flush_async(self) -> int:
+        """Serialize on the event loop, then write on a worker thread.
+
+        Returns:
+            Number of files written
+        """
+        payloads = self._serialize()
+        if not payloads:
+            return 0
+        return await asyncio.get_running_loop().run_in_executor(None, self._write, payloads)
+
+    def flush(self) -> int:
+        """Write every pending file now, e.g. on shutdown.
+
+        Returns:
+            Number of files written
+        """
+        return self._write(self._serialize())
+
+JSON_STORE = JsonStore()
@@ -0,0 +1,61 @@
+"""
+Progressive delivery of streamed replies to Discord.
+
+The reply is posted once its first sentence is complete, then edited in place within the channel rate limit.
+"""
+
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Optional
+
+STREAM_RESPONSES = os.getenv('YUMI_STREAM_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+STREAM_EDIT_INTERVAL = float(os.getenv('YUMI_STREAM_EDIT_INTERVAL', '1.2'))  # seconds between edits
+DISCORD_MESSAGE_LIMIT = 2000
+
+# End of a sentence: terminal punctuation followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r'[.!?~…]+["\')\]*]*\s|\n')
+
+def first_sentence_end(text: str) -> int:
+    """Return the index just past the first complete sentence, or -1 if there is none yet."""
+    match = _SENTENCE_END.search(text)
+    return match.end() if match else -1
+
+async def stream_to_channel(channel, snapshots: AsyncIterator[str],
+                            edit_interval: float = STREAM_EDIT_INTERVAL) -> Optional[str]:
+    """Send a reply to ``channel`` while it is being generated.
+
+    Args:
+        channel: Discord channel (anything with an async ``send``)
+        snapshots: Async iterator of the full reply text so far, e.g.
+            persona.stream_response
+        edit_interval: Minimum seconds between edits of the posted message
+
+    Returns:
+        The complete reply text, or None if nothing was generated
+    """
+    loop = asyncio.get_running_loop()
+    message = None
+    shown = ''
+    last_edit = 0.0
+    text = ''
+    async for text in snapshots:
+        if message is None:
+            if first_sentence_end(text) < 0:
+                continue
+            shown = text[:DISCORD_MESSAGE_LIMIT]
+            message = await channel.send(shown)
+            last_edit = loop.time()
+        elif loop.time() - last_edit >= edit_interval and text[:DISCORD_MESSAGE_LIMIT] != shown:
+            shown = text[:DISCORD_MESSAGE_LIMIT]
+            await message.edit(content=shown)
+            last_edit = loop.time()
+
+    final = text[:DISCORD_MESSAGE_LIMIT]
+    if not final:
+        return None
+    if message is None:
+        await channel.send(final)
+    elif final != shown:
+        await message.edit(content=final)
+    return text
@@ -0,0 +1,100 @@
+"""
+Rolling summarization of old conversation turns.
+
+Turns past the horizon are folded into a per-context summary that prompts carry instead of the raw backlog.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from . import history
+from . import llm
+from .prompt import estimate_tokens, get_context_budget, truncate_to_tokens
+
+SUMMARY_HORIZON = int(os.getenv('YUMI_SUMMARY_HORIZON', '40'))  # Most recent messages kept verbatim
+SUMMARY_MIN_BATCH = int(os.getenv('YUMI_SUMMARY_MIN_BATCH', '20'))  # Fold at least this many at once
+SUMMARY_MAX_BATCH = 200  # Cap per LLM call; long backlogs are folded over several passes
+SUMMARY_INTERVAL = float(os.getenv('YUMI_SUMMARY_INTERVAL', '300'))  # seconds
+SUMMARY_MAX_CHARS = 2000
+SUMMARY_NUM_PREDICT = 300
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a chat between a user and Yumi. "
+    "Merge the previous summary with the new messages into one short paragraph. "
+    "Keep names, facts about the user, preferences, plans, promises and unresolved topics. "
+    "Drop greetings and small talk. Write in third person and never invent details."
+)
+
+def build_summary_prompt(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Build the prompt that folds ``messages`` into ``previous_summary``."""
+    head = f"{SUMMARY_INSTRUCTIONS}\n\nPrevious summary:\n{previous_summary or '(none)'}\n\nNew messages:\n"
+    tail = "\n\nUpdated summary:"
+    transcript = '\n'.join(filter(None, (history.format_message_for_context(msg) for msg in messages)))
+    budget = get_context_budget(llm.OLLAMA_MODEL) - SUMMARY_NUM_PREDICT - estimate_tokens(head + tail)
+    return head + truncate_to_tokens(transcript, budget) + tail
+
+async def summarize_context(context_key: Any, log: Optional[history.HistoryLog] = None,
+                            manager: Optional[history.HistoryManager] = None) -> bool:
+    """Fold one batch of a context's turns beyond the horizon into its summary.
+
+    Args:
+        context_key: The conversation context to summarize
+        log: History log holding the context (defaults to history.HISTORY_LOG)
+        manager: If given, the context is invalidated there so its next use
+            reloads only the turns after the new summary
+
+    Returns:
+        True if the summary was updated
+    """
+    log = log or history.HISTORY_LOG
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(None, log.read_summary, context_key)
+    # Retention may have archived turns that were never summarized
+    base = await loop.run_in_executor(None, log.base, context_key)
+    covered = max(summary.get('covered', 0), base)
+    total = await loop.run_in_executor(None, log.count, context_key)
+    fold_until = min(total - SUMMARY_HORIZON, covered + SUMMARY_MAX_BATCH)
+    if fold_until - covered < SUMMARY_MIN_BATCH:
+        return False
+
+    messages = await loop.run_in_executor(None, lambda: log.read(context_key, start=covered))
+    messages = messages[:fold_until - covered]
+    text = await llm.generate_completion(
+        build_summary_prompt(summary.get('text', ''), messages),
+        temperature=0.3,
+        num_predict=SUMMARY_NUM_PREDICT
+    )
+    if not text:
+        return False
+
+    new_summary = {
+        'text': history.clean_response(text)[:SUMMARY_MAX_CHARS],
+        'covered': fold_until,
+        'updated': datetime.utcnow().isoformat(),
+    }
+    await loop.run_in_executor(None, log.write_summary, context_key, new_summary)
+    if manager is not None:
+        manager.invalidate(context_key)
+    return True
+
+async def summarize_hot_contexts(manager: history.HistoryManager,
+                                 log: Optional[history.HistoryLog] = None) -> int:
+    """Run one summarization pass over the contexts resident in ``manager``.
+
+    Each context waits until no user-facing generation is running, so
+    summaries only ever use idle LLM capacity.
+
+    Returns:
+        Number of contexts whose summary was updated
+    """
+    updated = 0
+    for context_key in list(manager.keys()):
+        await llm.wait_until_idle()
+        try:
+            if await summarize_context(context_key, log or manager.log, manager):
+                updated += 1
+        except Exception as e:
+            print(f"[Summary] Error summarizing context {context_key}: {e}")
+    return updated
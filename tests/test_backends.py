@@ -0,0 +1,291 @@
+"""
+Test suite for the Ollama backend pool, using local stub servers.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import backends, llm
+from bot_core.backends import Backend, BackendPool, parse_backends
+from bot_core.http_client import HTTP_CLIENTS
+
+
+class StubOllama:
+    """A local /api/generate + /api/tags server with a fixed latency."""
+
+    def __init__(self, name, latency=0.0, status=200):
+        self.name = name
+        self.latency = latency
+        self.status = status
+        self.hits = 0
+        self.runner = None
+        self.url = None
+
+    async def generate(self, request):
+        await request.json()
+        self.hits += 1
+        await asyncio.sleep(self.latency)
+        if self.status != 200:
+            return web.Response(status=self.status)
+        return web.json_response({"response": f"hello from {self.name}", "done": True})
+
+    async def tags(self, request):
+        if self.status != 200:
+            return web.Response(status=self.status)
+        return web.json_response({"models": []})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/api/generate', self.generate)
+        app.router.add_get('/api/tags', self.tags)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def send(pool, model='mistralrp'):
+    """One request through the pool, the way llm.py sends them."""
+    session = HTTP_CLIENTS.get()
+    async with pool.request(model) as backend, \
+            session.post(backend.generate_url, json={'model': model}) as resp:
+        resp.raise_for_status()
+        return (await resp.json())['response']
+
+
+class TestBackendPool:
+    """Test routing, ejection, probing and slow-start."""
+
+    def test_parse_and_model_routing(self):
+        """Backends declare models; requests only go to backends serving theirs."""
+        pool = BackendPool(parse_backends(
+            'http://gpu1:11434/api/generate=mistralrp|llava:7b, http://gpu2:11434=mistralrp,http://any:11434'))
+        assert [b.url for b in pool.backends] == ['http://gpu1:11434', 'http://gpu2:11434', 'http://any:11434']
+        assert pool.backends[0].generate_url == 'http://gpu1:11434/api/generate'
+        assert pool.backends[2].models == frozenset()
+        for _ in range(20):
+            assert pool.pick('llava:7b').url in ('http://gpu1:11434', 'http://any:11434')
+
+    def test_least_outstanding_prefers_fast_backend(self):
+        """With requests overlapping, the faster server ends up taking more of them."""
+        async def run():
+            fast = await StubOllama('fast', latency=0.005).start()
+            slow = await StubOllama('slow', latency=0.1).start()
+            pool = BackendPool([Backend(fast.url), Backend(slow.url)])
+            try:
+                async def worker():
+                    for _ in range(5):
+                        await send(pool)
+                await asyncio.gather(*(worker() for _ in range(4)))
+                return fast.hits, slow.hits, pool.get_stats()
+            finally:
+                await HTTP_CLIENTS.close()
+                await fast.stop()
+                await slow.stop()
+
+        fast_hits, slow_hits, stats = asyncio.run(run())
+        assert fast_hits + slow_hits == 20
+        assert fast_hits > 2 * slow_hits
+        assert all(b['outstanding'] == 0 for b in stats['backends'].values())
+
+    def test_failing_backend_is_ejected(self, monkeypatch):
+        """Repeated errors take a backend out of rotation for the cool-down."""
+        monkeypatch.setattr(backends, 'BACKEND_EJECT_AFTER', 2)
+
+        async def run():
+            good = await StubOllama('good').start()
+            bad = await StubOllama('bad', status=500).start()
+            pool = BackendPool([Backend(good.url), Backend(bad.url)])
+            errors = 0
+            try:
+                for _ in range(20):
+                    try:
+                        await send(pool)
+                    except Exception:
+                        errors += 1
+                return errors, bad.hits, pool.get_stats()['backends'][bad.url]
+            finally:
+                await HTTP_CLIENTS.close()
+                await good.stop()
+                await bad.stop()
+
+        errors, bad_hits, bad_stats = asyncio.run(run())
+        assert errors == bad_hits == 2
+        assert bad_stats['ejected'] and bad_stats['ejections'] == 1
+
+    def test_probe_recovery_slow_starts(self, monkeypatch):
+        """A backend that fails its probe leaves rotation and is eased back in when it recovers."""
+        monkeypatch.setattr(backends, 'BACKEND_SLOW_START', 60)
+
+        async def run():
+            a = await StubOllama('a').start()
+            b = await StubOllama('b', status=503).start()
+            pool = BackendPool([Backend(a.url), Backend(b.url)])
+            try:
+                assert await pool.probe_all() == 1
+                assert {pool.pick().url for _ in range(10)} == {a.url}
+                b.status = 200
+                assert await pool.probe_all() == 2
+                recovered = pool.backends[1]
+                # Just recovered: its load counts ten times over, so the idle peer still wins
+                assert recovered.healthy and recovered.load(recovered.recovered_at) == 10
+                return {pool.pick().url for _ in range(10)}, a.url
+            finally:
+                await HTTP_CLIENTS.close()
+                await a.stop()
+                await b.stop()
+
+        picked, a_url = asyncio.run(run())
+        assert picked == {a_url}
+
+    def test_llm_requests_go_through_pool(self, monkeypatch):
+        """generate_completion sends to the pool's backend for the configured model."""
+        async def run():
+            stub = await StubOllama('stub').start()
+            monkeypatch.setattr(llm, 'OLLAMA_POOL', BackendPool([Backend(stub.url)]))
+            try:
+                return await llm.generate_completion('prompt for the pool test'), stub.hits
+            finally:
+                await HTTP_CLIENTS.close()
+                await stub.stop()
+
+        assert asyncio.run(run()) == ('hello from stub', 1)
+
+
+class TestCircuitBreaker:
+    """Test failing fast, half-open trials, adaptive timeouts and hedging."""
+
+    def test_breaker_fails_fast_then_half_opens(self, monkeypatch):
+        """An open breaker rejects without sending; after the cool-down one trial decides."""
+        monkeypatch.setattr(backends, 'BACKEND_EJECT_AFTER', 2)
+        monkeypatch.setattr(backends, 'BACKEND_EJECT_SECONDS', 0.05)
+
+        async def run():
+            stub = await StubOllama('flaky', status=500).start()
+            backend = Backend(stub.url)
+            pool = BackendPool([backend])
+            try:
+                for _ in range(2):
+                    with pytest.raises(Exception):
+                        await send(pool)
+                assert backend.state == backends.OPEN
+                with pytest.raises(backends.BackendUnavailable):
+                    await send(pool)
+                assert stub.hits == 2  # Rejected before reaching the server
+
+                await asyncio.sleep(0.06)
+                with pytest.raises(Exception):
+                    await send(pool)  # Failed trial reopens with a doubled cool-down
+                assert backend.state == backends.OPEN and backend.cooldown == 0.1
+
+                await asyncio.sleep(0.11)
+                stub.status = 200
+                assert await send(pool) == 'hello from flaky'
+                return backend.state, backend.cooldown, stub.hits
+            finally:
+                await HTTP_CLIENTS.close()
+                await stub.stop()
+
+        assert asyncio.run(run()) == (backends.CLOSED, 0.05, 4)
+
+    def test_client_errors_leave_the_breaker_alone(self, monkeypatch):
+        """4xx responses are the request's fault: they are re-raised without opening the breaker."""
+        monkeypatch.setattr(backends, 'BACKEND_EJECT_AFTER', 2)
+
+        async def run():
+            stub = await StubOllama('picky', status=404).start()
+            backend = Backend(stub.url)
+            pool = BackendPool([backend])
+            try:
+                for _ in range(3):
+                    with pytest.raises(aiohttp.ClientResponseError) as error:
+                        await send(pool)
+                    assert error.value.status == 404
+                return backend.state, backend.failures, backend.stats['errors'], stub.hits
+            finally:
+                await HTTP_CLIENTS.close()
+                await stub.stop()
+
+        assert asyncio.run(run()) == (backends.CLOSED, 0, 0, 3)
+        assert backends.is_backend_failure(asyncio.TimeoutError())
+        assert not backends.is_backend_failure(ValueError())
+
+    def test_generation_falls_back_fast_when_backends_are_down(self, monkeypatch):
+        """Once the breaker is open, replies fall back in milliseconds instead of retrying."""
+        monkeypatch.setattr(backends, 'BACKEND_EJECT_AFTER', 2)
+        monkeypatch.setattr(llm, 'RETRY_DELAY', 0.01)
+
+        async def run():
+            stub = await StubOllama('down', status=500).start()
+            monkeypatch.setattr(llm, 'OLLAMA_POOL', BackendPool([Backend(stub.url)]))
+            try:
+                first = await llm.generate_llm_response('hello there yumi', 'system')
+                start = time.perf_counter()
+                second = await llm.generate_llm_response('are you there yumi', 'system')
+                return first, second, time.perf_counter() - start, stub.hits
+            finally:
+                await HTTP_CLIENTS.close()
+                await stub.stop()
+
+        first, second, elapsed, hits = asyncio.run(run())
+        assert first == second == llm.get_fallback_response('connection')
+        assert hits == 2 and elapsed < 0.05
+
+    def test_timeout_adapts_to_latency(self):
+        """Timeouts follow the backend's p95, clamped, and fall back to the pool's samples."""
+        fast, fresh = Backend('http://fast:11434'), Backend('http://fresh:11434')
+        pool = BackendPool([fast, fresh])
+        assert pool.timeout_for(fast, 0.95, 3, 5, 30) == 30  # Nothing measured yet
+        for _ in range(20):
+            pool.observe(fast, 2.0)
+        assert pool.timeout_for(fast, 0.95, 3, 5, 30) == 6.0
+        assert pool.timeout_for(fresh, 0.95, 3, 5, 30) == 6.0
+        for _ in range(200):
+            pool.observe(fast, 0.1)
+        assert pool.timeout_for(fast, 0.95, 3, 5, 30) == 5
+
+    def test_slow_request_is_hedged_to_another_backend(self, monkeypatch):
+        """A request slower than the pool's p95 is raced on a second backend, which wins."""
+        async def run():
+            slow = await StubOllama('slow', latency=0.5).start()
+            fast = await StubOllama('fast').start()
+            pool = BackendPool([Backend(slow.url), Backend(fast.url)])
+            for _ in range(20):
+                pool.latency.add(0.02)
+            monkeypatch.setattr(llm, 'OLLAMA_POOL', pool)
+            monkeypatch.setattr(llm, 'HEDGE_STATS', {'sent': 0, 'won': 0})
+            session = llm.KV_SESSIONS.checkout('hedge', 'fp', None)
+            session.backend = slow.url  # Affinity sends the first copy to the slow server
+            try:
+                start = time.perf_counter()
+                reply = await llm.generate_llm_response('tell me something nice', 'system', kv_session=session)
+                return reply, time.perf_counter() - start, slow.hits, fast.hits, session.backend == fast.url
+            finally:
+                await HTTP_CLIENTS.close()
+                await slow.stop()
+                await fast.stop()
+
+        reply, elapsed, slow_hits, fast_hits, context_on_fast = asyncio.run(run())
+        assert reply == 'hello from fast' and elapsed < 0.3
+        assert slow_hits == fast_hits == 1
+        assert llm.get_hedge_stats() == {'sent': 1, 'won': 1, 'win_rate': 1.0}
+        assert context_on_fast
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,94 @@
+"""
+Test suite for the dataset conversion pipeline, run offline from local files.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import datasets
+from bot_core.qa_store import QAStore
+
+
+def write_jsonl(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """A dataset folder with local raw inputs for three sources, one of them malformed."""
+    raw = tmp_path / 'raw'
+    write_jsonl(str(raw / 'daily_dialog.jsonl'), [
+        {'dialog': ['Hi there!', 'Hello!', 'How are you?', 'Great.']},
+        {'dialog': ['Bye', 'See you']},
+    ])
+    write_jsonl(str(raw / 'alpaca.jsonl'), [
+        {'instruction': 'Say hi', 'output': 'Hi!'},
+        {'instruction': ' ', 'output': 'skipped'},
+        {'instruction': 'How are you?', 'output': 'Fine, thanks.'},
+    ])
+    write_jsonl(str(raw / 'oasst1.jsonl'), [{'messages': 'not a list of turns'}])
+    return tmp_path
+
+
+class TestDatasetPipeline:
+    """Test converters, the multiprocess pipeline and merging into the Q&A store."""
+
+    def test_converters_run_in_worker_processes(self, dataset_dir):
+        """Each source streams its records to JSONL; a failing source doesn't stop the others."""
+        results = datasets.convert_datasets(['daily_dialog', 'alpaca', 'oasst1'], workers=3,
+                                            output_dir=str(dataset_dir), raw_dir=str(dataset_dir / 'raw'))
+        assert results['daily_dialog']['records'] == 4 and results['alpaca']['records'] == 2
+        assert 'error' in results['oasst1'] and not (dataset_dir / 'oasst1.jsonl').exists()
+        assert not (dataset_dir / 'oasst1.jsonl.tmp').exists()  # The partial output is cleaned up
+        assert read_jsonl(str(dataset_dir / 'daily_dialog.jsonl'))[:2] == [
+            {'q': 'hi there!', 'a': 'Hello!'}, {'q': 'hello!', 'a': 'How are you?'}]
+
+        # Existing outputs are kept unless forced
+        assert datasets.convert_datasets(['alpaca'], output_dir=str(dataset_dir),
+                                         raw_dir=str(dataset_dir / 'raw')) == {}
+
+    def test_load_all_datasets_merges_into_the_store(self, dataset_dir, monkeypatch):
+        """Outputs are merged in registration order (later sources win) alongside legacy JSON files."""
+        monkeypatch.setattr(datasets, 'SOURCES', {n: s for n, s in datasets.SOURCES.items()
+                                                  if n in ('daily_dialog', 'alpaca', 'dolly_15k')})
+        (dataset_dir / 'dolly_15k.json').write_text(json.dumps({'say hi': 'Hey hey!'}), encoding='utf-8')
+        store = QAStore(str(dataset_dir / 'qa.db'))
+        datasets.load_all_datasets(store, workers=1, dataset_dir=str(dataset_dir))
+        assert store['how are you?'] == 'Fine, thanks.'  # alpaca overrides daily_dialog
+        assert store['say hi'] == 'Hey hey!'  # legacy dolly_15k.json comes after alpaca
+        assert len(store) == 5
+
+    def test_reads_parquet_and_arrow(self, tmp_path):
+        """Columnar inputs stream in record batches (needs pyarrow)."""
+        pa = pytest.importorskip('pyarrow')
+        import pyarrow.ipc
+        import pyarrow.parquet
+        table = pa.table({'instruction': ['a', 'b'], 'output': ['A', 'B']})
+        pyarrow.parquet.write_table(table, str(tmp_path / 'rows.parquet'))
+        with pa.OSFile(str(tmp_path / 'rows.arrow'), 'wb') as sink:
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        for name in ('rows.parquet', 'rows.arrow'):
+            assert list(datasets.read_rows(str(tmp_path / name))) == [
+                {'instruction': 'a', 'output': 'A'}, {'instruction': 'b', 'output': 'B'}]
+        with pytest.raises(ValueError):
+            list(datasets.read_rows(str(tmp_path / 'rows.csv')))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
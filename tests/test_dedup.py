@@ -0,0 +1,90 @@
+"""
+Test suite for MinHash/LSH near-duplicate removal from the Q&A store.
+"""
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import dedup
+from bot_core.qa_store import QAStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A store holding one group of near-duplicate greetings among distinct questions."""
+    store = QAStore(str(tmp_path / 'qa.db'))
+    store.update_many([
+        ('how are you?', 'Good, you?'),
+        ('what is your favorite color', 'Pink!'),
+        ('how are you ?', 'Doing great, thanks for asking!'),
+        ('tell me a joke', 'Why did the chicken cross the road?'),
+        ('how r u', 'Fine.'),
+        ('what is your favourite colour?', 'Pink, obviously.'),
+        ('where do you live', 'In your computer.'),
+    ])
+    return store
+
+
+class TestDedup:
+    """Test normalization, candidate generation and the store dedup pass."""
+
+    def test_normalize_spells_out_chat_shorthand(self):
+        """Case, punctuation and shorthand don't make questions different."""
+        assert dedup.normalize('How r u?!') == dedup.normalize('how are you ?') == 'how are you'
+        assert dedup.normalize("I'm ok, thx") == 'i am ok thanks'
+        assert dedup.shingles('?!') == set()
+
+    def test_collapses_near_duplicates_keeping_the_last(self, store):
+        """Each group keeps its latest row, and the report counts what was removed."""
+        stats = dedup.dedupe_store(store, threshold=0.8, keep='last')
+        assert stats['removed'] == 2 and stats['pairs_before'] == 7 and stats['pairs_after'] == 5
+        assert store['how r u'] == 'Fine.' and 'how are you?' not in store and 'how are you ?' not in store
+        assert len(store) == 5 and store.search('joke')
+
+        # Nothing is left to remove on a second pass
+        assert dedup.dedupe_store(store, threshold=0.8)['removed'] == 0
+
+    def test_keep_policies_are_deterministic(self, tmp_path, store):
+        """first and longest pick the same rows every run; unknown policies are rejected."""
+        dedup.dedupe_store(store, threshold=0.8, keep='longest')
+        assert store['how are you ?'] == 'Doing great, thanks for asking!'
+        other = QAStore(str(tmp_path / 'other.db'))
+        other.update_many([('how are you?', 'a'), ('How are you', 'b'), ('how r u', 'c')])
+        dedup.dedupe_store(other, threshold=0.8, keep='first')
+        assert dict(other.items()) == {'how are you?': 'a'}
+        with pytest.raises(ValueError):
+            dedup.dedupe_store(other, keep='random')
+
+    def test_dashboard_pairs_are_never_removed(self, store):
+        """A curated pair survives dedup whatever the policy, and its dataset duplicates go instead."""
+        store.add('how are you?', 'Better now that you are here!', curated=True)
+        assert store.search('joke', k=1)
+        stats = dedup.dedupe_store(store, threshold=0.8, keep='last')
+        assert stats['removed'] == 2 and store['how are you?'] == 'Better now that you are here!'
+        assert 'how are you ?' not in store and 'how r u' not in store
+        assert not store._term_counts  # Counts cached by the search above are stale now
+
+    def test_threshold_is_respected(self, store):
+        """Questions below the threshold survive; a strict threshold only merges identical text."""
+        groups = dedup.find_duplicates([(1, 'what is your name'), (2, 'what is your game'),
+                                        (3, 'what is your name?')],
+                                       lambda ids: {1: 'what is your name', 2: 'what is your game',
+                                                    3: 'what is your name?'}, threshold=0.9)
+        assert groups == [[1, 3]]
+        a, b = dedup.shingles('what is your name'), dedup.shingles('what is your game')
+        assert dedup.jaccard(a, b) < 0.9
+        assert dedup.dedupe_store(store, threshold=1.0)['removed'] == 2  # Only exact normalized matches
+        # Spelling variants are 0.79 similar: merged at 0.75, kept apart at the default 0.8
+        assert dedup.dedupe_store(store, threshold=0.8)['removed'] == 0
+        assert dedup.dedupe_store(store, threshold=0.75)['removed'] == 1
+        assert store['what is your favourite colour?'] == 'Pink, obviously.'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
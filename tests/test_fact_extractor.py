@@ -0,0 +1,164 @@
+"""
+Test suite for batched background user-fact extraction.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import fact_extractor, llm
+from bot_core.fact_extractor import FactExtractor, build_extraction_prompt, parse_extraction
+from bot_core.fact_filter import FactPrefilter, score_message
+from bot_core.scheduler import PRIORITY_EXTRACTION
+
+
+class FakeCompletion:
+    """Stands in for llm.generate_completion and records each call."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    async def __call__(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return self.answer
+
+
+class TestFactExtractor:
+    """Test queueing, batching, parsing and merging of extracted facts."""
+
+    def test_queue_is_bounded_and_skips_noise(self):
+        """Short messages and commands are skipped; a full queue drops the oldest message."""
+        extractor = FactExtractor(queue_size=3, prefilter=FactPrefilter(threshold=0))
+        assert not extractor.submit('1', 'hi')
+        assert not extractor.submit('1', '!help me with this')
+        for n in range(5):
+            assert extractor.submit('1', f'message number {n} here')
+        stats = extractor.get_stats()
+        assert stats['skipped'] == 2 and stats['dropped'] == 2 and stats['queued'] == 3
+        batch = asyncio.run(extractor.next_batch())
+        assert [content for _, content in batch] == [f'message number {n} here' for n in (2, 3, 4)]
+
+    def test_worker_wakeup_is_bound_to_the_running_loop(self):
+        """No asyncio primitive exists until a worker runs, so the import-time singleton works in any loop."""
+        extractor = FactExtractor(batch_wait=0, prefilter=FactPrefilter(threshold=0))
+        assert extractor._ready is None
+
+        async def wait_then_submit():
+            waiter = asyncio.ensure_future(extractor.next_batch())
+            await asyncio.sleep(0)
+            extractor.submit('1', 'my sister lives in Osaka')
+            return await asyncio.wait_for(waiter, 1)
+
+        assert asyncio.run(wait_then_submit()) == [('1', 'my sister lives in Osaka')]
+
+    def test_batch_makes_one_call_for_several_users(self, monkeypatch):
+        """Messages from different users share one extraction call; results merge per user."""
+        fake = FakeCompletion('Sure! {"u1": {"Name": "Sam", "pets": ["cat", "dog"]}, '
+                              '"u2": {"location": "Lisbon", "age": null}}')
+        monkeypatch.setattr(llm, 'generate_completion', fake)
+        extractor = FactExtractor(batch_size=8, batch_wait=0)
+        extractor.submit('111', 'my name is Sam and I have a cat and a dog')
+        extractor.submit('222', 'I moved to Lisbon last year for work')
+        extractor.submit('111', 'I love cooking on weekends')
+        facts = {'222': {'location': 'Porto', 'job': 'nurse'}}
+
+        async def run():
+            batch = await extractor.next_batch()
+            return await extractor.process_batch(batch, facts)
+
+        updated = asyncio.run(run())
+        assert sorted(updated) == ['111', '222']
+        assert facts == {'111': {'name': 'Sam', 'pets': 'cat, dog'},
+                         '222': {'location': 'Lisbon', 'job': 'nurse'}}
+        assert len(fake.calls) == 1
+        prompt, kwargs = fake.calls[0]
+        assert kwargs['priority'] == PRIORITY_EXTRACTION
+        assert '"Porto"' in prompt and '111' not in prompt
+        assert extractor.get_stats()['calls_per_message'] == pytest.approx(1 / 3)
+
+    def test_unusable_answer_falls_back_to_patterns(self, monkeypatch):
+        """A failed call or non-JSON answer still picks up stated names."""
+        monkeypatch.setattr(llm, 'generate_completion', FakeCompletion(None))
+        extractor = FactExtractor()
+        facts = {}
+        updated = asyncio.run(extractor.process_batch(
+            [('1', 'Hello there, my name is Mika'), ('2', 'what a lovely day it is')], facts))
+        assert updated == ['1'] and facts == {'1': {'name': 'mika'}}
+        assert extractor.get_stats()['failed_calls'] == 1
+
+    def test_parse_and_prompt_labels(self):
+        """Labels map back to user IDs; answers that aren't a JSON object are rejected."""
+        prompt, labels = build_extraction_prompt({'42': ['a message'], '7': ['another']}, {})
+        assert labels == {'u1': '42', 'u2': '7'}
+        assert prompt.endswith('JSON:')
+        assert parse_extraction('{"u2": {"occupation": "baker"}}', labels) == {'42': {}, '7': {'occupation': 'baker'}}
+        assert parse_extraction('no facts here', labels) is None
+        assert parse_extraction('{"u1": {name: Sam}}', labels) is None
+        assert fact_extractor.basic_facts("i'm x") == {}
+
+
+FACT_MESSAGES = [
+    "my name is Sam by the way",
+    "I live in Lisbon with my girlfriend",
+    "I'm 23 and I work as a nurse",
+    "I have a cat named Mochi",
+    "I'm a student at the local university",
+    "my favourite food is ramen",
+    "I'm married and we have two kids",
+    "call me Alex, everyone does",
+    "i really love climbing on weekends",
+    "I was born in Osaka but moved to Berlin",
+]
+CHATTER = [
+    "lol that is so funny",
+    "what do you think about the weather today?",
+    "good morning everyone, hope you slept well",
+    "do you like pizza?",
+    "that movie was pretty good honestly",
+    "can you tell me a joke please",
+    "haha yes exactly what I meant",
+    "are you a real person or a bot?",
+    "ok see you later then",
+    "what's your favourite colour yumi?",
+]
+
+
+class TestFactPrefilter:
+    """Test the local classifier that decides which messages reach the LLM extractor."""
+
+    def test_separates_disclosures_from_chatter(self):
+        """Self-disclosures pass and ordinary chatter is rejected at the default threshold."""
+        prefilter = FactPrefilter(threshold=0.5)
+        assert [prefilter.check(m) for m in FACT_MESSAGES] == [True] * len(FACT_MESSAGES)
+        assert [prefilter.check(m) for m in CHATTER] == [False] * len(CHATTER)
+        stats = prefilter.get_stats()
+        assert stats['passed'] == stats['rejected'] == 10
+        assert stats['cue_hits']['name'] == 2
+
+    def test_threshold_trades_recall_for_precision(self):
+        """A higher threshold passes only the strongest cues; zero passes everything."""
+        assert score_message("my name is Sam")[1] == ('name',)
+        strict = FactPrefilter(threshold=0.9)
+        assert strict.check("my name is Sam and I live in Lisbon")
+        assert not strict.check("i really love climbing on weekends")
+        assert FactPrefilter(threshold=0).check("lol that is so funny")
+
+    def test_extractor_counts_avoided_calls(self):
+        """Rejected messages never reach the queue and are reported as avoided LLM work."""
+        extractor = FactExtractor(batch_size=4)
+        for message in FACT_MESSAGES[:2] + CHATTER:
+            extractor.submit('1', message)
+        stats = extractor.get_stats()
+        assert stats['queued'] == 2 and stats['prefiltered'] == 10
+        assert stats['llm_calls_avoided'] == 2.5
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,329 @@
+"""
+Test suite for the conversation history engine.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import history
+
+
+def make_msg(i, role='user'):
+    return {'role': role, 'content': f'message {i}', 'timestamp': f'2025-01-01T00:00:{i % 60:02d}'}
+
+
+def keep_everything(context_key):
+    return history.RetentionPolicy()
+
+
+class TestHistoryLog:
+    """Test the append-only segmented conversation log."""
+
+    def test_append_and_read_roundtrip(self, tmp_path):
+        """Appended messages are read back in order per context."""
+        log = history.HistoryLog(str(tmp_path))
+        for i in range(5):
+            log.append('1_2_3', make_msg(i))
+        log.append('9_dm', make_msg(99))
+        assert [m['content'] for m in log.read('1_2_3')] == [f'message {i}' for i in range(5)]
+        assert log.read('9_dm') == [make_msg(99)]
+        assert sorted(log.keys()) == ['1_2_3', '9_dm']
+
+    def test_append_writes_constant_bytes(self, tmp_path):
+        """Each append writes only its own record, not the whole history."""
+        log = history.HistoryLog(str(tmp_path))
+        for i in range(200):
+            log.append('ctx', make_msg(i))
+        before = log.stats['bytes_written']
+        log.append('ctx', make_msg(200))
+        assert log.stats['bytes_written'] - before == len(json.dumps(make_msg(200)).encode('utf-8')) + 1
+
+    def test_segments_rotate_and_tail_read(self, tmp_path):
+        """Small segments rotate, and limited reads return only the tail."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256)
+        for i in range(50):
+            log.append('ctx', make_msg(i))
+        assert log.stats['segments_sealed'] > 1
+        tail = log.read('ctx', limit=3)
+        assert [m['content'] for m in tail] == ['message 47', 'message 48', 'message 49']
+
+    def test_reopen_replays_segments(self, tmp_path):
+        """A new log instance recovers everything from disk, including a torn last line."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256)
+        for i in range(20):
+            log.append('ctx', make_msg(i))
+        log.close()
+        active = sorted(f for f in os.listdir(tmp_path / 'ctx') if f.endswith('.log'))[-1]
+        with open(tmp_path / 'ctx' / active, 'ab') as f:
+            f.write(b'{"role": "user", "cont')
+
+        reopened = history.HistoryLog(str(tmp_path), segment_bytes=256)
+        assert len(reopened.read('ctx')) == 20
+        reopened.append('ctx', make_msg(20))
+        assert reopened.read('ctx')[-1] == make_msg(20)
+
+    def test_flush_groups_fsyncs(self, tmp_path):
+        """One flush syncs every touched segment at once."""
+        log = history.HistoryLog(str(tmp_path))
+        for key in ('a', 'b', 'c'):
+            log.append(key, make_msg(0))
+        assert log.flush() == 3
+        assert log.flush() == 0
+
+    def test_compaction_merges_sealed_segments(self, tmp_path):
+        """Compaction merges sealed segments without losing messages."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256, compact_min_segments=2,
+                                 retention=keep_everything)
+        for i in range(60):
+            log.append('ctx', make_msg(i))
+        sealed_before = len(log._load_index('ctx')['sealed'])
+        assert sealed_before >= 2
+        log.compact()
+        assert len(log._load_index('ctx')['sealed']) == 1
+        assert [m['content'] for m in log.read('ctx')] == [f'message {i}' for i in range(60)]
+
+    def test_read_from_absolute_position(self, tmp_path):
+        """Reads can start at an absolute message position across segments."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256)
+        for i in range(40):
+            log.append('ctx', make_msg(i))
+        assert log.count('ctx') == 40
+        assert [m['content'] for m in log.read('ctx', start=35)] == [f'message {i}' for i in range(35, 40)]
+
+    def test_compaction_drops_summarized_messages(self, tmp_path):
+        """Messages covered by the summary are reclaimed while positions stay absolute."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256, compact_min_segments=2,
+                                 retention=keep_everything)
+        for i in range(60):
+            log.append('ctx', make_msg(i))
+        log.write_summary('ctx', {'text': 'earlier chat', 'covered': 20})
+        assert log.compact() > 0
+        assert log.count('ctx') == 60
+        assert log.read('ctx', start=20)[0]['content'] == 'message 20'
+        assert log.read_summary('ctx')['text'] == 'earlier chat'
+        assert [m['content'] for m in log.read_archive('ctx')] == [f'message {i}' for i in range(20)]
+
+
+class TestRetention:
+    """Test tiered retention and the compressed cold archive."""
+
+    def test_policy_by_context_kind(self, monkeypatch):
+        """DMs, guilds and per-guild overrides resolve to their own policies."""
+        override = history.RetentionPolicy(7, 10, 1)
+        monkeypatch.setattr(history, 'GUILD_RETENTION_OVERRIDES', {'55': override})
+        assert history.retention_policy('1_dm') is history.DM_RETENTION
+        assert history.retention_policy('1_44_3') is history.GUILD_RETENTION
+        assert history.retention_policy('1_55_3') is override
+        assert history._parse_retention_overrides('55=7:10:1,bad=1:2, =1:2:3')['55'].max_messages == 10
+
+    def test_expired_messages_move_to_archive(self, tmp_path):
+        """Sealed messages past the hot TTL are archived by day and stay exportable."""
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256,
+                                 retention=lambda key: history.RetentionPolicy(hot_days=30))
+        for i in range(20):
+            log.append('ctx', make_msg(i))
+        recent = {'role': 'user', 'content': 'fresh', 'timestamp': history.datetime.now().isoformat()}
+        for _ in range(5):
+            log.append('ctx', dict(recent))
+        hot_before = len(log.read('ctx'))
+        assert log.compact() > 0
+        archived = log.read_archive('ctx')
+        assert [m['content'] for m in archived] == [f'message {i}' for i in range(20)]
+        assert len(log.read('ctx')) == hot_before - 20
+        assert log.export('ctx') == archived + log.read('ctx')
+        assert log.read_archive('ctx', since='2025-01-01', until='2025-01-01') == archived
+        assert log.read_archive('ctx', since='2025-01-02') == []
+        stats = log.get_stats()
+        assert stats['messages_archived'] == 20 and stats['archive_reads'] == 4
+
+    def test_size_cap_and_archive_ttl(self, tmp_path):
+        """The hot size cap archives the oldest messages; the archive TTL deletes old days."""
+        policy = history.RetentionPolicy(max_messages=10)
+        log = history.HistoryLog(str(tmp_path), segment_bytes=256, retention=lambda key: policy)
+        for i in range(40):
+            log.append('ctx', make_msg(i))
+        log.compact()
+        assert log.count('ctx') == 40 and log.base('ctx') > 0
+        assert len(log.read('ctx')) <= 10 + log._load_index('ctx')['count']
+        assert log.export('ctx') == [make_msg(i) for i in range(40)]
+
+        policy.archive_days = 30
+        log.compact()
+        assert log.read_archive('ctx') == []
+        assert log.get_stats()['archive_files_expired'] == 1
+
+    def test_migrate_legacy_history(self, tmp_path):
+        """A legacy single-file history is imported once and renamed."""
+        legacy = tmp_path / 'convo_history.json'
+        legacy.write_text(json.dumps({'42_dm': [make_msg(1), make_msg(1), make_msg(2, 'assistant')]}), encoding='utf-8')
+        log = history.HistoryLog(str(tmp_path / 'log'))
+        assert history.migrate_legacy_history(str(legacy), log) == 2
+        assert not legacy.exists()
+        stored = log.read('42_dm')
+        assert [m['content'] for m in stored] == ['message 1', 'message 2']
+        assert all(m['features'] & history.FEATURE_NORMALIZED for m in stored)
+
+
+class TestMessage:
+    """Test the compact in-memory message record."""
+
+    def test_dict_compatible_accessors(self):
+        """Messages answer the dict accessors used by history and persona code."""
+        msg = history.Message('assistant', 'hello', 1735689600.0)
+        assert msg['role'] == msg.get('role') == 'assistant'
+        assert msg.get('content', '') == 'hello'
+        assert 'features' not in msg and msg.get('features') is None
+        msg['features'] = 3
+        assert dict(msg) == msg.to_dict() == {
+            'role': 'assistant', 'content': 'hello', 'timestamp': msg.timestamp, 'features': 3,
+        }
+        with pytest.raises(KeyError):
+            msg['missing']
+
+    def test_roundtrip_through_log_format(self):
+        """Converting to and from the log's dict form is lossless."""
+        original = make_msg(5, 'assistant')
+        msg = history.Message.from_dict(original)
+        assert msg.to_dict() == original
+        assert msg == original
+        assert history.Message.from_dict({'role': 'moderator', 'content': 'x'}).role == 'moderator'
+
+    def test_records_reach_the_prompt(self):
+        """Persona formatting accepts records as well as dicts."""
+        from bot_core import persona
+        msgs = [history.Message('user', 'hi'), history.Message('assistant', 'hello!')]
+        assert persona._format_history(msgs) == ['hi', 'hello!']
+
+    def test_loaded_contexts_use_records(self, tmp_path):
+        """Contexts loaded from the log hold Message records."""
+        log = history.HistoryLog(str(tmp_path))
+        log.append('a', history.Message('assistant', 'hi there', 1735689600.0))
+        manager = history.HistoryManager(log)
+        assert isinstance(manager['a'][0], history.Message)
+        assert manager['a'][0].created == 1735689600.0
+
+
+class TestRelevantHistory:
+    """Test feature extraction and relevant-history selection."""
+
+    def test_features_extracted_on_append(self, tmp_path, monkeypatch):
+        """append_message stores feature flags with the message and in the log."""
+        monkeypatch.setattr(history, 'HISTORY_LOG', history.HistoryLog(str(tmp_path)))
+        convo = {'ctx': []}
+        history.append_message(convo, 'ctx', {'role': 'user', 'content': 'Where do you live?'})
+        assert convo['ctx'][0]['features'] & history.FEATURE_QUESTION
+        assert history.HISTORY_LOG.read('ctx')[0]['features'] == convo['ctx'][0]['features']
+
+    def test_append_normalizes_once(self, tmp_path, monkeypatch):
+        """Text is cleaned on append and stored records are loaded without cleaning again."""
+        log = history.HistoryLog(str(tmp_path))
+        monkeypatch.setattr(history, 'HISTORY_LOG', log)
+        manager = history.HistoryManager(log)
+        assert history.append_message(manager, 'ctx', {'role': 'user', 'content': '  hi  '})
+        assert not history.append_message(manager, 'ctx', {'role': 'user', 'content': 'hi'})
+        assert history.append_message(manager, 'ctx', {'role': 'assistant', 'content': '*waves* hello   there'})
+        assert not history.append_message(manager, 'ctx', {'role': 'assistant', 'content': '*waves*'})
+        assert [m['content'] for m in log.read('ctx')] == ['hi', 'hello there']
+
+        def fail(text):
+            raise AssertionError('clean_response called on load')
+
+        monkeypatch.setattr(history, 'clean_response', fail)
+        manager.invalidate('ctx')
+        assert [m['content'] for m in manager['ctx']] == ['hi', 'hello there']
+
+    def test_extract_features(self):
+        """Keyword groups map to their feature flags."""
+        assert history.extract_features('do you remember me') & history.FEATURE_RECALL
+        assert history.extract_features("i'm at work") & history.FEATURE_STATUS
+        assert history.extract_features('anyway, cool') & history.FEATURE_TOPIC_SHIFT
+        assert history.extract_features('ok') == 0
+
+    def test_selection_keeps_recent_and_important(self):
+        """Recent window comes first, followed by important older messages once each."""
+        msgs = [
+            {'role': 'user', 'content': 'what is your name?'},
+            {'role': 'assistant', 'content': 'Yumi!'},
+            {'role': 'user', 'content': 'ok'},
+            {'role': 'assistant', 'content': 'ok'},
+            {'role': 'user', 'content': 'bye'},
+        ]
+        selected = history.get_relevant_history(msgs, window_size=1)
+        assert selected[0] is msgs[4]
+        assert selected[1:] == [msgs[0], msgs[1]]
+        assert len({id(m) for m in selected}) == len(selected)
+
+    def test_selection_without_older_history(self):
+        """Short histories are returned unchanged."""
+        msgs = [{'role': 'user', 'content': 'hi'}]
+        assert history.get_relevant_history(msgs) == msgs
+
+
+class TestHistoryManager:
+    """Test lazy loading and LRU eviction of hot contexts."""
+
+    def test_loads_on_first_touch(self, tmp_path):
+        """Contexts are read from the log on first access and then served from memory."""
+        log = history.HistoryLog(str(tmp_path))
+        log.append('a', make_msg(1))
+        log.append('a', make_msg(2, 'assistant'))
+        manager = history.HistoryManager(log)
+        assert len(manager) == 0
+        assert [m['content'] for m in manager['a']] == ['message 1', 'message 2']
+        manager['a']
+        stats = manager.get_stats()
+        assert (stats['misses'], stats['hits']) == (1, 1)
+        assert stats['resident_messages'] == 2
+
+    def test_unknown_context_is_empty(self, tmp_path):
+        """Unknown keys behave like a defaultdict of deques."""
+        manager = history.HistoryManager(history.HistoryLog(str(tmp_path)))
+        manager['new'].append(make_msg(0))
+        assert len(manager['new']) == 1
+
+    def test_lru_eviction_by_contexts_and_messages(self, tmp_path):
+        """Cold contexts are evicted and reloaded from disk when touched again."""
+        log = history.HistoryLog(str(tmp_path))
+        for key in ('a', 'b', 'c'):
+            for i in range(3):
+                log.append(key, make_msg(i, 'user' if i % 2 == 0 else 'assistant'))
+        manager = history.HistoryManager(log, max_contexts=2)
+        manager['a'], manager['b'], manager['c']
+        assert list(manager.keys()) == ['b', 'c']
+        assert len(manager['a']) == 3
+        assert manager.stats['evictions'] == 2
+
+        small = history.HistoryManager(log, max_messages=4)
+        small['a'], small['b']
+        assert list(small.keys()) == ['b']
+
+    def test_loads_after_summary(self, tmp_path):
+        """Summarized messages are replaced by the summary text when loading."""
+        log = history.HistoryLog(str(tmp_path))
+        for i in range(4):
+            log.append('a', make_msg(i, 'user' if i % 2 == 0 else 'assistant'))
+        log.write_summary('a', {'text': 'they said hello', 'covered': 2})
+        manager = history.HistoryManager(log)
+        assert [m['content'] for m in manager['a']] == ['message 2', 'message 3']
+        assert manager['a'].summary == 'they said hello'
+
+    def test_append_survives_eviction(self, tmp_path, monkeypatch):
+        """Messages appended through append_message are reloaded after eviction."""
+        log = history.HistoryLog(str(tmp_path))
+        monkeypatch.setattr(history, 'HISTORY_LOG', log)
+        manager = history.HistoryManager(log, max_contexts=1)
+        history.append_message(manager, 'a', make_msg(1))
+        history.append_message(manager, 'b', make_msg(2))
+        assert 'a' not in manager
+        assert [m['content'] for m in manager['a']] == ['message 1']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
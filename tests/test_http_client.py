@@ -0,0 +1,51 @@
+"""
+Test suite for the shared HTTP client pools.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core.http_client import HttpClients, BACKEND_OLLAMA, BACKEND_WEB
+
+
+class TestHttpClients:
+    """Test session reuse and lifecycle."""
+
+    def test_one_session_per_backend(self):
+        """Each backend reuses one session until the clients are closed."""
+        clients = HttpClients()
+
+        async def scenario():
+            await clients.start()
+            ollama = clients.get(BACKEND_OLLAMA)
+            assert clients.get(BACKEND_OLLAMA) is ollama
+            assert clients.get(BACKEND_WEB) is not ollama
+            assert ollama.connector.limit > 0
+            await clients.close()
+            assert ollama.closed
+            return ollama
+
+        closed = asyncio.run(scenario())
+        assert closed.closed
+
+    def test_new_loop_gets_new_session(self):
+        """Sessions are loop-bound, so a new event loop gets a fresh one."""
+        clients = HttpClients()
+
+        async def grab():
+            return clients.get(BACKEND_OLLAMA)
+
+        first = asyncio.run(grab())
+        second = asyncio.run(grab())
+        assert first is not second
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
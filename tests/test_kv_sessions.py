@@ -0,0 +1,112 @@
+"""
+Test suite for reusing Ollama's KV context across conversation turns.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import llm, persona, response_cache
+from bot_core.backends import Backend, BackendPool
+from bot_core.history import ConversationHistory, Message, normalize_message
+from bot_core.http_client import HTTP_CLIENTS
+from bot_core.kv_sessions import KVSessionStore
+
+
+class StubOllama:
+    """Answers /api/generate and returns a context that grows with every turn."""
+
+    def __init__(self):
+        self.requests = []
+        self.replies = []
+
+    async def generate(self, request):
+        body = await request.json()
+        self.requests.append(body)
+        reply = self.replies.pop(0)
+        context = list(body.get('context') or []) + [len(self.requests)] * 10
+        return web.json_response({'response': reply, 'context': context, 'done': True})
+
+
+def run_conversation(monkeypatch, turns):
+    """Run (user message, reply, user facts, hook) turns like on_message does; return request bodies."""
+    monkeypatch.setattr(persona, 'KV_SESSIONS', KVSessionStore())
+    monkeypatch.setattr(llm, 'KV_SESSIONS', persona.KV_SESSIONS)
+    monkeypatch.setattr(response_cache, 'RESPONSE_CACHE_ENABLED', False)
+    stub = StubOllama()
+    stub.replies = [reply for _, reply, _, _ in turns]
+    convo = ConversationHistory()
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/api/generate', stub.generate)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(llm, 'OLLAMA_POOL', BackendPool([Backend(f'http://127.0.0.1:{port}')]))
+        try:
+            for user_text, _, facts, hook in turns:
+                if hook:
+                    hook(convo)
+                convo.append(normalize_message(Message('user', user_text)))
+                reply = await persona.generate_response(
+                    user_text, user_facts=facts, convo_history=convo, session_key='u1_dm')
+                convo.append(normalize_message(Message('assistant', reply)))
+        finally:
+            await HTTP_CLIENTS.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+    return stub.requests
+
+
+class TestKVSessions:
+    """Test when turns continue the model's context and when they rebuild it."""
+
+    def test_following_turns_send_only_the_new_message(self, monkeypatch):
+        """After the first full prompt, turns send the user turn plus the returned context."""
+        requests = run_conversation(monkeypatch, [
+            ('hey yumi, I had a long day', 'Aww, come tell me all about it!', None, None),
+            ('my boss yelled at me again', 'That sounds awful, I am sorry.', None, None),
+            ('thanks for listening to me', 'Always, you know I am here.', None, None),
+        ])
+        assert 'context' not in requests[0]
+        assert 'CRITICAL INSTRUCTIONS' in requests[0]['prompt']
+        assert requests[1]['prompt'] == 'User: my boss yelled at me again\nYumi:'
+        assert requests[1]['context'] == [1] * 10
+        assert requests[2]['context'] == [1] * 10 + [2] * 10
+        assert requests[2]['keep_alive']
+        stats = persona.KV_SESSIONS.get_stats()
+        assert stats['reused'] == 2 and stats['started'] == 1 and stats['tokens_reused'] == 30
+
+    def test_changes_invalidate_the_session(self, monkeypatch):
+        """New facts, edited history and rewritten replies fall back to a full prompt."""
+        def edit_history(convo):
+            convo[-1] = Message('assistant', 'A reply the model never wrote.')
+
+        requests = run_conversation(monkeypatch, [
+            ('hi yumi how are you', 'I am great, thanks for asking!', None, None),
+            ('my name is Sam by the way', 'Nice to meet you properly, Sam!', {'name': 'Sam'}, None),
+            ('what should we do today', 'We could watch a movie together!\nUser: yes', {'name': 'Sam'}, None),
+            ('a movie sounds good', 'Then grab the popcorn, Sam!', {'name': 'Sam'}, None),
+            ('which movie though', 'Something cozy and romantic!', {'name': 'Sam'}, edit_history),
+            ('okay let us do it', 'Yay, movie night it is!', {'name': 'Sam'}, None),
+        ])
+        has_context = ['context' in body for body in requests]
+        # facts changed, reply cut at fabricated dialogue, history edited -> full prompts
+        assert has_context == [False, False, True, False, False, True]
+        invalidations = persona.KV_SESSIONS.get_stats()['invalidations']
+        assert invalidations == {'prompt_changed': 1, 'reply_rewritten': 1, 'history_changed': 1}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,68 @@
+"""
+Test suite for request handling in the Ollama client.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import llm
+
+
+class TestSingleFlight:
+    """Test coalescing of identical concurrent requests."""
+
+    def test_identical_requests_share_one_call(self, monkeypatch):
+        """Concurrent identical prompts reach Ollama once; different ones do not coalesce."""
+        monkeypatch.setattr(llm, 'SINGLE_FLIGHT_STATS', {'requests': 0, 'coalesced': 0})
+        calls = []
+
+        async def fake_generate(params, user_message, **kwargs):
+            calls.append(user_message)
+            await asyncio.sleep(0.05)
+            return f"reply to {user_message}"
+
+        monkeypatch.setattr(llm, '_generate_with_retries', fake_generate)
+
+        async def run():
+            same = [llm.generate_llm_response('hello there', 'system') for _ in range(5)]
+            other = llm.generate_llm_response('something else', 'system')
+            results = await asyncio.gather(*same, other)
+            # Once finished, the same prompt is sent again
+            results.append(await llm.generate_llm_response('hello there', 'system'))
+            return results
+
+        results = asyncio.run(run())
+        assert results[:5] == ['reply to hello there'] * 5
+        assert results[5] == 'reply to something else'
+        assert calls == ['hello there', 'something else', 'hello there']
+        stats = llm.get_single_flight_stats()
+        assert stats['requests'] == 7 and stats['coalesced'] == 4
+        assert stats['in_flight'] == 0
+
+    def test_cancelled_waiter_does_not_cancel_others(self, monkeypatch):
+        """Cancelling one caller leaves the shared request running for the rest."""
+        async def fake_post(params, timeout, *args):
+            await asyncio.sleep(0.05)
+            return 'summary'
+
+        monkeypatch.setattr(llm, '_post_completion', fake_post)
+
+        async def run():
+            first = asyncio.ensure_future(llm.generate_completion('prompt'))
+            second = asyncio.ensure_future(llm.generate_completion('prompt'))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(run()) == 'summary'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
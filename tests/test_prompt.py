@@ -0,0 +1,155 @@
+"""
+Test suite for token-budgeted prompt assembly.
+"""
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import prompt
+
+
+class TestTokenEstimator:
+    """Test the local token estimator."""
+
+    def test_estimate_tokens(self):
+        """Plain text is about four characters per token, emoji cost more."""
+        assert prompt.estimate_tokens('') == 0
+        assert prompt.estimate_tokens('a' * 400) == 100
+        assert prompt.estimate_tokens('💕' * 10) > prompt.estimate_tokens('a' * 10)
+
+    def test_truncate_to_tokens(self):
+        """Truncated text fits the requested budget."""
+        text = 'word ' * 500
+        assert prompt.estimate_tokens(prompt.truncate_to_tokens(text, 50)) <= 50
+        assert prompt.truncate_to_tokens('short', 50) == 'short'
+
+    def test_model_budgets(self, monkeypatch):
+        """Per-model budgets override the default."""
+        assert prompt._parse_model_budgets('a=100, b:7b=2048,bad') == {'a': 100, 'b:7b': 2048}
+        monkeypatch.setattr(prompt, 'MODEL_CONTEXT_TOKENS', {'big': 8192})
+        assert prompt.get_context_budget('big') == 8192
+        assert prompt.get_context_budget('other') == prompt.OLLAMA_CONTEXT_TOKENS
+
+
+class TestAssemblePrompt:
+    """Test section admission and rendering."""
+
+    def make_sections(self, history_lines):
+        return [
+            prompt.PromptSection('system', ['Be Yumi.'], prompt.PRIORITY_SYSTEM, required=True),
+            prompt.PromptSection('qa', ['Q: hi\nA: hello'] * 20, prompt.PRIORITY_QA, header='Examples:\n'),
+            prompt.PromptSection('recent_history', history_lines, prompt.PRIORITY_RECENT_HISTORY,
+                                 header='Recent conversation:\n', keep='tail'),
+        ]
+
+    def test_everything_fits(self):
+        """With a large budget every section is rendered in order."""
+        text = prompt.assemble_prompt('hey', self.make_sections(['one', 'two']), 10000)
+        assert text.startswith('Be Yumi.')
+        assert 'Recent conversation:\none\ntwo' in text
+        assert text.endswith('User: hey\nYumi:')
+
+    def test_budget_is_respected(self):
+        """Lower priority sections are trimmed first and the total stays in budget."""
+        history_lines = [f'line {i} ' + 'x' * 40 for i in range(200)]
+        report = {}
+        text = prompt.assemble_prompt('hey', self.make_sections(history_lines), 300, report)
+        assert prompt.estimate_tokens(text) <= 300
+        assert 'line 199' in text
+        assert 'line 0 ' not in text
+        assert sum(report.values()) <= 300
+
+    def test_required_section_is_truncated(self):
+        """A required section that cannot fit is cut instead of dropped."""
+        sections = [prompt.PromptSection('system', ['z' * 4000], prompt.PRIORITY_SYSTEM, required=True)]
+        text = prompt.assemble_prompt('hey', sections, 100)
+        assert text.startswith('z')
+        assert prompt.estimate_tokens(text) <= 100
+
+    def test_deterministic(self):
+        """The same inputs always produce the same prompt."""
+        lines = [f'line {i}' for i in range(100)]
+        first = prompt.assemble_prompt('hey', self.make_sections(lines), 200)
+        assert first == prompt.assemble_prompt('hey', self.make_sections(lines), 200)
+
+
+class TestPromptPrefix:
+    """Test precompiled persona prefixes and the cache-friendly layout."""
+
+    def test_prefix_cache(self):
+        """Prefixes compile once per name and recompile only when their source changes."""
+        cache = prompt.PrefixCache()
+        first = cache.get('custom', 'text v1', lambda: ['base text v1', 'directives'])
+        assert first.text == 'base text v1\n\ndirectives'
+        assert cache.get('custom', 'text v1', lambda: ['unused']) is first
+        second = cache.get('custom', 'text v2', lambda: ['base text v2', 'directives'])
+        assert second.hash != first.hash
+        assert prompt.PromptPrefix(['base text v1', 'directives']).hash == first.hash
+        cache.invalidate('custom')
+        assert cache.get('custom', 'text v2', lambda: ['base text v2', 'directives']) is not second
+
+    def test_persona_prompts_share_a_stable_prefix(self, monkeypatch):
+        """Requests from different users start with the same bytes; custom persona edits change them."""
+        from bot_core import llm, persona
+        monkeypatch.setattr(persona, '_current_mode', 'tsundere')
+        assert persona.get_prompt_prefix() is persona.get_prompt_prefix()
+
+        a = llm._build_params(**persona._prepare_request('hi', user_facts={'name': 'Ann'}))['prompt']
+        b = llm._build_params(**persona._prepare_request('what is up', user_facts={'name': 'Bo'}))['prompt']
+        prefix = persona.get_prompt_prefix()
+        assert a.startswith(prefix.text) and b.startswith(prefix.text)
+        assert persona.get_persona_prompt() in prefix.text and 'CRITICAL INSTRUCTIONS' in prefix.text
+
+        custom = {'text': 'You are Yumi, a pirate.'}
+        monkeypatch.setattr(persona, '_custom_persona_text', lambda mode: custom['text'])
+        monkeypatch.setattr(persona, '_current_mode', 'pirate')
+        pirate = persona.get_prompt_prefix()
+        assert persona.get_prompt_prefix() is pirate
+        custom['text'] = 'You are Yumi, a space pirate.'
+        assert persona.get_prompt_prefix().hash != pirate.hash
+
+    def test_history_window_is_bounded(self, monkeypatch):
+        """Only the lookback is read: the newest messages go in verbatim, earlier questions are sampled."""
+        from bot_core import history, persona
+        monkeypatch.setattr(history, 'PROMPT_WINDOW_SIZE', 4)
+        monkeypatch.setattr(history, 'PROMPT_LOOKBACK', 10)
+        convo = history.ConversationHistory(
+            [{'role': 'user', 'content': 'what is your oldest memory?'}]
+            + [{'role': 'user', 'content': f'message {n}'} for n in range(100)]
+            + [{'role': 'user', 'content': 'what is your favorite song?'}, {'role': 'assistant', 'content': 'ok'}]
+            + [{'role': 'user', 'content': f'later {n}'} for n in range(4)])
+        request = persona._prepare_request('hi', convo_history=convo)
+        assert request['convo_history'] == ['later 0 later 1 later 2 later 3']
+        assert request['important_history'] == ['what is your favorite song?', 'ok']
+        assert history.recent_messages(convo, 2) == list(convo)[-2:] and history.recent_messages([], 2) == []
+
+    def test_retrieved_examples_come_last(self):
+        """Facts, summary and history precede the per-message Q&A examples, which sit before the user turn."""
+        from bot_core import llm
+        text = llm._build_params('hey', 'rules', qa_pairs={'hi': 'hello'}, user_facts={'name': 'Ann'},
+                                 summary='They met.', convo_history=['User: yo'])['prompt']
+        qa = text.index('Example exchanges:')
+        assert text.index('Name: Ann') < qa and text.index('They met.') < qa
+        assert text.index('User: yo') < qa < text.index('User: hey')
+
+    def test_section_bytes_are_recorded(self, monkeypatch):
+        """Every assembled prompt adds its bytes per section to the stats."""
+        monkeypatch.setattr(prompt, 'PROMPT_STATS',
+                            {'prompts': 0, 'prefix_compiled': 0, 'prefix_reused': 0, 'section_bytes': {}})
+        sections = [prompt.PromptSection('system', ['rules'], prompt.PRIORITY_SYSTEM, required=True),
+                    prompt.PromptSection('facts', ['Name: Ann'], prompt.PRIORITY_FACTS, header='Facts: ')]
+        for _ in range(2):
+            prompt.assemble_prompt('hey', sections, 1000)
+        stats = prompt.get_prompt_stats()
+        assert stats['prompts'] == 2
+        assert stats['avg_section_bytes'] == {'system': 5, 'facts': 16, 'user': len('User: hey\nYumi:')}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
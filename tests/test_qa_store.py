@@ -0,0 +1,164 @@
+"""
+Test suite for the on-disk SQLite/FTS5 Q&A store.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import qa_store
+from bot_core.qa_store import QAStore, iter_json_object, relevant_pairs, retrieve_pairs
+
+PAIRS = {
+    "What is your favorite food?": "I love sushi and ramen!",
+    "Do you have any pets?": "No pets, but I adore cats.",
+    "How are you today?": "I'm doing great, thanks for asking!",
+    "What music do you listen to?": "Mostly J-pop and lo-fi beats.",
+    "Can you recommend an anime?": "Try Spirited Away, it's a classic.",
+    "Do you like cats or dogs better?": "Cats, definitely cats.",
+    "Où est le café?": "Juste à côté!",
+}
+
+
+class TestQAStore:
+    """Test dict behaviour, streaming import, retrieval and incremental edits."""
+
+    def test_behaves_like_the_old_dict(self, tmp_path):
+        """Lookups, membership, iteration and length match a dict, and survive reopening."""
+        store = QAStore(str(tmp_path / 'qa.db'))
+        assert not store and len(store) == 0
+        assert store.update_many(PAIRS.items()) == len(PAIRS)
+        assert store["How are you today?"] == PAIRS["How are you today?"]
+        assert "How are you today?" in store and "how are you today?" not in store and 42 not in store
+        assert store.get("missing") is None
+        with pytest.raises(KeyError):
+            store["missing"]
+        store.close()
+
+        reopened = QAStore(str(tmp_path / 'qa.db'))
+        assert list(reopened) == list(PAIRS) and dict(reopened.iter_items()) == PAIRS
+        assert len(reopened) == len(PAIRS) and bool(reopened)
+
+    def test_streaming_json_import(self, tmp_path):
+        """The legacy indent=2 dump is parsed incrementally, across chunk boundaries; later files win."""
+        path = tmp_path / 'chatbot_dataset.json'
+        path.write_text(json.dumps(PAIRS, ensure_ascii=False, indent=2), encoding='utf-8')
+        assert dict(iter_json_object(str(path), chunk_size=7)) == PAIRS
+
+        (tmp_path / 'bad.json').write_text('{"a": "b", "c": ', encoding='utf-8')
+        with pytest.raises(ValueError):
+            list(iter_json_object(str(tmp_path / 'bad.json'), chunk_size=4))
+
+        store = QAStore(str(tmp_path / 'qa.db'))
+        assert store.import_json(str(path)) == len(PAIRS)
+        override = tmp_path / 'more.json'
+        override.write_text(json.dumps({"How are you today?": "Sleepy~", "Skip me": 3}), encoding='utf-8')
+        store.import_json(str(override))
+        assert store["How are you today?"] == "Sleepy~" and "Skip me" not in store
+        assert len(store) == len(PAIRS)
+        assert store.get_many(["How are you today?", "Skip me"]) == {"How are you today?": "Sleepy~"}
+
+    def test_search_and_dashboard_edits(self, tmp_path):
+        """FTS5 retrieval ranks the closest question first and sees edits immediately."""
+        store = QAStore(str(tmp_path / 'qa.db'))
+        store.update_many(PAIRS.items())
+        assert store.search("any good anime you would recommend?", k=3)[0][0] == "Can you recommend an anime?"
+        assert store.search("ou est le cafe", k=1)[0][0] == "Où est le café?"
+        assert store.search("zzz qqq", k=3) == []
+
+        store.add("Which anime studio is your favorite?", "Studio Ghibli!")
+        assert store.search("favorite anime studio", k=1)[0][1] == "Studio Ghibli!"
+        store["Which anime studio is your favorite?"] = "Kyoto Animation!"
+        assert store.search("favorite anime studio", k=1)[0][1] == "Kyoto Animation!"
+        assert store.remove("Can you recommend an anime?") and not store.remove("Can you recommend an anime?")
+        assert all(q != "Can you recommend an anime?" for q, _ in store.search("recommend an anime", k=5))
+        stats = store.get_stats()
+        assert stats['pairs'] == len(PAIRS) and stats['added'] == 1 and stats['removed'] == 1
+
+    def test_common_terms_stay_within_the_scan_budget(self, tmp_path, monkeypatch):
+        """Terms matching more rows than the budget only re-score candidates found through rarer ones."""
+        monkeypatch.setattr(qa_store, 'QA_STORE_SCAN_BUDGET', 5)
+        store = QAStore(str(tmp_path / 'qa.db'))
+        pairs = {f"do you like topic {n}?": f"answer {n}" for n in range(50)}
+        pairs["do you like spicy curry?"] = "Yes, the spicier the better!"
+        store.update_many(pairs.items())
+        assert store.search("do you like spicy food", k=1) == [("do you like spicy curry?", "Yes, the spicier the better!")]
+        assert len(store.search("do you like", k=3)) == 3
+        assert relevant_pairs(store, "spicy curry please", 1) == {"do you like spicy curry?": "Yes, the spicier the better!"}
+
+    def test_single_edits_refresh_cached_term_counts(self, tmp_path):
+        """A term searched while it matched nothing is found once a pair with it is added, and gone once removed."""
+        store = QAStore(str(tmp_path / 'qa.db'))
+        store.update_many(PAIRS.items())
+        assert store.search("pineapple", k=1) == []
+        store["do you like pineapple"] = "yes!"
+        assert store.search("pineapple", k=1) == [("do you like pineapple", "yes!")]
+        del store["do you like pineapple"]
+        store.add("pineapple on pizza?", "Never.")
+        assert store.search("pineapple", k=2) == [("pineapple on pizza?", "Never.")]
+
+    def test_prompt_examples_follow_the_message(self, tmp_path):
+        """Each message gets the pairs sharing its rarest terms, not the dataset's first pairs."""
+        store = QAStore(str(tmp_path / 'qa.db'))
+        store.update_many(PAIRS.items())
+        assert list(relevant_pairs(store, "what anime should I watch", 2))[0] == "Can you recommend an anime?"
+        assert list(relevant_pairs(store, "cats and dogs", 1)) == ["Do you like cats or dogs better?"]
+        assert list(relevant_pairs(store, "any music you listen to?", 1)) == ["What music do you listen to?"]
+        assert relevant_pairs(store, "zzz qqq", 2) == {} and relevant_pairs(None, "hi", 2) == {}
+
+    def test_dashboard_rename_replaces_the_old_question(self, tmp_path, monkeypatch):
+        """An update that changes the question removes the old row before storing the new one."""
+        from bot_core import api_integration
+        store = QAStore(str(tmp_path / 'qa.db'))
+        store.update_many(PAIRS.items())
+        monkeypatch.setattr(api_integration, 'QA_STORE', store)
+        integration = object.__new__(api_integration.BotAPIIntegration)
+        integration.redis_client = None
+        asyncio.run(integration._handle_qa_pair_updated({
+            'qa_pair': {'id': 7, 'question': "What's your favorite anime?", 'answer': "Spirited Away!"},
+            'previous_question': "Can you recommend an anime?",
+        }))
+        assert "Can you recommend an anime?" not in store and len(store) == len(PAIRS)
+        assert store.search("anime", k=5) == [("What's your favorite anime?", "Spirited Away!")]
+
+    def test_older_stores_gain_the_curated_flag(self, tmp_path):
+        """A store created before pairs were marked curated opens, and hand edits mark them."""
+        import sqlite3
+        conn = sqlite3.connect(str(tmp_path / 'qa.db'))
+        conn.execute('CREATE TABLE pairs (id INTEGER PRIMARY KEY, question TEXT NOT NULL UNIQUE, answer TEXT NOT NULL)')
+        conn.execute("INSERT INTO pairs (question, answer) VALUES ('hi', 'hello')")
+        conn.commit()
+        conn.close()
+        store = QAStore(str(tmp_path / 'qa.db'))
+        assert store['hi'] == 'hello' and store.curated_ids([1]) == set()
+        store.add('hi', 'hey there', curated=True)
+        store.add('hi', 'hey')
+        assert store.curated_ids([1]) == {1} and store['hi'] == 'hey'
+
+    def test_retrieval_runs_off_the_event_loop(self, tmp_path):
+        """Prompt retrieval searches the store in an executor thread; plain dicts give their first pairs."""
+        store = QAStore(str(tmp_path / 'qa.db'))
+        store.update_many(PAIRS.items())
+        threads = []
+        search = store.search
+        store.search = lambda text, k: threads.append(threading.get_ident()) or search(text, k)
+
+        async def run():
+            return await retrieve_pairs(store, "recommend an anime", 1), threading.get_ident()
+
+        pairs, loop_thread = asyncio.run(run())
+        assert pairs == {"Can you recommend an anime?": "Try Spirited Away, it's a classic."}
+        assert threads and threads[0] != loop_thread
+        assert asyncio.run(retrieve_pairs(dict(PAIRS), "anything", 2)) == dict(list(PAIRS.items())[:2])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
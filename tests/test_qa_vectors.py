@@ -0,0 +1,156 @@
+"""
+Test suite for semantic Q&A retrieval over memory-mapped embeddings.
+"""
+import asyncio
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from aiohttp import web
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import qa_vectors
+from bot_core.backends import Backend, BackendPool
+from bot_core.http_client import HTTP_CLIENTS
+from bot_core.qa_store import terms
+from bot_core.qa_vectors import QAVectorIndex, VectorStore
+
+DIM = 512
+SYNONYMS = {'kitty': 'cat', 'feline': 'cat', 'puppy': 'dog', 'tune': 'song'}
+
+
+def stub_embedding(text):
+    """Bag of hashed words, with a few synonyms mapped together so 'semantic' matches exist."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    for token in terms(text):
+        token = SYNONYMS.get(token, token)
+        vector[int(hashlib.md5(token.encode()).hexdigest(), 16) % DIM] += 1
+    return vector.tolist()
+
+
+class StubEmbedder:
+    """Local stand-in for Ollama's /api/embed."""
+
+    def __init__(self):
+        self.calls = []
+        self.runner = None
+
+    async def embed(self, request):
+        body = await request.json()
+        self.calls.append(len(body['input']))
+        return web.json_response({'model': body['model'], 'embeddings': [stub_embedding(t) for t in body['input']]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/api/embed', self.embed)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def with_stub(monkeypatch, scenario):
+    """Run ``scenario(stub)`` against a stub embedder routed through the backend pool."""
+    async def run():
+        stub = StubEmbedder()
+        url = await stub.start()
+        monkeypatch.setattr(qa_vectors, 'OLLAMA_POOL', BackendPool([Backend(url)]))
+        try:
+            return await scenario(stub)
+        finally:
+            await HTTP_CLIENTS.close()
+            await stub.runner.cleanup()
+    return asyncio.run(run())
+
+
+PAIRS = {
+    "Do you like cats?": "I adore cats!",
+    "What is your favorite song?": "Anything by Aimer.",
+    "Do you have a dog?": "No, but I want one.",
+    "Where do you live?": "In your heart~",
+    "What should I cook tonight?": "Curry, always curry.",
+}
+
+
+class TestQAVectors:
+    """Test embedding sync, persistence, exact and partitioned search, and fusion."""
+
+    def test_sync_embeds_in_batches_and_reopens_without_recomputing(self, monkeypatch, tmp_path):
+        """Questions are embedded in batches once; a new process maps the files and only embeds new pairs."""
+        async def scenario(stub):
+            index = QAVectorIndex(VectorStore(str(tmp_path), model='stub', dtype='float16'))
+            assert await index.sync(PAIRS, batch_size=2) == 5
+            assert stub.calls == [2, 2, 1]
+
+            reopened = QAVectorIndex(VectorStore(str(tmp_path), model='stub', dtype='float16'))
+            pairs = dict(PAIRS, **{"Any travel plans?": "Kyoto in spring!"})
+            assert await reopened.sync(pairs, batch_size=2) == 1
+            assert stub.calls == [2, 2, 1, 1]
+            assert isinstance(reopened.store._state['vectors'], np.memmap)
+            return await reopened.search("my feline friend", 2)
+
+        assert with_stub(monkeypatch, scenario)[0] == ("Do you like cats?", PAIRS["Do you like cats?"])
+
+    def test_partial_append_is_truncated_and_model_change_rebuilds(self, tmp_path):
+        """Bytes beyond meta.json's row count are dropped; another model's store is discarded."""
+        store = VectorStore(str(tmp_path), model='stub', dtype='float32')
+        vectors = np.eye(3, DIM, dtype=np.float32)
+        store.append(['a?', 'b?'], vectors[:2])
+        with open(tmp_path / 'vectors.bin', 'ab') as f:
+            f.write(b'\x00' * 100)  # Crash after writing half a row
+        store = VectorStore(str(tmp_path), model='stub', dtype='float32')
+        assert store.open() == 2
+        store.append(['c?'], vectors[2:])
+        assert store.questions() == ['a?', 'b?', 'c?']
+        assert [q for q, _ in store.search(vectors[2], 1)] == ['c?']
+        assert VectorStore(str(tmp_path), model='other', dtype='float32').open() == 0
+        assert not os.path.exists(tmp_path / 'meta.json')
+
+    def test_ivf_search_matches_exact_search(self, monkeypatch, tmp_path):
+        """The partitioned index finds the same neighbours as a full scan on clustered data."""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(10, DIM)).astype(np.float32)
+        vectors = np.repeat(centers, 200, axis=0) + rng.normal(scale=0.05, size=(2000, DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store = VectorStore(str(tmp_path), model='stub', dtype='float32')
+        store.append([f"q{n}" for n in range(2000)], vectors)
+        queries = vectors[rng.choice(2000, 20, replace=False)]
+        exact = [store.search(q, 5) for q in queries]
+
+        monkeypatch.setattr(qa_vectors, 'QA_IVF_PROBES', 3)
+        assert store.build_ivf(nlist=10) == 10
+        store.append(['late'], vectors[:1])  # Unpartitioned rows are still searched
+        partitioned = [store.search(q, 5) for q in queries]
+        assert [[q for q, _ in hits] for hits in partitioned] == [[q for q, _ in hits] for hits in exact]
+        assert 'late' in [q for q, _ in store.search(vectors[0], 2)]
+
+    def test_relevant_examples_fuses_semantic_and_lexical(self, monkeypatch, tmp_path):
+        """Semantic neighbours join the BM25 examples; failures keep the BM25 ones."""
+        monkeypatch.setattr(qa_vectors, 'QA_VECTORS_ENABLED', True)
+        lexical = {"Where do you live?": PAIRS["Where do you live?"]}
+
+        async def scenario(stub):
+            index = QAVectorIndex(VectorStore(str(tmp_path), model='stub'))
+            monkeypatch.setattr(qa_vectors, 'QA_VECTORS', index)
+            await index.sync(PAIRS)
+            fused = await qa_vectors.relevant_examples(PAIRS, "do you live with a puppy", lexical, 2)
+            other = await qa_vectors.relevant_examples(dict(PAIRS), "do you live with a puppy", lexical, 2)
+            monkeypatch.setattr(qa_vectors, 'OLLAMA_POOL', BackendPool([Backend('http://127.0.0.1:9')]))
+            failed = await qa_vectors.relevant_examples(PAIRS, "do you live with a puppy", lexical, 2)
+            return fused, other, failed, index.get_stats()
+
+        fused, other, failed, stats = with_stub(monkeypatch, scenario)
+        assert set(fused) == {"Where do you live?", "Do you have a dog?"}
+        assert other is lexical and failed is lexical
+        assert stats['queries'] == 2 and stats['query_failures'] == 1 and stats['rows'] == 5
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,100 @@
+"""
+Test suite for the response cache and its use in persona.generate_response.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import llm, persona, response_cache
+from bot_core.response_cache import ResponseCache, make_key
+
+
+class TestResponseCache:
+    """Test keys, eviction and statistics."""
+
+    def test_context_free_messages_ignore_context(self):
+        """Greetings share a key across contexts; other messages need the same context."""
+        a = make_key('normal', 'prompt', 'Hi Yumi!! 💕', ['history a'])
+        b = make_key('normal', 'prompt', 'hi   yumi', ['history b'])
+        assert a == b
+        assert make_key('tsundere', 'prompt', 'hi yumi', []) != a
+        assert make_key('normal', 'other prompt', 'hi yumi', []) != a
+        c = make_key('normal', 'prompt', 'why did you say that', ['history a'])
+        assert c != make_key('normal', 'prompt', 'why did you say that', ['history b'])
+        assert c == make_key('normal', 'prompt', 'Why did you say that?', ['history a'])
+        assert make_key('normal', 'prompt', '!!!', []) is None
+
+    def test_hits_after_variants_and_per_persona_stats(self):
+        """A key serves hits only once it has collected its variants."""
+        cache = ResponseCache(variants=2)
+        key = make_key('normal', 'prompt', 'good morning', [])
+        cache.put(key, 'Morning! ☀️')
+        assert cache.get(key) is None
+        cache.put(key, 'Morning! ☀️')  # Duplicates do not count as a variant
+        assert cache.get(key) is None
+        cache.put(key, 'Good morning, sunshine!')
+        assert cache.get(key) in ('Morning! ☀️', 'Good morning, sunshine!')
+        stats = cache.get_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 2
+        assert stats['hit_rate'] == pytest.approx(1 / 3)
+        assert stats['by_persona'] == {'normal': {'hits': 1, 'misses': 2}}
+
+    def test_ttl_and_memory_cap(self, monkeypatch):
+        """Entries expire after the TTL and the oldest are evicted above the byte cap."""
+        now = [1000.0]
+        monkeypatch.setattr(response_cache.time, 'monotonic', lambda: now[0])
+        cache = ResponseCache(max_bytes=1000, ttl=60, variants=1)
+        keys = [make_key('normal', 'prompt', f'hello number {i}', []) for i in range(4)]
+        for key in keys:
+            cache.put(key, 'x' * 200)
+        assert cache.get_stats()['bytes'] <= 1000
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[3]) == 'x' * 200
+        now[0] += 61
+        assert cache.get(keys[3]) is None
+        assert cache.stats['evictions'] >= 1 and cache.stats['expired'] == 1
+
+    def test_clear_one_persona(self):
+        """clear() can drop a single persona's partition."""
+        cache = ResponseCache(variants=1)
+        cache.put(make_key('normal', 'p', 'hey', []), 'Hey!')
+        cache.put(make_key('shy', 'p', 'hey', []), 'H-hi...')
+        cache.clear('shy')
+        assert cache.get(make_key('normal', 'p', 'hey', [])) == 'Hey!'
+        assert cache.get(make_key('shy', 'p', 'hey', [])) is None
+
+
+class TestPersonaCaching:
+    """Test the cache in front of the LLM call."""
+
+    def test_repeated_greeting_skips_generation(self, monkeypatch):
+        """Repeats are served from the cache; fallbacks and personal replies are never stored."""
+        monkeypatch.setattr(persona, 'RESPONSE_CACHE', ResponseCache(variants=1))
+        monkeypatch.setattr(response_cache, 'RESPONSE_CACHE_ENABLED', True)
+        replies = [llm.get_fallback_response('timeout'), 'Hi Alice! 💕', 'Hello there! 💕', 'unused']
+        calls = []
+
+        async def fake_generate(**kwargs):
+            calls.append(kwargs['user_message'])
+            return replies[len(calls) - 1]
+
+        monkeypatch.setattr(llm, 'generate_llm_response', fake_generate)
+
+        async def run():
+            facts = {'name': 'Alice'}
+            return [await persona.generate_response('hi yumi', user_facts=facts) for _ in range(4)]
+
+        results = asyncio.run(run())
+        assert results == [replies[0], 'Hi Alice! 💕', 'Hello there! 💕', 'Hello there! 💕']
+        assert len(calls) == 3
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,112 @@
+"""
+Test suite for the fair, priority-aware LLM scheduler.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core.scheduler import (
+    LLMScheduler,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SUMMARY,
+    _parse_weights,
+    tenant_for,
+)
+
+
+async def run_jobs(scheduler, jobs):
+    """Submit (name, priority, tenant) jobs while the only slot is busy; return run order."""
+    order = []
+
+    async def job(name, priority, tenant):
+        async with scheduler.slot(priority, tenant):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    await scheduler.acquire()  # Hold the slot so everything queues
+    tasks = [asyncio.ensure_future(job(*spec)) for spec in jobs]
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+class TestLLMScheduler:
+    """Test concurrency limits, priorities and fairness."""
+
+    def test_concurrency_is_bounded(self):
+        """No more than ``slots`` requests run at once."""
+        scheduler = LLMScheduler(slots=2)
+        peak = [0]
+
+        async def job():
+            async with scheduler.slot():
+                peak[0] = max(peak[0], scheduler.running)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*(job() for _ in range(10)))
+
+        asyncio.run(run())
+        assert peak[0] == 2
+        stats = scheduler.get_stats()
+        assert stats['admitted'] == 10 and stats['running'] == 0
+        assert stats['max_queue_depth'] == 8
+        assert stats['wait']['interactive']['max_ms'] > 0
+
+    def test_interactive_before_background(self):
+        """Queued replies run before queued summaries, whatever the arrival order."""
+        scheduler = LLMScheduler(slots=1)
+        jobs = [('summary', PRIORITY_SUMMARY, 'guild:1'), ('reply', PRIORITY_INTERACTIVE, 'guild:2')]
+        assert asyncio.run(run_jobs(scheduler, jobs)) == ['reply', 'summary']
+
+    def test_busy_tenant_takes_turns(self):
+        """A burst from one guild interleaves with other tenants instead of running first."""
+        scheduler = LLMScheduler(slots=1)
+        jobs = [(f'busy{i}', PRIORITY_INTERACTIVE, 'guild:1') for i in range(4)]
+        jobs += [('quiet', PRIORITY_INTERACTIVE, 'guild:2'), ('dm', PRIORITY_INTERACTIVE, 'dm:3')]
+        order = asyncio.run(run_jobs(scheduler, jobs))
+        assert order.index('quiet') <= 1 and order.index('dm') <= 2
+
+    def test_weights(self):
+        """A tenant with weight 2 gets twice the turns of a default tenant."""
+        scheduler = LLMScheduler(slots=1, weights={'guild:vip': 2.0})
+        jobs = [(f'vip{i}', PRIORITY_INTERACTIVE, 'guild:vip') for i in range(4)]
+        jobs += [(f'other{i}', PRIORITY_INTERACTIVE, 'guild:other') for i in range(2)]
+        order = asyncio.run(run_jobs(scheduler, jobs))
+        assert order[:3].count('other0') == 1 and order[:3].count('vip0') == 1
+
+    def test_cancelled_waiter_frees_its_place(self):
+        """Cancelling a queued request neither leaks a slot nor blocks later requests."""
+        scheduler = LLMScheduler(slots=1)
+
+        async def run():
+            await scheduler.acquire()
+            waiter = asyncio.ensure_future(scheduler.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            scheduler.release()
+            async with scheduler.slot():
+                pass
+            return scheduler.running
+
+        assert asyncio.run(run()) == 0
+        assert scheduler.stats['cancelled'] == 1
+
+    def test_tenants_and_weights_parsing(self):
+        """Tenants are per guild, or per user in DMs; weights come from the env format."""
+        assert tenant_for(123, 456) == 'guild:123'
+        assert tenant_for(None, 456) == 'dm:456'
+        assert _parse_weights('guild:1=2, dm:5=0.5,bad,guild:2=x') == {'guild:1': 2.0, 'dm:5': 0.5}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
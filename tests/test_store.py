@@ -0,0 +1,59 @@
+"""
+Test suite for the write-behind JSON store.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core.store import JsonStore
+
+
+class TestJsonStore:
+    """Test coalescing and flushing of JSON state files."""
+
+    def test_marks_coalesce_into_one_write(self, tmp_path):
+        """Many updates to one file are written once, with the latest contents."""
+        store = JsonStore()
+        path = str(tmp_path / 'stats.json')
+        counts = {}
+        for i in range(100):
+            counts['messages'] = i
+            store.mark_dirty(path, counts, indent=2)
+        assert not os.path.exists(path)
+        assert store.pending() == 1
+        assert store.flush() == 1
+        assert json.loads(open(path, encoding='utf-8').read()) == {'messages': 99}
+        assert store.flush() == 0
+        assert store.stats['files_written'] == 1
+
+    def test_callable_data_and_missing_directory(self, tmp_path):
+        """Callables are rendered at flush time and parent directories are created."""
+        store = JsonStore()
+        path = str(tmp_path / 'nested' / 'locks.json')
+        locked = {1: {10}}
+        store.mark_dirty(path, lambda: {str(g): sorted(c) for g, c in locked.items()})
+        locked[1].add(11)
+        asyncio.run(store.flush_async())
+        assert json.loads(open(path, encoding='utf-8').read()) == {'1': [10, 11]}
+        assert not os.path.exists(path + '.tmp')
+
+    def test_unserializable_data_is_reported(self, tmp_path, capsys):
+        """A bad payload is skipped without blocking other files."""
+        store = JsonStore()
+        store.mark_dirty(str(tmp_path / 'bad.json'), {'x': object()})
+        store.mark_dirty(str(tmp_path / 'good.json'), {'ok': True})
+        assert store.flush() == 1
+        assert store.stats['write_errors'] == 1
+        assert '[Store]' in capsys.readouterr().out
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
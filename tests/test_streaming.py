@@ -0,0 +1,157 @@
+"""
+Test suite for streamed replies and progressive Discord edits.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import llm, persona, streaming
+from bot_core.backends import Backend, BackendPool
+from bot_core.http_client import HTTP_CLIENTS
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content):
+        self.content = content
+        self.channel.events.append(('edit', content))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.events = []
+
+    async def send(self, content):
+        self.events.append(('send', content))
+        return FakeMessage(self, content)
+
+
+async def snapshots(*texts):
+    for text in texts:
+        yield text
+
+
+class TestProgressiveReply:
+    """Test posting on the first sentence and editing in place."""
+
+    def test_first_sentence_end(self):
+        """Sentence boundaries need punctuation plus whitespace, or a newline."""
+        assert streaming.first_sentence_end('Hi there') == -1
+        assert streaming.first_sentence_end('Hi there! How') == 10
+        assert streaming.first_sentence_end('3.5 is') == -1
+        assert streaming.first_sentence_end('line one\nline') == 9
+
+    def test_posts_on_first_sentence_then_edits(self):
+        """Nothing is sent before a sentence completes; the final text always lands."""
+        channel = FakeChannel()
+        final = asyncio.run(streaming.stream_to_channel(
+            channel, snapshots('Hey', 'Hey there! I', 'Hey there! I missed you.'), edit_interval=0))
+        assert final == 'Hey there! I missed you.'
+        assert channel.events == [('send', 'Hey there! I'), ('edit', 'Hey there! I missed you.')]
+
+    def test_short_reply_without_boundary_is_sent_once(self):
+        """A reply that never completes a sentence is sent when generation ends."""
+        channel = FakeChannel()
+        assert asyncio.run(streaming.stream_to_channel(channel, snapshots('h', 'hi'))) == 'hi'
+        assert channel.events == [('send', 'hi')]
+
+    def test_edits_are_rate_limited(self):
+        """Edits closer together than the interval are folded into the final edit."""
+        channel = FakeChannel()
+        texts = ['One. ' * i for i in range(1, 10)]
+        asyncio.run(streaming.stream_to_channel(channel, snapshots(*texts), edit_interval=60))
+        assert [kind for kind, _ in channel.events] == ['send', 'edit']
+        assert channel.events[-1][1] == texts[-1][:2000]
+
+
+class TestStreamResponse:
+    """Test streaming generation end to end against a stub Ollama server."""
+
+    def test_ndjson_stream_and_fabrication_cutoff(self, monkeypatch):
+        """Chunks are read incrementally and generation stops at fabricated dialogue."""
+        chunks = ['Hello', ' there!', ' How are you?', '\nUser: I am', ' fine', ' thanks']
+
+        async def generate(request):
+            body = await request.json()
+            assert body['stream'] is True
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for chunk in chunks:
+                await response.write((json.dumps({'response': chunk, 'done': False}) + '\n').encode())
+            await response.write(b'{"response": "", "done": true}\n')
+            return response
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_post('/api/generate', generate)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(llm, 'OLLAMA_POOL', BackendPool([Backend(f'http://127.0.0.1:{port}')]))
+            try:
+                seen = [text async for text in persona.stream_response('hi')]
+            finally:
+                await HTTP_CLIENTS.close()
+                await runner.cleanup()
+            return seen
+
+        seen = asyncio.run(scenario())
+        assert seen[0] == 'Hello'
+        assert seen[-1] == 'Hello there! How are you?'
+        assert llm._interactive_inflight == 0
+
+    def test_slow_reader_frees_the_slot_and_text_is_cleaned(self, monkeypatch):
+        """The scheduler slot is released when Ollama finishes, not when the caller has read every chunk."""
+        chunks = ['*waves* Hi', ' <b>there</b>!', '  Missed you.']
+
+        async def generate(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for chunk in chunks:
+                await response.write((json.dumps({'response': chunk, 'done': False}) + '\n').encode())
+            await response.write(b'{"response": "", "done": true}\n')
+            return response
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_post('/api/generate', generate)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(llm, 'OLLAMA_POOL', BackendPool([Backend(f'http://127.0.0.1:{port}')]))
+            try:
+                stream = llm.stream_llm_response('hi', 'system')
+                first = await stream.__anext__()
+                await asyncio.sleep(0.2)  # A slow consumer, e.g. waiting on a Discord edit
+                running = llm.LLM_SCHEDULER.running
+                rest = [text async for text in stream]
+                seen = [text async for text in persona.stream_response('hi')]
+            finally:
+                await HTTP_CLIENTS.close()
+                await runner.cleanup()
+            return first, running, rest, seen
+
+        first, running, rest, seen = asyncio.run(scenario())
+        assert first == '*waves* Hi' and ''.join(rest) == ''.join(chunks[1:])
+        assert running == 0
+        assert seen[-1] == 'Hi there! Missed you.'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
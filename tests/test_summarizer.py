@@ -0,0 +1,65 @@
+"""
+Test suite for rolling conversation summaries.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add project root to path for testing
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from bot_core import history, llm, summarizer
+
+
+def fill_log(log, key, count):
+    for i in range(count):
+        log.append(key, {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'message {i}'})
+
+
+class TestSummarizer:
+    """Test folding old turns into the rolling summary."""
+
+    def test_folds_messages_beyond_horizon(self, tmp_path, monkeypatch):
+        """Turns older than the horizon are summarized and the context reloads without them."""
+        prompts = []
+
+        async def fake_completion(prompt, **kwargs):
+            prompts.append(prompt)
+            return 'They talked about numbers.'
+
+        monkeypatch.setattr(llm, 'generate_completion', fake_completion)
+        monkeypatch.setattr(summarizer, 'SUMMARY_HORIZON', 10)
+        monkeypatch.setattr(summarizer, 'SUMMARY_MIN_BATCH', 5)
+        log = history.HistoryLog(str(tmp_path))
+        fill_log(log, 'ctx', 30)
+        manager = history.HistoryManager(log)
+        assert len(manager['ctx']) == 30
+
+        assert asyncio.run(summarizer.summarize_hot_contexts(manager)) == 1
+        assert 'message 19' in prompts[0] and 'message 20' not in prompts[0]
+        assert log.read_summary('ctx')['covered'] == 20
+        assert manager['ctx'].summary == 'They talked about numbers.'
+        assert [m['content'] for m in manager['ctx']][0] == 'message 20'
+
+    def test_skips_small_batches_and_failures(self, tmp_path, monkeypatch):
+        """Nothing is written when too few turns are foldable or the LLM fails."""
+        async def failed_completion(prompt, **kwargs):
+            return None
+
+        monkeypatch.setattr(llm, 'generate_completion', failed_completion)
+        monkeypatch.setattr(summarizer, 'SUMMARY_HORIZON', 10)
+        monkeypatch.setattr(summarizer, 'SUMMARY_MIN_BATCH', 5)
+        log = history.HistoryLog(str(tmp_path))
+        fill_log(log, 'short', 12)
+        fill_log(log, 'long', 30)
+        assert not asyncio.run(summarizer.summarize_context('short', log))
+        assert not asyncio.run(summarizer.summarize_context('long', log))
+        assert log.read_summary('long') == {}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])